@@ -8,6 +8,12 @@ setup(
     description='A Serial MIDI bridge application with a GUI',
     packages=find_packages(where='src'),
     package_dir={'': 'src'},
+    py_modules=[
+        'gui', 'cli', 'serialmidi', 'midiprotocol', 'midiparser',
+        'ringbuffer', 'activity', 'hottrace', 'bridgemanager',
+        'aiobridge', 'midifilter', 'metrics', 'portmanager', 'capture',
+        'pacing', 'bridgeprocess', 'framing', 'bridgeobserver',
+    ],
     install_requires=[
         'PyQt5',  # or 'PySide2' if you prefer
         'rtmidi',
@@ -16,6 +22,7 @@ setup(
     entry_points={
         'console_scripts': [
             'serialmidi-gui-app=gui:main',  # Assuming you will define a main function in gui.py
+            'serialmidi-bridge=cli:main',   # Headless bridge, does not import PyQt
         ],
     },
 )
\ No newline at end of file
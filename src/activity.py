@@ -0,0 +1,97 @@
+import time
+
+
+class ActivityCounters:
+    """Per-port message counters bumped by the bridge threads.
+
+    Each counter is only ever incremented by the one thread that owns that
+    port, so a plain integer add is safe and costs next to nothing. Readers
+    such as the GUI sample them with snapshot() at their own pace.
+    """
+
+    PORTS = ("serial_in", "serial_out", "midi_in", "midi_out")
+
+    def __init__(self):
+        self.serial_in = 0   # Messages parsed from the serial port (serial_watcher)
+        self.serial_out = 0  # Messages written to the serial port (serial_writer)
+        self.midi_in = 0     # Messages received from MIDI In (rtmidi callback)
+        self.midi_out = 0    # Messages sent to MIDI Out (midi_watcher)
+
+    def snapshot(self):
+        return (self.serial_in, self.serial_out, self.midi_in, self.midi_out)
+
+
+class ActivitySampler:
+    """Turn successive counter snapshots into activity flags and message rates."""
+
+    def __init__(self, counters, rate_interval=1.0):
+        self.counters = counters
+        self.rate_interval = rate_interval
+        self._last = counters.snapshot()
+        self._rate_base = self._last
+        self._rate_time = time.monotonic()
+        self.rates = dict.fromkeys(ActivityCounters.PORTS, 0.0)
+
+    def sample(self):
+        """Return {port: True/False} telling which ports saw traffic since the last call."""
+        current = self.counters.snapshot()
+        active = {port: now != last for port, now, last in zip(ActivityCounters.PORTS, current, self._last)}
+        self._last = current
+
+        now = time.monotonic()
+        elapsed = now - self._rate_time
+        if elapsed >= self.rate_interval:
+            for port, count, base in zip(ActivityCounters.PORTS, current, self._rate_base):
+                self.rates[port] = (count - base) / elapsed
+            self._rate_base = current
+            self._rate_time = now
+        return active
+
+
+class ClockJitterMeter:
+    """Track the spacing of MIDI clock ticks (0xF8) as they leave the bridge.
+
+    tick() is called by the single thread that sends the clock, so the
+    running statistics need no locking. Gaps longer than max_gap (transport
+    stopped) restart the measurement instead of counting as jitter.
+    """
+
+    def __init__(self, max_gap=1.0):
+        self.max_gap = max_gap
+        self.ticks = 0
+        self._last = None
+        self._intervals = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min_interval = None
+        self.max_interval = None
+
+    def tick(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        self.ticks += 1
+        last = self._last
+        self._last = now
+        if last is None or now - last > self.max_gap:
+            return
+        interval = now - last
+        # Welford's running mean and variance
+        self._intervals += 1
+        delta = interval - self._mean
+        self._mean += delta / self._intervals
+        self._m2 += delta * (interval - self._mean)
+        if self.min_interval is None or interval < self.min_interval:
+            self.min_interval = interval
+        if self.max_interval is None or interval > self.max_interval:
+            self.max_interval = interval
+
+    def stats(self):
+        """Return tick count, mean interval and jitter (standard deviation), in microseconds."""
+        jitter = (self._m2 / self._intervals) ** 0.5 if self._intervals > 1 else 0.0
+        return {
+            "ticks": self.ticks,
+            "mean_interval_us": self._mean * 1e6,
+            "jitter_us": jitter * 1e6,
+            "min_interval_us": self.min_interval * 1e6 if self.min_interval is not None else None,
+            "max_interval_us": self.max_interval * 1e6 if self.max_interval is not None else None,
+        }
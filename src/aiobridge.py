@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+
+try:
+    import rtmidi
+except ImportError:  # Reported by start()
+    rtmidi = None
+import serial
+
+from activity import ActivityCounters
+from midiparser import MidiStreamParser, MidiStreamEncoder
+from serialmidi import BridgeObserver, find_port
+
+
+class AsyncSerialMIDI:
+    """asyncio implementation of the Serial <-> MIDI bridge.
+
+    The serial file descriptor is registered with the event loop and the
+    rtmidi callback hands messages over with call_soon_threadsafe, so there
+    is no polling and start()/stop() return as soon as the ports are open or
+    closed. serial_messages() and midi_messages() are meant to be consumed
+    by one task each; run() wires them together as a plain bridge.
+    """
+
+    POLL_INTERVAL = 0.002  # Only used when the serial port has no selectable fd
+    READ_SIZE = 4096
+
+    def __init__(self, serial_port_name, serial_baud, midi_in_name=None, midi_out_name=None,
+                 observer=None, running_status=False):
+        self.serial_port_name = serial_port_name
+        self.serial_baud = serial_baud
+        self.given_port_name_in = midi_in_name
+        self.given_port_name_out = midi_out_name
+        self.observer = observer if observer is not None else BridgeObserver()
+        self.activity = ActivityCounters()
+        self.parser = MidiStreamParser()
+        self.encoder = MidiStreamEncoder(running_status=running_status)
+        self.ser = None
+        self.midiin = None
+        self.midiout = None
+        self._loop = None
+        self._fd = None
+        self._poll_task = None
+        self._serial_queue = None   # Messages parsed from the serial port
+        self._midi_queue = None     # Messages received from MIDI In
+        self._pending = bytearray()  # Serial bytes waiting for the fd to become writable
+        self._drained = None
+        self.running = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        """Open the serial and MIDI ports and hook them into the running loop."""
+        if rtmidi is None:
+            logging.error("python-rtmidi is not installed.")
+            self.observer.bridge_error(self, "python-rtmidi is not installed.")
+            raise RuntimeError("python-rtmidi is not installed")
+        self._loop = asyncio.get_running_loop()
+        self._serial_queue = asyncio.Queue()
+        self._midi_queue = asyncio.Queue()
+        try:
+            self.ser = serial.Serial(self.serial_port_name, self.serial_baud, timeout=0)
+        except serial.SerialException:
+            logging.error("Serial port opening error.")
+            self.observer.bridge_error(self, "Serial port opening error.")
+            raise
+        self.running = True
+
+        try:
+            self._fd = self.ser.fileno()
+            self._loop.add_reader(self._fd, self._on_serial_readable)
+        except (AttributeError, OSError, NotImplementedError):
+            # No selectable handle (e.g. Windows): fall back to a short polling task
+            self._fd = None
+            self._poll_task = self._loop.create_task(self._poll_serial())
+
+        try:
+            self._open_midi()
+        except Exception as e:
+            if not isinstance(e, RuntimeError):  # No matching port was already reported
+                logging.error(f"MIDI port opening error: {e}")
+                self.observer.bridge_error(self, "MIDI port opening error.")
+            self.running = False
+            self._close_ports()
+            raise
+
+        self.observer.bridge_started(self)
+
+    def _open_midi(self):
+        opened = False
+        if self.given_port_name_out is not None:
+            self.midiout = rtmidi.MidiOut()
+            port_index = find_port(self.midiout.get_ports(), self.given_port_name_out)
+            if port_index != -1:
+                self.midiout.open_port(port_index)
+                opened = True
+            else:
+                logging.error(f"No MIDI OUT port matching '{self.given_port_name_out}'.")
+                self.observer.bridge_error(self, f"No MIDI OUT port matching '{self.given_port_name_out}'.")
+        if self.given_port_name_in is not None:
+            self.midiin = rtmidi.MidiIn()
+            port_index = find_port(self.midiin.get_ports(), self.given_port_name_in)
+            if port_index != -1:
+                self.midiin.open_port(port_index)
+                self.midiin.ignore_types(sysex=False, timing=False, active_sense=False)
+                self.midiin.set_callback(self._midi_input_handler)
+                opened = True
+            else:
+                logging.error(f"No MIDI IN port matching '{self.given_port_name_in}'.")
+                self.observer.bridge_error(self, f"No MIDI IN port matching '{self.given_port_name_in}'.")
+        if not opened:
+            raise RuntimeError("No matching MIDI port found")
+
+    async def stop(self):
+        """Close the ports and end the message iterators."""
+        if not self.running:
+            return
+        self.running = False
+        self._close_ports()
+        if self._drained is not None and not self._drained.done():
+            self._drained.set_result(None)
+        # None tells the iterators to finish
+        self._serial_queue.put_nowait(None)
+        self._midi_queue.put_nowait(None)
+        self.observer.bridge_stopped(self)
+
+    def _close_ports(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop.remove_writer(self._fd)
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self.midiin is not None:
+            self.midiin.cancel_callback()
+            if self.midiin.is_port_open():
+                self.midiin.close_port()
+        if self.midiout is not None and self.midiout.is_port_open():
+            self.midiout.close_port()
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
+
+    def _midi_input_handler(self, event, data=None):
+        # Runs on the rtmidi thread
+        message, deltatime = event
+        self._loop.call_soon_threadsafe(self._midi_queue.put_nowait, message)
+
+    def _on_serial_readable(self):
+        try:
+            data = os.read(self._fd, self.READ_SIZE)
+            if not data:
+                raise OSError("device disconnected")
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        self._feed(data)
+
+    async def _poll_serial(self):
+        while self.running:
+            try:
+                waiting = self.ser.in_waiting
+                if waiting:
+                    self._feed(self.ser.read(waiting))
+            except serial.SerialException as e:
+                self._fail(e)
+                return
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def _feed(self, data):
+        for message in self.parser.feed(data):
+            self.activity.serial_in += 1
+            self._serial_queue.put_nowait(message)
+
+    def _fail(self, error):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop.remove_writer(self._fd)
+        logging.error(f"Serial error: {error}")
+        self.observer.bridge_error(self, f"Serial error: {error}")
+        self._loop.create_task(self.stop())
+
+    async def serial_messages(self):
+        """Yield each MIDI message received on the serial port."""
+        while True:
+            message = await self._serial_queue.get()
+            if message is None:
+                return
+            yield message
+
+    async def midi_messages(self):
+        """Yield each message received on the MIDI input port."""
+        while True:
+            message = await self._midi_queue.get()
+            if message is None:
+                return
+            self.activity.midi_in += 1
+            yield message
+
+    async def send_serial(self, message):
+        """Write a message to the serial port; returns once the OS has accepted it."""
+        if not self.running:
+            raise ConnectionError("Bridge is not running")
+        self._pending += self.encoder.encode([message])
+        self.activity.serial_out += 1
+        if self._fd is None:
+            self.ser.write(self._pending)
+            self._pending.clear()
+            return
+        self._flush()
+        if self._pending:
+            if self._drained is None or self._drained.done():
+                self._drained = self._loop.create_future()
+                self._loop.add_writer(self._fd, self._on_serial_writable)
+            await self._drained
+
+    def _flush(self):
+        try:
+            written = os.write(self._fd, self._pending)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._fail(e)
+            return
+        del self._pending[:written]
+
+    def _on_serial_writable(self):
+        self._flush()
+        if not self._pending or not self.running:
+            self._loop.remove_writer(self._fd)
+            if not self._drained.done():
+                self._drained.set_result(None)
+
+    async def send_midi(self, message):
+        """Send a message to the MIDI output port."""
+        if self.midiout is None or not self.midiout.is_port_open():
+            return
+        self.midiout.send_message(message)
+        self.activity.midi_out += 1
+
+    async def run(self):
+        """Forward messages in both directions until stop() is called."""
+        async def serial_to_midi():
+            async for message in self.serial_messages():
+                await self.send_midi(message)
+
+        async def midi_to_serial():
+            async for message in self.midi_messages():
+                if self.running:
+                    await self.send_serial(message)
+
+        await asyncio.gather(serial_to_midi(), midi_to_serial())
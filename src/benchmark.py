@@ -0,0 +1,624 @@
+"""End-to-end latency and throughput benchmark for the Serial <-> MIDI bridge.
+
+The serial device is one end of a pseudo-terminal pair and the MIDI side is
+an in-process fake of rtmidi, so no hardware or MIDI driver is needed (Linux
+and macOS). Each workload is pushed through both directions of a running
+SerialMIDI:
+
+    python src/benchmark.py
+    python src/benchmark.py --workload notes --count 20000 --json results.json
+
+With python-rtmidi installed, --midi runs the MIDI side through real ports
+instead, to compare the bridge's own virtual ports against the extra hop of
+an OS loopback bus (two IAC buses, two ALSA "midi through" ports, loopMIDI):
+
+    python src/benchmark.py --midi virtual
+    python src/benchmark.py --midi loopback --loopback "IAC Driver Bus 1" "IAC Driver Bus 2"
+
+--framing runs the serial side in the framed protocol, the harness playing
+the device. A pty has no baud rate, so --pace makes both ends keep to the
+line rate of --baud, to compare raw MIDI with framed MIDI at a higher rate:
+
+    python src/benchmark.py --baud 115200 --pace 1
+    python src/benchmark.py --baud 2000000 --pace 1 --framing auto
+"""
+import argparse
+import json
+import os
+import platform
+import select
+import subprocess
+import sys
+import threading
+import time
+import tty
+
+from cli import max_rss_mb
+from framing import FrameEncoder, FrameDecoder, HELLO, ACK
+from midiparser import MidiStreamParser
+from pacing import LinePacer
+from serialmidi import SerialMIDI, default_virtual_port_name, find_port
+
+PORT_NAME = "Benchmark Port"
+
+
+class FakeMidiBackend:
+    """In-process stand-in for the rtmidi module (MidiIn/MidiOut classes).
+
+    Messages sent to MidiOut are timestamped on arrival; inject() calls the
+    MidiIn callback the way the rtmidi thread would.
+    """
+
+    def __init__(self):
+        self.midi_in = None
+        self.received = []  # (perf_counter, message) for every MidiOut.send_message
+        backend = self
+
+        class MidiIn:
+            def __init__(self):
+                self.callback = None
+                self.data = None
+                self._open = False
+                backend.midi_in = self
+
+            def get_ports(self):
+                return [PORT_NAME]
+
+            def open_port(self, index):
+                self._open = True
+
+            def open_virtual_port(self, name):
+                self._open = True
+
+            def is_port_open(self):
+                return self._open
+
+            def close_port(self):
+                self._open = False
+
+            def ignore_types(self, **kwargs):
+                pass
+
+            def set_callback(self, callback, data=None):
+                self.callback = callback
+                self.data = data
+
+            def cancel_callback(self):
+                self.callback = None
+
+        class MidiOut:
+            def __init__(self):
+                self._open = False
+
+            def get_ports(self):
+                return [PORT_NAME]
+
+            def open_port(self, index):
+                self._open = True
+
+            def open_virtual_port(self, name):
+                self._open = True
+
+            def is_port_open(self):
+                return self._open
+
+            def close_port(self):
+                self._open = False
+
+            def send_message(self, message):
+                # Same checks as python-rtmidi, so the bridge cannot get away with what it would reject
+                if not message:
+                    raise ValueError("'message' must not be empty.")
+                if len(message) > 3 and message[0] != 0xf0:
+                    raise ValueError("'message' longer than 3 bytes but does not start with 0xF0.")
+                backend.received.append((time.perf_counter(), message))
+
+        self.MidiIn = MidiIn
+        self.MidiOut = MidiOut
+
+    def inject(self, message, deltatime=0.0):
+        callback = self.midi_in.callback if self.midi_in is not None else None
+        if callback is not None:
+            callback((message, deltatime), self.midi_in.data)
+
+
+class RtMidiEndpoint:
+    """The harness end of real MIDI ports, with the same received/inject interface as FakeMidiBackend.
+
+    It listens on the port the bridge sends to and sends to the port the
+    bridge listens on, timestamping arrivals on the rtmidi thread.
+    """
+
+    def __init__(self, listen_name, send_name):
+        import rtmidi
+
+        self.listen_name = listen_name
+        self.send_name = send_name
+        self.received = []
+        self.midi_in = rtmidi.MidiIn()
+        self.midi_out = rtmidi.MidiOut()
+
+    def connect(self, timeout=5.0):
+        """Open both ports, waiting for the bridge to create them if they are virtual."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            index_in = find_port(self.midi_in.get_ports(), self.listen_name)
+            index_out = find_port(self.midi_out.get_ports(), self.send_name)
+            if index_in != -1 and index_out != -1:
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"MIDI ports '{self.listen_name}'/'{self.send_name}' not found")
+            time.sleep(0.05)
+        self.midi_in.open_port(index_in)
+        self.midi_in.ignore_types(sysex=False, timing=False, active_sense=False)
+        self.midi_in.set_callback(self._on_message)
+        self.midi_out.open_port(index_out)
+
+    def _on_message(self, event, data=None):
+        self.received.append((time.perf_counter(), event[0]))
+
+    def inject(self, message):
+        self.midi_out.send_message(message)
+
+    def close(self):
+        self.midi_in.cancel_callback()
+        self.midi_in.close_port()
+        self.midi_out.close_port()
+
+
+def note_storm(count):
+    """Note on/off pairs cycling over all channels and the full keyboard."""
+    messages = []
+    for i in range(count // 2):
+        channel = i % 16
+        note = i % 128
+        messages.append([0x90 | channel, note, 100])
+        messages.append([0x80 | channel, note, 0])
+    return messages
+
+
+def cc14_stream(count):
+    """14-bit controller sweeps: CC 1 (MSB) followed by CC 33 (LSB)."""
+    messages = []
+    for i in range(count // 2):
+        value = (i * 37) % 16384
+        messages.append([0xb0, 1, value >> 7])
+        messages.append([0xb0, 33, value & 0x7f])
+    return messages
+
+
+def midi_clock(count):
+    """MIDI clock ticks bracketed by start and stop."""
+    return [[0xfa]] + [[0xf8]] * max(count - 2, 0) + [[0xfc]]
+
+
+def sysex_dump(count, size=4096):
+    """Large SysEx dumps; count is the number of dumps."""
+    payload = [i % 128 for i in range(size - 2)]
+    return [[0xf0] + payload + [0xf7] for _ in range(max(count // 1000, 4))]
+
+
+def clock_under_sysex(count, size=1024):
+    """MIDI clock competing with SysEx dumps: a dump after every 8 ticks."""
+    payload = [i % 128 for i in range(size - 2)]
+    messages = [[0xfa]]
+    for i in range(max(count - 2, 0)):
+        messages.append([0xf8])
+        if i % 8 == 7:
+            messages.append([0xf0] + payload + [0xf7])
+    messages.append([0xfc])
+    return messages
+
+
+WORKLOADS = {
+    "notes": note_storm,
+    "cc14": cc14_stream,
+    "clock": midi_clock,
+    "sysex": sysex_dump,
+    "clock_sysex": clock_under_sysex,
+}
+
+
+def is_realtime(message):
+    return len(message) == 1 and message[0] >= 0xf8
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies) if latencies else 0.0
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else None,
+        "stddev": (sum((x - mean) ** 2 for x in latencies) / len(latencies)) ** 0.5 if latencies else None,
+    }
+
+
+def summarize(direction, workload, messages, sent_times, received, elapsed, cpu, bridge):
+    """Match sent and received messages and build the result record.
+
+    Realtime messages may overtake bulk ones (priority lane), so each kind is
+    matched in FIFO order separately.
+    """
+    latencies = []
+    realtime_latencies = []
+    for wanted, bucket in ((True, realtime_latencies), (False, latencies)):
+        sent = [t for t, m in zip(sent_times, messages) if is_realtime(m) == wanted]
+        got = [t for t, m in received if is_realtime(m) == wanted]
+        bucket.extend((received_at - sent_at) * 1e6 for sent_at, received_at in zip(sent, got))
+    delivered = len(received)
+    queue_stats = bridge.queue_stats()
+    return {
+        "direction": direction,
+        "workload": workload,
+        "messages": len(messages),
+        "bytes": sum(len(m) for m in messages),
+        "delivered": delivered,
+        "drops": len(messages) - delivered,
+        "queue_drops": sum(q["dropped"] for q in queue_stats.values()),
+        "seconds": elapsed,
+        "msgs_per_sec": delivered / elapsed if elapsed > 0 else None,
+        "latency_us": latency_summary(latencies + realtime_latencies),
+        # Spread of the realtime latency is the jitter the bridge adds to MIDI clock
+        "realtime_latency_us": latency_summary(realtime_latencies),
+        "cpu_us_per_msg": cpu / delivered * 1e6 if delivered else None,
+        "serial_writes": bridge.write_stats["writes"],
+        "coalesced": bridge.write_stats["coalesced"],
+    }
+
+
+def pace(deadline):
+    """Sleep until deadline; sleeping (not spinning) keeps the GIL free for the bridge threads."""
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def bridge_cpu_seconds(bridge):
+    """CPU time used so far by the bridge threads, or by the whole process if unknown.
+
+    Per-thread times come from /proc (Linux), which keeps the harness itself
+    out of the per-message cost.
+    """
+    threads = [getattr(bridge, name, None) for name in ("s_watcher", "s_writer", "m_watcher")]
+    total = 0.0
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+        for thread in threads:
+            if thread is None or thread.native_id is None:
+                continue
+            with open(f"/proc/self/task/{thread.native_id}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+    except (OSError, ValueError, AttributeError):
+        return time.process_time()
+    return total
+
+
+def wait_for(condition, idle_timeout):
+    """Wait until condition() is true or nothing has changed for idle_timeout seconds."""
+    last_value = None
+    last_change = time.perf_counter()
+    while True:
+        done, value = condition()
+        if done:
+            return
+        if value != last_value:
+            last_value = value
+            last_change = time.perf_counter()
+        elif time.perf_counter() - last_change > idle_timeout:
+            return
+        time.sleep(0.001)
+
+
+def write_all(fd, data, pacer=None):
+    """Write all of data to fd, at the pacer's line rate if given."""
+    for chunk in (pacer.slices(data) if pacer is not None else (memoryview(data),)):
+        while chunk:
+            chunk = chunk[os.write(fd, chunk):]
+
+
+class HarnessLink:
+    """The device end of the pty: raw or framed MIDI, optionally held to the line rate."""
+
+    FRAME_BATCH = 16  # Messages per frame when sending as fast as possible
+
+    def __init__(self, master_fd, framing=False, pacer=None):
+        self.master_fd = master_fd
+        self.encoder = FrameEncoder() if framing else None
+        self.pacer = pacer
+
+    def batch_size(self, rate):
+        return self.FRAME_BATCH if self.encoder is not None and not rate else 1
+
+    def send(self, messages):
+        if self.encoder is not None:
+            data = self.encoder.encode(messages)
+        else:
+            data = b"".join(bytes(message) for message in messages)
+        write_all(self.master_fd, data, self.pacer)
+
+    def parse(self):
+        """Return a function turning bytes read from the pty into MIDI messages."""
+        parser = MidiStreamParser()
+        if self.encoder is None:
+            return parser.feed
+        decoder = FrameDecoder()
+
+        def feed(data):
+            for timestamp, chunk in decoder.feed(data):
+                yield from parser.feed(chunk)
+        return feed
+
+    def accept_framing(self, timeout=5.0):
+        """Answer the bridge's framing offer the way a framed device would."""
+        seen = bytearray()
+        deadline = time.perf_counter() + timeout
+        while HELLO not in seen:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("The bridge did not offer framing")
+            if select.select([self.master_fd], [], [], 0.1)[0]:
+                seen += os.read(self.master_fd, 4096)
+        write_all(self.master_fd, ACK)
+
+    def drain(self):
+        """Discard whatever the bridge wrote so far (e.g. repeated framing offers)."""
+        while select.select([self.master_fd], [], [], 0.05)[0]:
+            os.read(self.master_fd, 65536)
+
+
+def run_serial_to_midi(bridge, backend, link, workload, messages, rate, idle_timeout):
+    """Write messages to the pty and time their arrival at the fake MIDI out."""
+    backend.received = []
+    interval = 1.0 / rate if rate else 0.0
+    batch_size = link.batch_size(rate)
+    sent_times = []
+    cpu_start = bridge_cpu_seconds(bridge)
+    start = time.perf_counter()
+    for offset in range(0, len(messages), batch_size):
+        if interval:
+            pace(start + len(sent_times) * interval)
+        batch = messages[offset:offset + batch_size]
+        sent_times.extend([time.perf_counter()] * len(batch))
+        link.send(batch)
+
+    def complete_count():
+        count = len(backend.received)
+        return count >= len(messages), count
+
+    wait_for(complete_count, idle_timeout)
+    received = list(backend.received)
+    elapsed = (received[-1][0] if received else time.perf_counter()) - start
+    cpu = bridge_cpu_seconds(bridge) - cpu_start
+    return summarize("serial_to_midi", workload, messages, sent_times, received, elapsed, cpu, bridge)
+
+
+def run_midi_to_serial(bridge, backend, link, workload, messages, rate, idle_timeout):
+    """Inject messages at the fake MIDI in and time their arrival on the pty."""
+    master_fd = link.master_fd
+    received = []
+    reading = threading.Event()
+    reading.set()
+
+    def reader():
+        feed = link.parse()
+        while reading.is_set():
+            try:
+                data = os.read(master_fd, 65536)
+            except BlockingIOError:
+                time.sleep(0.0002)
+                continue
+            now = time.perf_counter()
+            for message in feed(data):
+                received.append((now, message))
+
+    os.set_blocking(master_fd, False)
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+
+    interval = 1.0 / rate if rate else 0.0
+    sent_times = []
+    cpu_start = bridge_cpu_seconds(bridge)
+    start = time.perf_counter()
+    for message in messages:
+        if interval:
+            pace(start + len(sent_times) * interval)
+        sent_times.append(time.perf_counter())
+        backend.inject(message)
+    wait_for(lambda: (len(received) >= len(messages), len(received)), idle_timeout)
+    reading.clear()
+    reader_thread.join()
+    os.set_blocking(master_fd, True)
+    elapsed = (received[-1][0] if received else time.perf_counter()) - start
+    cpu = bridge_cpu_seconds(bridge) - cpu_start
+    return summarize("midi_to_serial", workload, messages, sent_times, received, elapsed, cpu, bridge)
+
+
+def open_pty():
+    """Return (master_fd, slave_name) for a raw pseudo-terminal pair."""
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(master_fd)
+    tty.setraw(slave_fd)
+    slave_name = os.ttyname(slave_fd)
+    return master_fd, slave_fd, slave_name
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_bridge(slave_name, backend, **bridge_options):
+    options = {"serial_baud": 115200, "midi_in_name": PORT_NAME, "midi_out_name": PORT_NAME}
+    options.update(bridge_options)
+    bridge = SerialMIDI(serial_port_name=slave_name, midi_backend=backend, **options)
+    if not bridge.start():
+        raise RuntimeError(f"Could not open {slave_name}")
+    if isinstance(backend, FakeMidiBackend):
+        # Wait for midi_watcher to open the fake ports
+        while backend.midi_in is None or backend.midi_in.callback is None:
+            time.sleep(0.001)
+    return bridge
+
+
+def warm_up(backend, link, timeout=5.0):
+    """Round-trip one message so the bridge threads are past their startup polling."""
+    backend.received = []
+    link.send([[0xfe]])
+    deadline = time.perf_counter() + timeout
+    while not backend.received and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    backend.received = []
+
+
+def run_benchmarks(workloads, count, rate, directions, idle_timeout=2.0, sysex_size=4096,
+                   midi="fake", loopback=None, **bridge_options):
+    """Run the workloads; midi is "fake", "virtual" (the bridge's own ports) or "loopback" (two OS buses).
+
+    With bridge_options pace_fraction set, the harness also sends at that
+    fraction of the serial_baud line rate, like a real device would.
+    """
+    master_fd, slave_fd, slave_name = open_pty()
+    framing = bridge_options.get("framing", "off")
+    pacer = None
+    if bridge_options.get("pace_fraction"):
+        pacer = LinePacer(bridge_options.get("serial_baud", 115200), bridge_options["pace_fraction"])
+    link = HarnessLink(master_fd, framing=framing != "off", pacer=pacer)
+    if midi == "fake":
+        backend = FakeMidiBackend()
+        bridge = make_bridge(slave_name, backend, **bridge_options)
+    else:
+        import rtmidi
+
+        if midi == "virtual":
+            name = default_virtual_port_name(slave_name)
+            bridge_options.update(virtual_ports=True, virtual_port_name=name)
+            backend = RtMidiEndpoint(name, name)
+        else:
+            # The bridge sends to the first bus and listens on the second
+            bridge_options.update(midi_out_name=loopback[0], midi_in_name=loopback[1])
+            backend = RtMidiEndpoint(loopback[0], loopback[1])
+        bridge = make_bridge(slave_name, rtmidi, **bridge_options)
+        backend.connect()
+    results = []
+    try:
+        if framing == "auto":
+            link.accept_framing()
+        warm_up(backend, link)
+        link.drain()
+        for workload in workloads:
+            if workload == "sysex":
+                messages = sysex_dump(count, sysex_size)
+            else:
+                messages = WORKLOADS[workload](count)
+            if "serial_to_midi" in directions:
+                results.append(run_serial_to_midi(bridge, backend, link, workload, messages, rate, idle_timeout))
+            if "midi_to_serial" in directions:
+                results.append(run_midi_to_serial(bridge, backend, link, workload, messages, rate, idle_timeout))
+    finally:
+        bridge.stop()
+        if isinstance(backend, RtMidiEndpoint):
+            backend.close()
+        os.close(master_fd)
+        os.close(slave_fd)
+    for result in results:
+        result["midi"] = midi
+        result["framed"] = bridge.framed
+    return results
+
+
+def format_result(result):
+    latency = result["latency_us"]
+
+    def us(value):
+        return f"{value:9.1f}" if value is not None else "        -"
+
+    rate = result["msgs_per_sec"]
+    cpu = result["cpu_us_per_msg"]
+    return (f"{result['workload']:<6} {result['direction']:<15} {result['delivered']:>7}/{result['messages']:<7} "
+            f"{(rate or 0):>10.0f} msg/s  p50 {us(latency['p50'])} us  p99 {us(latency['p99'])} us  "
+            f"max {us(latency['max'])} us  cpu {(cpu or 0):7.1f} us/msg  drops {result['drops']}"
+            + (f"  clock jitter {result['realtime_latency_us']['stddev']:.1f} us"
+               if result["realtime_latency_us"]["stddev"] is not None else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serial <-> MIDI bridge latency and throughput benchmark")
+    parser.add_argument("-w", "--workload", action="append", choices=sorted(WORKLOADS),
+                        help="workload to run (repeatable, default: all)")
+    parser.add_argument("-n", "--count", type=int, default=10000, help="messages per workload (default: 10000)")
+    parser.add_argument("-r", "--rate", type=float, default=0,
+                        help="messages per second to offer, 0 for as fast as possible (default)")
+    parser.add_argument("--direction", choices=("serial_to_midi", "midi_to_serial", "both"), default="both")
+    parser.add_argument("--write-window-us", type=int, default=0, help="serial write-combining window")
+    parser.add_argument("--running-status", action="store_true", help="running-status compression on serial writes")
+    parser.add_argument("--sysex-size", type=int, default=4096, help="size of each dump in the sysex workload")
+    parser.add_argument("--sysex-chunk-size", type=int, default=0, help="stream SysEx in fragments of this size")
+    parser.add_argument("--sysex-chunk-delay", type=float, default=0.0, help="seconds between serial SysEx chunks")
+    parser.add_argument("--coalesce-backlog", type=int, default=0,
+                        help="enable CC coalescing above this backlog (default: off, coalesced messages count as drops)")
+    parser.add_argument("--baud", type=int, default=115200, help="serial baud rate, only matters with --pace")
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help="hold both ends of the pty to this fraction of the --baud line rate (default: off)")
+    parser.add_argument("--framing", choices=("off", "auto", "on"), default="off",
+                        help="serial protocol: raw MIDI, negotiated frames, or frames from the start")
+    parser.add_argument("--midi", choices=("fake", "virtual", "loopback"), default="fake",
+                        help="MIDI side: in-process fake (default), the bridge's virtual ports, "
+                             "or an OS loopback bus (needs python-rtmidi)")
+    parser.add_argument("--loopback", nargs=2, metavar=("TO_HARNESS", "TO_BRIDGE"),
+                        help="with --midi loopback: bus the bridge sends to, and bus it listens on")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "openpty"):
+        parser.error("this benchmark needs pseudo-terminal support (Linux or macOS)")
+
+    if args.midi == "loopback" and not args.loopback:
+        parser.error("--midi loopback needs --loopback TO_HARNESS TO_BRIDGE")
+
+    directions = ("serial_to_midi", "midi_to_serial") if args.direction == "both" else (args.direction,)
+    results = run_benchmarks(
+        args.workload or list(WORKLOADS), args.count, args.rate, directions,
+        write_window_us=args.write_window_us, running_status=args.running_status,
+        sysex_size=args.sysex_size,
+        sysex_chunk_size=args.sysex_chunk_size, sysex_chunk_delay=args.sysex_chunk_delay,
+        coalesce_backlog=args.coalesce_backlog,
+        midi=args.midi, loopback=args.loopback,
+        serial_baud=args.baud, pace_fraction=args.pace, framing=args.framing,
+    )
+    for result in results:
+        print(format_result(result))
+    rss = max_rss_mb()
+    if rss is not None:
+        print(f"max RSS {rss:.1f} MB")
+
+    if args.json:
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "options": vars(args),
+            "max_rss_mb": rss,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+import collections
+import logging
+import os
+import queue
+import selectors
+import socket
+import threading
+
+try:
+    import rtmidi
+except ImportError:  # Reported when a route is opened
+    rtmidi = None
+import serial
+
+from activity import ActivityCounters
+from midiparser import MidiStreamParser, MidiStreamEncoder
+from ringbuffer import RingBuffer
+from serialmidi import BridgeObserver, find_port
+
+
+class Route:
+    """One serial <-> MIDI pair hosted by a BridgeManager."""
+
+    def __init__(self, name, serial_port_name, serial_baud, midi_in_name=None, midi_out_name=None,
+                 queue_capacity=1 << 16, overflow="drop-newest", running_status=False, virtual_port_name=None):
+        self.name = name
+        self.serial_port_name = serial_port_name
+        self.serial_baud = serial_baud
+        self.midi_in_name = midi_in_name
+        self.midi_out_name = midi_out_name
+        self.virtual_port_name = virtual_port_name  # Create virtual ports with this name instead
+        self.parser = MidiStreamParser()
+        self.encoder = MidiStreamEncoder(running_status=running_status)
+        self.outgoing = RingBuffer(queue_capacity, overflow)  # MIDI In -> serial
+        self.activity = ActivityCounters()
+        self.ser = None
+        self.fd = None          # Serial file descriptor, None when the port must be polled
+        self.midiin = None
+        self.midiout = None
+        self.write_scheduled = False  # Set by the MIDI callback, cleared by the I/O loop
+        self.pending = b""            # Encoded bytes not yet accepted by the serial port
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.writes = 0
+        self.errors = 0
+
+    def open(self, manager):
+        """Open the serial and MIDI ports; raises on failure."""
+        if rtmidi is None:
+            raise RuntimeError("python-rtmidi is not installed")
+        self.ser = serial.Serial(self.serial_port_name, self.serial_baud, timeout=0)
+        try:
+            self.fd = self.ser.fileno()
+        except (AttributeError, OSError, NotImplementedError):
+            self.fd = None  # e.g. Windows: no selectable handle, the loop polls instead
+
+        if self.virtual_port_name is not None:
+            self.midiout = rtmidi.MidiOut()
+            self.midiout.open_virtual_port(self.virtual_port_name)
+            self.midiin = rtmidi.MidiIn()
+            self.midiin.open_virtual_port(self.virtual_port_name)
+            self.midiin.ignore_types(sysex=False, timing=False, active_sense=False)
+            self.midiin.set_callback(self._midi_input_handler, manager)
+            return
+
+        if self.midi_out_name is not None:
+            self.midiout = rtmidi.MidiOut()
+            index = find_port(self.midiout.get_ports(), self.midi_out_name)
+            if index != -1:
+                self.midiout.open_port(index)
+            else:
+                logging.warning(f"[{self.name}] MIDI OUT port '{self.midi_out_name}' not found")
+
+        if self.midi_in_name is not None:
+            self.midiin = rtmidi.MidiIn()
+            index = find_port(self.midiin.get_ports(), self.midi_in_name)
+            if index != -1:
+                self.midiin.open_port(index)
+                self.midiin.ignore_types(sysex=False, timing=False, active_sense=False)
+                self.midiin.set_callback(self._midi_input_handler, manager)
+            else:
+                logging.warning(f"[{self.name}] MIDI IN port '{self.midi_in_name}' not found")
+
+    def _midi_input_handler(self, event, manager):
+        # Runs on the rtmidi thread: queue the message and wake the loop once
+        message, deltatime = event
+        self.outgoing.put(message)
+        self.activity.midi_in += 1
+        if not self.write_scheduled:
+            self.write_scheduled = True
+            manager.wakeup()
+
+    def close(self):
+        if self.midiin is not None:
+            self.midiin.cancel_callback()
+            if self.midiin.is_port_open():
+                self.midiin.close_port()
+        if self.midiout is not None and self.midiout.is_port_open():
+            self.midiout.close_port()
+        self.outgoing.close()
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
+
+    def stats(self):
+        return {
+            "serial_port": self.serial_port_name,
+            "serial_in": self.activity.serial_in,
+            "serial_out": self.activity.serial_out,
+            "midi_in": self.activity.midi_in,
+            "midi_out": self.activity.midi_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "writes": self.writes,
+            "errors": self.errors,
+            "queue": self.outgoing.stats(),
+        }
+
+
+class BridgeManager:
+    """Host many serial <-> MIDI routes in one process on a single I/O thread.
+
+    Every serial port is registered with one selector; rtmidi callbacks only
+    queue messages and wake the loop through a socket pair. Routes can be
+    added and removed while the loop is running.
+    """
+
+    POLL_INTERVAL = 0.005  # Used only while some port cannot be registered with the selector
+    READ_SIZE = 4096
+
+    def __init__(self, observer=None):
+        self.observer = observer if observer is not None else BridgeObserver()
+        self.routes = {}
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_receive, self._wakeup_send = socket.socketpair()
+        self._wakeup_receive.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_receive, selectors.EVENT_READ, None)
+        self._commands = collections.deque()
+        self._polled = []
+        self._running = False
+        self._thread = None
+
+    def wakeup(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # The loop already has a wakeup pending
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="bridgemanager")
+        self._thread.start()
+        self.observer.bridge_started(self)
+
+    def stop(self):
+        """Stop the loop and close every route."""
+        self._running = False
+        self.wakeup()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for route in list(self.routes.values()):
+            self._unregister(route)
+            route.close()
+        self.routes.clear()
+        self._polled.clear()
+        self.observer.bridge_stopped(self)
+
+    def add_route(self, name, serial_port_name, serial_baud, midi_in_name=None, midi_out_name=None, **options):
+        """Open a new route and hand it to the I/O loop; raises if the serial port cannot be opened."""
+        if name in self.routes:
+            raise ValueError(f"Route '{name}' already exists")
+        route = Route(name, serial_port_name, serial_baud, midi_in_name, midi_out_name, **options)
+        try:
+            route.open(self)
+        except Exception:
+            route.close()
+            raise
+        # Registered before it is published: the loop writes only to routes it can find in self.routes
+        self._call_in_loop(self._register, route)
+        self.routes[name] = route
+        logging.info(f"Route '{name}' added: {serial_port_name} @ {serial_baud} baud")
+        return route
+
+    def remove_route(self, name):
+        """Detach a route from the loop and close its ports."""
+        route = self.routes.pop(name)
+        self._call_in_loop(self._unregister, route)
+        route.close()
+        logging.info(f"Route '{name}' removed")
+
+    def stats(self):
+        return {name: route.stats() for name, route in list(self.routes.items())}
+
+    def _call_in_loop(self, function, route):
+        """Run function(route) on the I/O thread (or right here if it is not running) and wait."""
+        if self._thread is None or not self._running or threading.current_thread() is self._thread:
+            function(route)
+            return
+        done = threading.Event()
+        self._commands.append((function, route, done))
+        self.wakeup()
+        done.wait()
+
+    def _register(self, route):
+        if route.fd is not None:
+            self._selector.register(route.fd, selectors.EVENT_READ, route)
+        else:
+            self._polled.append(route)
+
+    def _unregister(self, route):
+        if route.fd is not None:
+            try:
+                self._selector.unregister(route.fd)
+            except KeyError:
+                pass
+        elif route in self._polled:
+            self._polled.remove(route)
+
+    def _run(self):
+        while self._running:
+            timeout = self.POLL_INTERVAL if self._polled else None
+            for key, mask in self._selector.select(timeout):
+                route = key.data
+                if route is None:
+                    self._handle_wakeup()
+                    continue
+                if mask & selectors.EVENT_READ and self.routes.get(route.name) is route:
+                    self._read(route)
+                if mask & selectors.EVENT_WRITE and self.routes.get(route.name) is route:
+                    self._write(route)
+            for route in list(self._polled):
+                try:
+                    waiting = route.ser.in_waiting
+                except (OSError, serial.SerialException) as e:
+                    self._fail(route, e)
+                    continue
+                if waiting:
+                    self._read(route)
+                if self.routes.get(route.name) is route and (route.write_scheduled or route.pending):
+                    self._write(route)
+        # Let anyone waiting on a command go
+        while self._commands:
+            self._commands.popleft()[2].set()
+
+    def _handle_wakeup(self):
+        try:
+            while self._wakeup_receive.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self._commands:
+            function, route, done = self._commands.popleft()
+            function(route)
+            done.set()
+        for route in list(self.routes.values()):
+            if route.write_scheduled:
+                self._write(route)
+
+    def _read(self, route):
+        try:
+            if route.fd is not None:
+                data = os.read(route.fd, self.READ_SIZE)
+                if not data:
+                    raise OSError("device disconnected")
+            else:
+                data = route.ser.read(route.ser.in_waiting)
+        except (OSError, serial.SerialException) as e:
+            self._fail(route, e)
+            return
+        route.bytes_in += len(data)
+        for message in route.parser.feed(data):
+            route.activity.serial_in += 1
+            if route.midiout is not None:
+                try:
+                    route.midiout.send_message(message)
+                    route.activity.midi_out += 1
+                except Exception as e:
+                    route.errors += 1
+                    logging.error(f"[{route.name}] Failed to send MIDI message: {message}. Error: {e}")
+
+    def _write(self, route):
+        # Clear the flag before draining so a message queued meanwhile schedules a new write
+        route.write_scheduled = False
+        batch = []
+        while True:
+            try:
+                batch.append(route.outgoing.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            route.pending += route.encoder.encode(batch)
+            route.activity.serial_out += len(batch)
+        if not route.pending:
+            return
+        try:
+            if route.fd is not None:
+                written = os.write(route.fd, route.pending)
+            else:
+                written = route.ser.write(route.pending)
+        except BlockingIOError:
+            written = 0
+        except (OSError, serial.SerialException) as e:
+            self._fail(route, e)
+            return
+        route.writes += 1
+        route.bytes_out += written
+        route.pending = route.pending[written:]
+
+        # Ask for a writable event only while there is something left to write
+        if route.fd is not None:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if route.pending else 0)
+            if self._selector.get_key(route.fd).events != events:
+                self._selector.modify(route.fd, events, route)
+
+    def _fail(self, route, error):
+        route.errors += 1
+        logging.error(f"[{route.name}] Serial error: {error}")
+        self._unregister(route)
+        if self.routes.get(route.name) is route:
+            del self.routes[route.name]
+        route.close()
+        self.observer.bridge_error(self, f"Route '{route.name}' failed: {error}")
@@ -0,0 +1,26 @@
+class BridgeObserver:
+    """Receives bridge lifecycle notifications; override the methods you need.
+
+    Callbacks run on the bridge threads, so GUI observers must hand them
+    over to their own event loop (e.g. through a Qt signal).
+    """
+
+    def bridge_started(self, bridge):
+        pass
+
+    def bridge_stopped(self, bridge):
+        pass
+
+    def bridge_error(self, bridge, message):
+        pass
+
+    def sysex_progress(self, bridge, direction, transferred, done):
+        """Bytes of the current SysEx moved so far in direction; done on its last chunk."""
+        pass
+
+    def serial_disconnected(self, bridge):
+        """The serial device went away; the bridge is trying to reconnect."""
+        pass
+
+    def serial_reconnected(self, bridge, device):
+        pass
@@ -0,0 +1,271 @@
+import logging
+import math
+import multiprocessing
+import threading
+
+from serialmidi import SerialMIDI, BridgeObserver
+from activity import ActivityCounters
+
+# Order of the values in the shared stats block; the keys of SerialMIDI.summary()
+FIELDS = (
+    "serial_in", "serial_out", "midi_in", "midi_out",
+    "serial_in_bytes", "serial_out_bytes", "midi_in_bytes", "midi_out_bytes",
+    "corruptions", "dropped_bytes", "queued_to_serial", "queued_to_midi", "queue_dropped",
+    "coalesced", "reconnects",
+    "latency_to_serial_p50", "latency_to_serial_p99", "latency_to_midi_p50", "latency_to_midi_p99",
+)
+COUNTERS = frozenset(FIELDS[:15])  # Read back as ints, the rest are floats or None
+
+
+class StatsBlock:
+    """Bridge counters in a shared-memory array, written by one process and read by another.
+
+    Slot 0 is a sequence number (a seqlock): the writer makes it odd while it
+    updates the values and even again once done, and readers retry until
+    they see the same even number before and after copying, so they never
+    get a mix of two updates. None is stored as NaN. A writer killed in the
+    middle of an update leaves the number odd for good, so readers give up
+    after READ_ATTEMPTS and return the last values they did get.
+    """
+
+    READ_ATTEMPTS = 1000  # An update takes microseconds, this is far longer
+
+    def __init__(self, array=None, context=multiprocessing):
+        self.array = array if array is not None else context.RawArray("d", len(FIELDS) + 1)
+        self._last = {name: 0 if name in COUNTERS else None for name in FIELDS}
+
+    def write(self, values):
+        array = self.array
+        sequence = array[0]
+        array[0] = sequence + 1
+        array[1:] = [math.nan if values[name] is None else values[name] for name in FIELDS]
+        array[0] = sequence + 2
+
+    def read(self):
+        array = self.array
+        for _ in range(self.READ_ATTEMPTS):
+            sequence = array[0]
+            if sequence % 2:
+                continue  # Write in progress
+            values = array[1:]
+            if array[0] == sequence:
+                self._last = {
+                    name: int(value) if name in COUNTERS else (None if math.isnan(value) else value)
+                    for name, value in zip(FIELDS, values)
+                }
+                break
+        return dict(self._last)
+
+
+class SharedActivity:
+    """ActivityCounters look-alike reading the message counts out of a StatsBlock."""
+
+    PORTS = ActivityCounters.PORTS
+
+    def __init__(self, block):
+        self.block = block
+
+    def snapshot(self):
+        array = self.block.array
+        return tuple(int(value) for value in array[1:len(self.PORTS) + 1])
+
+
+class _PipeObserver(BridgeObserver):
+    """Forward bridge notifications to the parent process as tuples."""
+
+    def __init__(self, send):
+        self.send = send
+
+    def bridge_started(self, bridge):
+        self.send(("started",))
+
+    def bridge_stopped(self, bridge):
+        self.send(("stopped",))
+
+    def bridge_error(self, bridge, message):
+        self.send(("error", message))
+
+    def sysex_progress(self, bridge, direction, transferred, done):
+        self.send(("sysex_progress", direction, transferred, done))
+
+    def serial_disconnected(self, bridge):
+        self.send(("serial_disconnected",))
+
+    def serial_reconnected(self, bridge, device):
+        self.send(("serial_reconnected", device))
+
+
+class _PipeLogHandler(logging.Handler):
+    """Ship the worker's log records to the parent, which logs them again."""
+
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record):
+        try:
+            self.send(("log", record.levelno, record.name, self.format(record)))
+        except (OSError, ValueError):
+            pass  # Parent gone; nobody left to read it
+
+
+def _run_worker(conn, array, options, debug, publish_interval):
+    """Entry point of the worker process: run a SerialMIDI until told to stop."""
+    send_lock = threading.Lock()
+
+    def send(event):
+        # Bridge threads, rtmidi callbacks and logging all report through the one pipe
+        with send_lock:
+            conn.send(event)
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(_PipeLogHandler(send))
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    block = StatsBlock(array)
+    bridge = SerialMIDI(observer=_PipeObserver(send), **options)
+    bridge.trace.enabled = debug
+    if not bridge.start():
+        return
+    try:
+        while bridge.thread_running:
+            if conn.poll(publish_interval):
+                command = conn.recv()
+                if command[0] == "stop":
+                    break
+                if command[0] == "debug":
+                    root.setLevel(logging.DEBUG if command[1] else logging.INFO)
+                    bridge.trace.enabled = command[1]
+            block.write(bridge.summary())
+    except (EOFError, OSError):
+        pass  # Parent went away without saying goodbye
+    finally:
+        bridge.stop()
+        block.write(bridge.summary())
+
+
+class _RemoteTrace:
+    """Stands in for bridge.trace: toggling it switches debug logging in the worker."""
+
+    def __init__(self, bridge):
+        self._bridge = bridge
+        self._enabled = False
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = bool(value)
+        self._bridge._command(("debug", self._enabled))
+
+
+class BridgeProcess:
+    """Run a SerialMIDI in a worker process, so its threads never wait for the caller's GIL.
+
+    Takes the same arguments as SerialMIDI (they must be picklable, so no
+    port_manager or filter objects built elsewhere) and offers the parts of
+    its interface a front end needs: start(), stop(), activity, summary(),
+    trace.enabled and observer callbacks, which run on a receiver thread
+    just like they run on the bridge threads in-process. Counters come
+    through a shared StatsBlock refreshed every publish_interval seconds;
+    commands and notifications go over a pipe.
+    """
+
+    PUBLISH_INTERVAL = 0.02  # Seconds between two stats block updates
+    START_TIMEOUT = 10.0
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, observer=None, **options):
+        self.observer = observer if observer is not None else BridgeObserver()
+        self.options = options
+        # Spawn rather than fork: the parent may run Qt and rtmidi threads
+        self._context = multiprocessing.get_context("spawn")
+        self.block = StatsBlock(context=self._context)
+        self.activity = SharedActivity(self.block)
+        self.trace = _RemoteTrace(self)
+        self.process = None
+        self._conn = None
+        self._receiver = None
+        self._ready = threading.Event()
+        self._started = False
+
+    @property
+    def thread_running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def summary(self):
+        return self.block.read()
+
+    def start(self):
+        """Launch the worker and wait until its bridge is running; return False if it failed."""
+        self._conn, child_conn = self._context.Pipe()
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        self.trace._enabled = debug
+        self.process = self._context.Process(
+            target=_run_worker, name="serialmidi-bridge", daemon=True,
+            args=(child_conn, self.block.array, self.options, debug, self.PUBLISH_INTERVAL),
+        )
+        self.process.start()
+        child_conn.close()
+        self._receiver = threading.Thread(target=self._receive, name="bridge-events", daemon=True)
+        self._receiver.start()
+        if not self._ready.wait(self.START_TIMEOUT):
+            logging.error("Bridge process did not start in time.")
+            self.stop()
+            return False
+        return self._started
+
+    def stop(self):
+        """Ask the worker to stop its bridge, and kill it if it does not exit in time."""
+        self._command(("stop",))
+        if self.process is not None:
+            self.process.join(self.STOP_TIMEOUT)
+            if self.process.is_alive():
+                logging.warning("Bridge process did not stop, terminating it.")
+                self.process.terminate()
+                self.process.join()
+        # An observer may call stop() from the receiver thread itself
+        if self._receiver is not None and self._receiver is not threading.current_thread():
+            self._receiver.join()
+            self._receiver = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _command(self, command):
+        if self._conn is not None:
+            try:
+                self._conn.send(command)
+            except OSError:
+                pass  # Worker already gone
+
+    def _receive(self):
+        conn = self._conn
+        while True:
+            try:
+                event = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = event[0]
+            if kind == "log":
+                logging.getLogger(event[2]).log(event[1], event[3])
+            elif kind == "started":
+                self._started = True
+                self._ready.set()
+                self.observer.bridge_started(self)
+            elif kind == "stopped":
+                self.observer.bridge_stopped(self)
+            elif kind == "error":
+                self._ready.set()
+                self.observer.bridge_error(self, event[1])
+            elif kind == "sysex_progress":
+                self.observer.sysex_progress(self, *event[1:])
+            elif kind == "serial_disconnected":
+                self.observer.serial_disconnected(self)
+            elif kind == "serial_reconnected":
+                self.observer.serial_reconnected(self, event[1])
+        # Worker exited, possibly before its bridge ever came up
+        self._ready.set()
@@ -0,0 +1,355 @@
+"""Record bridge traffic to a compact capture file, replay it, convert it to/from Standard MIDI Files.
+
+A capture starts with a 16-byte header (b"SMCAP", version, two reserved
+bytes, start time as a little-endian float64 of time.time()) followed by
+records::
+
+    direction  u8      1: serial -> MIDI, 2: MIDI -> serial (0 ends the data)
+    delta      varint  microseconds since the previous record, zigzag encoded
+    length     varint  payload size
+    payload    bytes   the MIDI message (SysEx whole, even when the bridge streams it)
+
+The file is written through mmap in 1 MB steps and trimmed on close; a
+capture cut short by a crash ends at the first zero byte.
+"""
+import argparse
+import collections
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from midiprotocol import MESSAGE_LENGTH
+
+MAGIC = b"SMCAP"
+VERSION = 1
+HEADER = struct.Struct("<5sBxxd")
+SERIAL_TO_MIDI = 1
+MIDI_TO_SERIAL = 2
+DIRECTIONS = {SERIAL_TO_MIDI: "serial_to_midi", MIDI_TO_SERIAL: "midi_to_serial"}
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, position):
+    """Return (value, next position)."""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class CaptureWriter:
+    """Append-only capture file fed by the bridge threads.
+
+    record() only appends a tuple to a deque (thread-safe without a lock),
+    so tapping both directions costs next to nothing; a background thread
+    encodes the records into the memory-mapped file every flush_interval
+    seconds.
+    """
+
+    GROW_SIZE = 1 << 20
+
+    def __init__(self, path, flush_interval=0.05):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._pending = collections.deque()
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._file = open(path, "w+b")
+        self._file.truncate(self.GROW_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), self.GROW_SIZE)
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, VERSION, time.time())
+        self._position = HEADER.size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self._thread.start()
+
+    def record(self, direction, timestamp, message):
+        """Queue one message; timestamp comes from time.perf_counter()."""
+        self._pending.append((direction, timestamp, bytes(message)))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        out = bytearray()
+        pending = self._pending
+        last = self._last
+        while pending:
+            direction, timestamp, payload = pending.popleft()
+            delta = round((timestamp - last) * 1e6)
+            last = timestamp
+            out.append(direction)
+            # Both directions share the file, so a record may be slightly older than the previous one
+            encode_varint((delta << 1) ^ (delta >> 63), out)
+            encode_varint(len(payload), out)
+            out += payload
+            self.records += 1
+        self._last = last
+        if out:
+            self._append(out)
+
+    def _append(self, data):
+        end = self._position + len(data)
+        if end > len(self._map):
+            size = (end // self.GROW_SIZE + 1) * self.GROW_SIZE
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[self._position:end] = data
+        self._position = end
+
+    def close(self):
+        """Write what is still queued and trim the file to its contents."""
+        if self._map is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._flush()
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._position)
+        self._file.close()
+
+
+def read_capture(path):
+    """Return (start time, list of (seconds since start, direction, payload bytes))."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise ValueError(f"{path} is not a capture file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, started = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a capture file")
+            records = []
+            position = HEADER.size
+            elapsed = 0
+            while position < len(data) and data[position] != 0:
+                direction = data[position]
+                zigzag, position = decode_varint(data, position + 1)
+                length, position = decode_varint(data, position)
+                elapsed += (zigzag >> 1) ^ -(zigzag & 1)
+                records.append((elapsed / 1e6, direction, data[position:position + length]))
+                position += length
+    return started, records
+
+
+def replay(records, bridge, speed=1.0):
+    """Feed captured records back through a running SerialMIDI.
+
+    speed scales the original timing (2.0 plays twice as fast); 0 sends
+    everything as fast as possible. The bridge stands in the captured
+    records for its inputs, so it should not receive live input meanwhile.
+    """
+    started = time.perf_counter()
+    for timestamp, direction, payload in records:
+        if not bridge.thread_running:
+            break
+        if speed > 0:
+            delay = started + timestamp / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        bridge.inject(DIRECTIONS[direction], list(payload))
+
+
+# Standard MIDI File conversion. One tick is 100 us: 5000 ticks per quarter note at 120 BPM.
+SMF_DIVISION = 5000
+SMF_TEMPO = 500000
+
+
+def _smf_varlen(value):
+    out = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7f) | 0x80)
+        value >>= 7
+    return out
+
+
+def _smf_track(events, name):
+    """Build an MTrk chunk from (tick, message bytes) events sorted by tick."""
+    body = bytearray(b"\x00\xff\x03" + _smf_varlen(len(name)) + name.encode())
+    body += b"\x00\xff\x51\x03" + SMF_TEMPO.to_bytes(3, "big")
+    last = 0
+    for tick, message in events:
+        body += _smf_varlen(tick - last)
+        last = tick
+        if message[0] == 0xf0:
+            body.append(0xf0)
+            body += _smf_varlen(len(message) - 1) + message[1:]
+        elif message[0] >= 0xf0 or message[0] < 0x80:
+            # Realtime, system common and SysEx fragments go in an escape (0xF7) event
+            body.append(0xf7)
+            body += _smf_varlen(len(message)) + message
+        else:
+            body += message
+    body += b"\x00\xff\x2f\x00"
+    return b"MTrk" + len(body).to_bytes(4, "big") + body
+
+
+def capture_to_smf(capture_path, smf_path):
+    """Write a format 1 Standard MIDI File with one track per direction."""
+    _, records = read_capture(capture_path)
+    tracks = []
+    for direction, name in DIRECTIONS.items():
+        events = [(round(timestamp * 1e6 / (SMF_TEMPO / SMF_DIVISION)), bytes(payload))
+                  for timestamp, record_direction, payload in records if record_direction == direction]
+        events.sort(key=lambda event: event[0])
+        tracks.append(_smf_track(events, name))
+    with open(smf_path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), SMF_DIVISION))
+        for track in tracks:
+            f.write(track)
+
+
+def _read_smf_events(data):
+    """Yield (seconds, message bytes) for every MIDI and SysEx event of a Standard MIDI File."""
+    if data[:4] != b"MThd":
+        raise ValueError("not a Standard MIDI File")
+    length, _, track_count, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+    position = 8 + length
+    # Collect everything on an absolute tick scale first, tempo changes apply across tracks
+    events = []
+    tempos = [(0, SMF_TEMPO)]
+    for _ in range(track_count):
+        chunk, size = data[position:position + 4], int.from_bytes(data[position + 4:position + 8], "big")
+        position += 8
+        end = position + size
+        if chunk != b"MTrk":
+            position = end
+            continue
+        tick = 0
+        running = 0
+        while position < end:
+            delta, position = _read_smf_varlen(data, position)
+            tick += delta
+            status = data[position]
+            if status == 0xff:
+                kind = data[position + 1]
+                size, position = _read_smf_varlen(data, position + 2)
+                if kind == 0x51:
+                    tempos.append((tick, int.from_bytes(data[position:position + 3], "big")))
+                position += size
+                running = 0
+            elif status in (0xf0, 0xf7):
+                size, start = _read_smf_varlen(data, position + 1)
+                payload = data[start:start + size]
+                events.append((tick, bytes([0xf0]) + payload if status == 0xf0 else payload))
+                position = start + size
+                running = 0
+            else:
+                if status & 0x80:
+                    running = status
+                    position += 1
+                elif not running:
+                    raise ValueError("data byte without running status in Standard MIDI File")
+                length = MESSAGE_LENGTH[running] - 1
+                events.append((tick, bytes([running]) + data[position:position + length]))
+                position += length
+        position = end
+
+    tempos.sort(key=lambda tempo: tempo[0])
+    events.sort(key=lambda event: event[0])
+    tempo_index = 0
+    tempo_tick, tempo = tempos[0]
+    seconds_at_tempo = 0.0
+    for tick, message in events:
+        while tempo_index + 1 < len(tempos) and tempos[tempo_index + 1][0] <= tick:
+            next_tick, next_tempo = tempos[tempo_index + 1]
+            seconds_at_tempo += (next_tick - tempo_tick) * tempo / division / 1e6
+            tempo_tick, tempo = next_tick, next_tempo
+            tempo_index += 1
+        yield seconds_at_tempo + (tick - tempo_tick) * tempo / division / 1e6, message
+
+
+def _read_smf_varlen(data, position):
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, position
+
+
+def smf_to_capture(smf_path, capture_path, direction=MIDI_TO_SERIAL):
+    """Turn every track of a Standard MIDI File into records of one direction."""
+    with open(smf_path, "rb") as f:
+        events = list(_read_smf_events(f.read()))
+    writer = CaptureWriter(capture_path)
+    start = writer._start
+    for seconds, message in events:
+        writer.record(direction, start + seconds, message)
+    writer.close()
+    return len(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, replay and convert bridge captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="summarize a capture")
+    info.add_argument("capture")
+    to_smf = commands.add_parser("to-smf", help="convert a capture to a Standard MIDI File")
+    to_smf.add_argument("capture")
+    to_smf.add_argument("smf")
+    from_smf = commands.add_parser("from-smf", help="convert a Standard MIDI File to a capture")
+    from_smf.add_argument("smf")
+    from_smf.add_argument("capture")
+    from_smf.add_argument("--direction", choices=sorted(DIRECTIONS.values()), default="midi_to_serial")
+    play = commands.add_parser("replay", help="play a capture through the bridge")
+    play.add_argument("capture")
+    play.add_argument("-p", "--serial-port", dest="serial_port", required=True)
+    play.add_argument("-b", "--baud", type=int, default=115200)
+    play.add_argument("-o", "--midi-out", dest="midi_out", required=True)
+    play.add_argument("--speed", type=float, default=1.0, help="timing scale, 0 for as fast as possible")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "info":
+        started, records = read_capture(args.capture)
+        counts = collections.Counter(DIRECTIONS.get(direction, "?") for _, direction, _ in records)
+        duration = records[-1][0] if records else 0.0
+        print(f"started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}, "
+              f"{len(records)} records over {duration:.3f} s")
+        for name, count in sorted(counts.items()):
+            print(f"  {name:<15} {count}")
+    elif args.command == "to-smf":
+        capture_to_smf(args.capture, args.smf)
+    elif args.command == "from-smf":
+        direction = next(code for code, name in DIRECTIONS.items() if name == args.direction)
+        print(f"{smf_to_capture(args.smf, args.capture, direction)} events written")
+    else:
+        from serialmidi import SerialMIDI
+
+        _, records = read_capture(args.capture)
+        bridge = SerialMIDI(args.serial_port, args.baud, None, args.midi_out)
+        if not bridge.start():
+            return 1
+        try:
+            replay(records, bridge, args.speed)
+            time.sleep(0.5)  # Let the queues drain
+        finally:
+            bridge.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
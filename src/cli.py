@@ -0,0 +1,376 @@
+import argparse
+import configparser
+import logging
+import signal
+import sys
+import threading
+import time
+
+from serialmidi import SerialMIDI, BridgeObserver, default_virtual_port_name
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+CONFIG_SECTION = "bridge"
+ROUTE_SECTION_PREFIX = "route "
+ROUTE_KEYS = ("serial_port", "baud", "midi_in", "midi_out", "running_status", "virtual", "virtual_name")
+# Options that still apply when the config file defines routes (each route has its own ports)
+ROUTES_MODE_OPTIONS = ("config", "debug")
+# Options the asyncio bridge implements
+ASYNCIO_OPTIONS = ("config", "serial_port", "baud", "midi_in", "midi_out", "running_status", "use_asyncio", "debug")
+
+
+class LoggingObserver(BridgeObserver):
+    """Report bridge startup through logging and remember failures (already logged by the bridge)."""
+
+    def __init__(self):
+        self.failed = threading.Event()
+
+    def bridge_started(self, bridge):
+        if hasattr(bridge, "serial_port_name"):
+            logging.info(f"Bridging {bridge.serial_port_name} @ {bridge.serial_baud} baud")
+
+    def bridge_error(self, bridge, message):
+        self.failed.set()
+
+
+def read_config(path):
+    """Read the [bridge] section of an INI config file into argument defaults."""
+    config = configparser.ConfigParser()
+    with open(path, "r") as f:
+        config.read_file(f)
+    if not config.has_section(CONFIG_SECTION):
+        return {}
+    section = config[CONFIG_SECTION]
+    defaults = {}
+    for key in ("serial_port", "midi_in", "midi_out", "overflow", "filters", "metrics_file", "virtual_name",
+                "flow_control", "framing"):
+        if key in section:
+            defaults[key] = section.get(key)
+    for key in ("baud", "write_window_us", "coalesce_backlog", "metrics_port", "pace_burst",
+                "sysex_chunk_size", "sysex_max_size"):
+        if key in section:
+            defaults[key] = section.getint(key)
+    for key in ("running_status", "panic_on_corruption", "debug", "virtual"):
+        if key in section:
+            defaults[key] = section.getboolean(key)
+    for key in ("reconnect_timeout", "pace", "negotiate_timeout", "sysex_chunk_delay"):
+        if key in section:
+            defaults[key] = section.getfloat(key)
+    return defaults
+
+
+def read_routes(path):
+    """Read every [route NAME] section of an INI config file for the multi-bridge mode."""
+    config = configparser.ConfigParser()
+    with open(path, "r") as f:
+        config.read_file(f)
+    routes = []
+    for section_name in config.sections():
+        if not section_name.startswith(ROUTE_SECTION_PREFIX):
+            continue
+        section = config[section_name]
+        unknown = sorted(set(section) - set(ROUTE_KEYS))
+        if unknown:
+            raise ValueError(f"[{section_name}]: unsupported key(s) {', '.join(unknown)} "
+                             f"(routes support {', '.join(ROUTE_KEYS)})")
+        virtual_port_name = None
+        if section.getboolean("virtual", False):
+            virtual_port_name = section.get("virtual_name") or default_virtual_port_name(section.get("serial_port"))
+        routes.append({
+            "name": section_name[len(ROUTE_SECTION_PREFIX):].strip(),
+            "serial_port_name": section.get("serial_port"),
+            "serial_baud": section.getint("baud", 115200),
+            "midi_in_name": section.get("midi_in"),
+            "midi_out_name": section.get("midi_out"),
+            "running_status": section.getboolean("running_status", False),
+            "virtual_port_name": virtual_port_name,
+        })
+    return routes
+
+
+def run_routes(routes, observer, stop_requested):
+    """Run several serial <-> MIDI routes in this process with a BridgeManager."""
+    from bridgemanager import BridgeManager
+
+    manager = BridgeManager(observer=observer)
+    manager.start()
+    try:
+        for route in routes:
+            manager.add_route(**route)
+    except Exception as e:
+        logging.error(f"Could not open route '{route['name']}': {e}")
+        manager.stop()
+        return 1
+    while not stop_requested.wait(0.5):
+        if not manager.routes:
+            break
+    manager.stop()
+    return 1 if observer.failed.is_set() else 0
+
+
+def run_asyncio(args, observer):
+    """Run the asyncio bridge until SIGINT/SIGTERM."""
+    import asyncio
+    from aiobridge import AsyncSerialMIDI
+
+    async def run():
+        bridge = AsyncSerialMIDI(
+            serial_port_name=args.serial_port,
+            serial_baud=args.baud,
+            midi_in_name=args.midi_in,
+            midi_out_name=args.midi_out,
+            observer=observer,
+            running_status=args.running_status,
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            await bridge.start()
+        except Exception:
+            return 1
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, lambda: loop.create_task(bridge.stop()))
+            except NotImplementedError:
+                pass  # Windows: Ctrl-C raises KeyboardInterrupt instead
+        try:
+            await bridge.run()
+        finally:
+            await bridge.stop()
+        return 1 if observer.failed.is_set() else 0
+
+    try:
+        return asyncio.run(run())
+    except KeyboardInterrupt:
+        return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="serialmidi-bridge",
+        description="Headless Serial <-> MIDI bridge (no GUI, no Qt).",
+    )
+    parser.add_argument("-c", "--config",
+                        help=f"INI file with a [{CONFIG_SECTION}] section (options override it) "
+                             f"or several [{ROUTE_SECTION_PREFIX}NAME] sections")
+    parser.add_argument("-p", "--serial-port", dest="serial_port", help="serial device, e.g. /dev/ttyUSB0 or COM3")
+    parser.add_argument("-b", "--baud", type=int, default=115200, help="serial baud rate (default: 115200)")
+    parser.add_argument("-i", "--midi-in", dest="midi_in",
+                        help="MIDI input port name (exact, else the first port containing it)")
+    parser.add_argument("-o", "--midi-out", dest="midi_out",
+                        help="MIDI output port name (exact, else the first port containing it)")
+    parser.add_argument("--virtual", action="store_true",
+                        help="create virtual MIDI ports named after the serial device instead of "
+                             "using --midi-in/--midi-out (macOS and Linux)")
+    parser.add_argument("--virtual-name", dest="virtual_name",
+                        help="name of the virtual MIDI ports (default: 'Serial MIDI <device>')")
+    parser.add_argument("--write-window-us", dest="write_window_us", type=int, default=0,
+                        help="wait up to this many microseconds to combine serial writes")
+    parser.add_argument("--running-status", dest="running_status", action="store_true",
+                        help="use running-status compression on the serial side")
+    parser.add_argument("--reconnect-timeout", dest="reconnect_timeout", type=float, default=5.0,
+                        help="seconds to wait for an unplugged serial device to come back (0: give up at once)")
+    parser.add_argument("--panic-on-corruption", dest="panic_on_corruption", action="store_true",
+                        help="send All Notes Off to MIDI Out when corrupted serial data is detected")
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help="send at most this fraction of the serial line rate, e.g. 0.9 (default: off)")
+    parser.add_argument("--pace-burst", dest="pace_burst", type=int, default=16,
+                        help="bytes sent ahead of the line when pacing (default: 16)")
+    parser.add_argument("--flow-control", dest="flow_control", choices=("rtscts", "xonxoff"),
+                        help="serial flow control (xonxoff clashes with MIDI data bytes 17 and 19)")
+    parser.add_argument("--framing", choices=("off", "auto", "on"), default="off",
+                        help="framed serial protocol with CRC (see framing.py): auto offers it on connect "
+                             "and falls back to raw MIDI (default: off)")
+    parser.add_argument("--negotiate-timeout", dest="negotiate_timeout", type=float, default=1.0,
+                        help="with --framing auto, seconds to wait for the device to accept framing (default: 1)")
+    parser.add_argument("--sysex-chunk-size", dest="sysex_chunk_size", type=int, default=0,
+                        help="write SysEx to the serial port in chunks of this many bytes (default: 0, whole)")
+    parser.add_argument("--sysex-chunk-delay", dest="sysex_chunk_delay", type=float, default=0.0,
+                        help="seconds to wait between two serial SysEx chunks, for slow firmware")
+    parser.add_argument("--sysex-max-size", dest="sysex_max_size", type=int, default=0,
+                        help="drop SysEx messages longer than this many bytes "
+                             "(default: 0, no limit from MIDI In, 1 MB from the serial port)")
+    parser.add_argument("--overflow", choices=("drop-oldest", "drop-newest", "block"), default="drop-newest",
+                        help="what to do when a message queue is full")
+    parser.add_argument("--coalesce-backlog", dest="coalesce_backlog", type=int, default=64,
+                        help="once this many messages wait for the serial port, keep only the newest "
+                             "CC/pitchbend/aftertouch values (0 disables, default: 64)")
+    parser.add_argument("--filters",
+                        help="JSON file with routing/filter/transform rules (see midifilter.py)")
+    parser.add_argument("--capture",
+                        help="record the traffic of both directions to this capture file (see capture.py)")
+    parser.add_argument("--metrics-file", dest="metrics_file",
+                        help="rewrite Prometheus-format metrics to this file every second")
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+                        help="serve Prometheus-format metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--asyncio", dest="use_asyncio", action="store_true",
+                        help="run the asyncio bridge implementation instead of the threaded one")
+    parser.add_argument("-d", "--debug", action="store_true", help="trace every message")
+    return parser
+
+
+def unsupported_options(parser, args, supported):
+    """Return the flags of options set (on the command line or in the config file) outside supported."""
+    defaults = build_parser()
+    flags = []
+    for action in parser._actions:
+        if action.dest in supported or action.dest == "help":
+            continue
+        if getattr(args, action.dest) != defaults.get_default(action.dest):
+            flags.append(action.option_strings[-1])
+    return flags
+
+
+def parse_args(argv=None):
+    parser = build_parser()
+    # Read the config file first so that command-line options take precedence
+    pre_args, _ = parser.parse_known_args(argv)
+    if pre_args.config:
+        parser.set_defaults(**read_config(pre_args.config))
+    args = parser.parse_args(argv)
+    # argparse only checks choices on the command line, not the defaults the config file set
+    for action in parser._actions:
+        value = getattr(args, action.dest, None)
+        if action.choices is not None and value is not None and value not in action.choices:
+            parser.error(f"{action.option_strings[-1]} must be one of {', '.join(action.choices)}, got '{value}'")
+    try:
+        args.routes = read_routes(args.config) if args.config else []
+    except ValueError as e:
+        parser.error(str(e))
+    if args.routes:
+        unsupported = unsupported_options(parser, args, ROUTES_MODE_OPTIONS)
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} not supported with [{ROUTE_SECTION_PREFIX}NAME] sections")
+        return args
+    if not args.serial_port:
+        parser.error("a serial port is required (--serial-port or serial_port in the config file)")
+    # Checked here rather than with an argparse type, so values from the config file are checked too
+    if not 0 <= args.pace <= 1:
+        parser.error(f"--pace must be between 0 (off) and 1, got {args.pace:g}")
+    if args.pace_burst < 1:
+        parser.error(f"--pace-burst must be at least 1, got {args.pace_burst}")
+    if args.sysex_chunk_size < 0:
+        parser.error(f"--sysex-chunk-size must be 0 (off) or more, got {args.sysex_chunk_size}")
+    if args.sysex_chunk_delay < 0:
+        parser.error(f"--sysex-chunk-delay must be 0 or more, got {args.sysex_chunk_delay:g}")
+    if args.sysex_max_size < 0:
+        parser.error(f"--sysex-max-size must be 0 (no limit) or more, got {args.sysex_max_size}")
+    if args.use_asyncio:
+        unsupported = unsupported_options(parser, args, ASYNCIO_OPTIONS)
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} not supported by the asyncio bridge")
+    if not args.midi_in and not args.midi_out and not args.virtual:
+        parser.error("at least one of --midi-in/--midi-out/--virtual is required")
+    return args
+
+
+def max_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main(argv=None):
+    started = time.perf_counter()
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+    observer = LoggingObserver()
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+
+    if args.routes:
+        return run_routes(args.routes, observer, stop_requested)
+    if args.use_asyncio:
+        return run_asyncio(args, observer)
+
+    serial_to_midi_filter = midi_to_serial_filter = None
+    if args.filters:
+        from midifilter import load_filters
+        try:
+            serial_to_midi_filter, midi_to_serial_filter = load_filters(args.filters)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load filters from {args.filters}: {e}")
+            return 1
+
+    capture = None
+    if args.capture:
+        from capture import CaptureWriter
+        capture = CaptureWriter(args.capture)
+
+    bridge = SerialMIDI(
+        serial_port_name=args.serial_port,
+        serial_baud=args.baud,
+        midi_in_name=args.midi_in,
+        midi_out_name=args.midi_out,
+        observer=observer,
+        write_window_us=args.write_window_us,
+        running_status=args.running_status,
+        overflow=args.overflow,
+        coalesce_backlog=args.coalesce_backlog,
+        panic_on_corruption=args.panic_on_corruption,
+        reconnect_timeout=args.reconnect_timeout,
+        capture=capture,
+        serial_to_midi_filter=serial_to_midi_filter,
+        midi_to_serial_filter=midi_to_serial_filter,
+        virtual_ports=args.virtual,
+        virtual_port_name=args.virtual_name,
+        flow_control=args.flow_control,
+        pace_fraction=args.pace,
+        pace_burst=args.pace_burst,
+        sysex_chunk_size=args.sysex_chunk_size,
+        sysex_chunk_delay=args.sysex_chunk_delay,
+        sysex_max_size=args.sysex_max_size,
+        framing=args.framing,
+        negotiate_timeout=args.negotiate_timeout,
+    )
+
+    if args.flow_control == "xonxoff":
+        logging.warning("XON/XOFF flow control: MIDI data bytes 17 and 19 will be taken as flow control.")
+    if not bridge.start():
+        if capture is not None:
+            capture.close()
+        return 1
+    exporter = None
+    if args.metrics_file or args.metrics_port is not None:
+        from metrics import MetricsExporter
+        exporter = MetricsExporter(bridge, path=args.metrics_file, port=args.metrics_port)
+        try:
+            exporter.start()
+        except OSError as e:
+            logging.error(f"Could not start the metrics exporter: {e}")
+            exporter.stop()
+            exporter = None
+    rss = max_rss_mb()
+    logging.debug(f"Startup took {(time.perf_counter() - started) * 1000:.1f} ms"
+                  + (f", max RSS {rss:.1f} MB" if rss is not None else ""))
+
+    # The bridge threads clear thread_running themselves when no MIDI port matched
+    while not stop_requested.wait(0.5):
+        if not bridge.thread_running or observer.failed.is_set():
+            break
+    bridge.stop()
+    pacing = bridge.pacing_stats()
+    if pacing is not None:
+        achieved = pacing["achieved_rate"]
+        logging.info(f"Serial pacing: line rate {pacing['line_rate']:.0f} B/s, target {pacing['target_rate']:.0f} B/s, "
+                     + (f"achieved {achieved:.0f} B/s" if achieved is not None else "never saturated"))
+    if capture is not None:
+        capture.close()
+        logging.info(f"{capture.records} messages captured to {capture.path}")
+    if exporter is not None:
+        exporter.stop()
+    return 1 if observer.failed.is_set() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+// Framed serial protocol for the EA Serial MIDI Bridge (see src/framing.py).
+//
+// Start the bridge with --framing auto (or "Auto-detect framing" in the GUI)
+// at 2000000 baud. The board talks raw MIDI until the bridge offers framing,
+// then batches MIDI into COBS frames with a timestamp and a CRC-16.
+// It plays a note every 250 ms and, once framing is on, echoes back the MIDI it receives.
+
+#include <Arduino.h>
+
+const long BAUD_RATE = 2000000;
+const size_t MAX_PAYLOAD = 250;        // type + timestamp + entries + CRC, as sent by the bridge
+const uint32_t FRAME_PERIOD_US = 1000; // Send a pending frame at least this often
+
+const uint8_t FRAME_MIDI = 1;
+const uint8_t HELLO[] = {0xF0, 0x7D, 0x53, 0x4D, 0x42, 0x01, 0x01, 0xF7};
+const uint8_t ACK[] = {0xF0, 0x7D, 0x53, 0x4D, 0x42, 0x02, 0x01, 0xF7};
+
+bool framed = false;
+size_t helloMatch = 0;
+
+uint8_t rxBuffer[MAX_PAYLOAD + 8];  // COBS adds at most one byte per 254
+size_t rxLength = 0;
+bool rxOverflow = false;
+
+uint8_t txPayload[MAX_PAYLOAD];
+size_t txLength = 0;
+uint32_t txStart = 0;
+
+unsigned long lastNote = 0;
+bool noteOn = false;
+
+// CRC-16/CCITT-FALSE: poly 0x1021, init 0xFFFF (binascii.crc_hqx on the host)
+uint16_t crc16(const uint8_t *data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+size_t cobsEncode(const uint8_t *in, size_t length, uint8_t *out) {
+  size_t write = 1, codeIndex = 0;
+  uint8_t code = 1;
+  for (size_t read = 0; read < length; read++) {
+    if (in[read] == 0) {
+      out[codeIndex] = code;
+      code = 1;
+      codeIndex = write++;
+    } else {
+      out[write++] = in[read];
+      if (++code == 0xFF) {
+        out[codeIndex] = code;
+        code = 1;
+        codeIndex = write++;
+      }
+    }
+  }
+  out[codeIndex] = code;
+  return write;
+}
+
+// Returns the decoded length, 0 if the frame is malformed
+size_t cobsDecode(const uint8_t *in, size_t length, uint8_t *out) {
+  size_t read = 0, write = 0;
+  while (read < length) {
+    uint8_t code = in[read++];
+    if (code == 0 || read + code - 1 > length) {
+      return 0;
+    }
+    for (uint8_t i = 1; i < code; i++) {
+      out[write++] = in[read++];
+    }
+    if (code < 0xFF && read < length) {
+      out[write++] = 0;
+    }
+  }
+  return write;
+}
+
+size_t putVarint(uint8_t *out, uint32_t value) {
+  size_t length = 0;
+  while (value >= 0x80) {
+    out[length++] = (value & 0x7F) | 0x80;
+    value >>= 7;
+  }
+  out[length++] = value;
+  return length;
+}
+
+bool getVarint(const uint8_t *data, size_t end, size_t &position, uint32_t &value) {
+  value = 0;
+  for (int shift = 0; position < end && shift < 32; shift += 7) {
+    uint8_t byte = data[position++];
+    value |= (uint32_t)(byte & 0x7F) << shift;
+    if (byte < 0x80) {
+      return true;
+    }
+  }
+  return false;
+}
+
+void flushFrame() {
+  if (txLength == 0) {
+    return;
+  }
+  uint16_t crc = crc16(txPayload, txLength);
+  txPayload[txLength++] = crc >> 8;
+  txPayload[txLength++] = crc & 0xFF;
+  uint8_t encoded[MAX_PAYLOAD + 8];
+  size_t length = cobsEncode(txPayload, txLength, encoded);
+  encoded[length++] = 0;  // Delimiter
+  Serial.write(encoded, length);
+  txLength = 0;
+}
+
+const size_t MAX_ENTRY = MAX_PAYLOAD - 5 - 10 - 2;  // Header, two varints, CRC
+
+// Queue MIDI bytes for the next frame (or send them right away in raw mode)
+void sendMidi(const uint8_t *data, size_t length) {
+  if (!framed) {
+    Serial.write(data, length);
+    return;
+  }
+  while (length > MAX_ENTRY) {  // e.g. long SysEx: split it over several entries
+    sendMidi(data, MAX_ENTRY);
+    data += MAX_ENTRY;
+    length -= MAX_ENTRY;
+  }
+  uint32_t now = micros();
+  // Room for the delta and length varints plus the CRC
+  if (txLength && txLength + 10 + length + 2 > MAX_PAYLOAD) {
+    flushFrame();
+  }
+  if (txLength == 0) {
+    txStart = now;
+    txPayload[0] = FRAME_MIDI;
+    for (int i = 0; i < 4; i++) {
+      txPayload[1 + i] = (now >> (8 * i)) & 0xFF;  // Little endian
+    }
+    txLength = 5;
+  }
+  txLength += putVarint(txPayload + txLength, now - txStart);
+  txLength += putVarint(txPayload + txLength, length);
+  memcpy(txPayload + txLength, data, length);
+  txLength += length;
+}
+
+void handleFrame(const uint8_t *encoded, size_t length) {
+  uint8_t payload[MAX_PAYLOAD + 8];
+  size_t size = cobsDecode(encoded, length, payload);
+  if (size < 7) {
+    return;
+  }
+  uint16_t crc = ((uint16_t)payload[size - 2] << 8) | payload[size - 1];
+  if (crc16(payload, size - 2) != crc || payload[0] != FRAME_MIDI) {
+    return;  // Corrupted: drop the whole frame, the next one starts clean
+  }
+  size_t position = 5;
+  size_t end = size - 2;
+  while (position < end) {
+    uint32_t delta, dataLength;
+    if (!getVarint(payload, end, position, delta) || !getVarint(payload, end, position, dataLength)
+        || position + dataLength > end) {
+      return;
+    }
+    sendMidi(payload + position, dataLength);  // Echo it back
+    position += dataLength;
+  }
+}
+
+void receiveByte(uint8_t byte) {
+  // The bridge offers framing in raw MIDI, also when it reconnects to a board already framing
+  helloMatch = (byte == HELLO[helloMatch]) ? helloMatch + 1 : (byte == HELLO[0] ? 1 : 0);
+  if (helloMatch == sizeof(HELLO)) {
+    helloMatch = 0;
+    txLength = 0;
+    rxLength = 0;
+    Serial.write(ACK, sizeof(ACK));
+    framed = true;
+    return;
+  }
+  if (!framed) {
+    return;  // This demo only echoes in framed mode
+  }
+  if (byte == 0) {
+    if (rxLength && !rxOverflow) {
+      handleFrame(rxBuffer, rxLength);
+    }
+    rxLength = 0;
+    rxOverflow = false;
+  } else if (rxLength < sizeof(rxBuffer)) {
+    rxBuffer[rxLength++] = byte;
+  } else {
+    rxOverflow = true;  // Too long for a frame: skip to the next delimiter
+  }
+}
+
+void setup() {
+  Serial.setRxBufferSize(1024);
+  Serial.begin(BAUD_RATE);
+}
+
+void loop() {
+  while (Serial.available()) {
+    receiveByte(Serial.read());
+  }
+
+  if (millis() - lastNote >= 250) {
+    lastNote = millis();
+    noteOn = !noteOn;
+    uint8_t note[] = {0x90, 60, (uint8_t)(noteOn ? 100 : 0)};
+    sendMidi(note, sizeof(note));
+  }
+
+  if (framed && txLength && micros() - txStart >= FRAME_PERIOD_US) {
+    flushFrame();
+  }
+}
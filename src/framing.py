@@ -0,0 +1,174 @@
+"""Framed binary serial protocol: batches of MIDI in COBS frames with timestamps and a CRC.
+
+Raw MIDI has no integrity check, so a flipped bit silently turns into a
+wrong note, which keeps links at conservative baud rates. In framed mode
+every frame is COBS encoded and ends with a 0x00 delimiter, so a receiver
+resynchronizes at the next zero byte whatever it lost. Decoded, a frame is::
+
+    type       u8      1: MIDI
+    timestamp  u32     sender clock in microseconds (little endian, wraps)
+    entries            until the CRC:
+        delta  varint  microseconds after timestamp
+        length varint  size of data
+        data   bytes   raw MIDI bytes, any number of messages (SysEx may span entries)
+    crc        u16     CRC-16/CCITT-FALSE of everything before it (big endian)
+
+Framing is negotiated in raw MIDI, so devices that do not know about it
+are unaffected: the host sends the HELLO SysEx and a device that supports
+it answers with ACK, after which both sides only send frames.
+"""
+import binascii
+import time
+
+from capture import encode_varint, decode_varint
+
+FRAME_MIDI = 1
+FRAME_MAX_DATA = 240  # MIDI bytes per frame, so a frame fits a 256-byte device buffer
+# Non-commercial SysEx (ID 0x7D) "SMB" + command + protocol version
+HELLO = bytes([0xf0, 0x7d, 0x53, 0x4d, 0x42, 0x01, 0x01, 0xf7])
+ACK = bytes([0xf0, 0x7d, 0x53, 0x4d, 0x42, 0x02, 0x01, 0xf7])
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), computed in C by binascii."""
+    return binascii.crc_hqx(data, 0xffff)
+
+
+def cobs_encode(data):
+    """Return data COBS encoded (no zero bytes), without the trailing delimiter."""
+    out = bytearray()
+    for block in bytes(data).split(b"\0"):
+        # Every block but the last one stood in front of a zero byte
+        while len(block) >= 254:
+            out.append(0xff)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return out
+
+
+def cobs_decode(data):
+    """Undo cobs_encode; raises ValueError on a malformed frame."""
+    out = bytearray()
+    position = 0
+    end = len(data)
+    while position < end:
+        code = data[position]
+        if code == 0:
+            raise ValueError("zero byte inside a COBS frame")
+        position += 1
+        block_end = position + code - 1
+        if block_end > end:
+            raise ValueError("truncated COBS frame")
+        out += data[position:block_end]
+        position = block_end
+        if code < 0xff and position < end:
+            out.append(0)
+    return out
+
+
+class FrameEncoder:
+    """Pack batches of MIDI messages into delimited frames for one write."""
+
+    def __init__(self, max_data=FRAME_MAX_DATA):
+        self.max_data = max_data
+        self._epoch = time.perf_counter()
+        self.frames = 0
+
+    def timestamp(self):
+        return int((time.perf_counter() - self._epoch) * 1_000_000) & 0xffffffff
+
+    def encode(self, messages, timestamp=None):
+        """Return a bytearray holding the messages in as few frames as fit max_data bytes each."""
+        data = bytearray()
+        for message in messages:
+            data += bytes(message)
+        return self.encode_bytes(data, timestamp)
+
+    def encode_bytes(self, data, timestamp=None):
+        """Frame raw MIDI bytes that all share one timestamp."""
+        if timestamp is None:
+            timestamp = self.timestamp()
+        out = bytearray()
+        view = memoryview(data)
+        for offset in range(0, len(data), self.max_data):
+            chunk = view[offset:offset + self.max_data]
+            payload = bytearray((FRAME_MIDI,))
+            payload += timestamp.to_bytes(4, "little")
+            payload.append(0)  # Delta: the host has one timestamp per batch
+            encode_varint(len(chunk), payload)
+            payload += chunk
+            payload += crc16(payload).to_bytes(2, "big")
+            out += cobs_encode(payload)
+            out.append(0)
+            self.frames += 1
+        return out
+
+
+class FrameDecoder:
+    """Split a serial byte stream into frames and yield the MIDI data they carry.
+
+    Frames with a bad COBS encoding, a wrong CRC or an unknown type are
+    dropped whole and counted; bytes piling up without a delimiter are
+    discarded once they exceed max_frame.
+    """
+
+    def __init__(self, max_frame=1024):
+        self.max_frame = max_frame
+        self._buffer = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.bad_frames = 0
+        self.dropped_bytes = 0
+
+    @property
+    def errors(self):
+        return self.crc_errors + self.bad_frames
+
+    def reset(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Consume a chunk of serial bytes and yield (timestamp in µs, MIDI bytes) per frame entry."""
+        buffer = self._buffer
+        buffer += data
+        if 0 not in data:
+            if len(buffer) > self.max_frame:
+                self.dropped_bytes += len(buffer)
+                self.bad_frames += 1
+                self._buffer = bytearray()
+            return
+        *frames, self._buffer = buffer.split(b"\0")
+        for encoded in frames:
+            if encoded:  # Back-to-back delimiters are just idle fill
+                yield from self._decode(encoded)
+
+    def _decode(self, encoded):
+        try:
+            payload = cobs_decode(encoded)
+        except ValueError:
+            self.bad_frames += 1
+            self.dropped_bytes += len(encoded)
+            return
+        if len(payload) < 7 or crc16(payload[:-2]) != int.from_bytes(payload[-2:], "big"):
+            self.crc_errors += 1
+            self.dropped_bytes += len(encoded)
+            return
+        if payload[0] != FRAME_MIDI:
+            self.bad_frames += 1
+            return
+        self.frames += 1
+        timestamp = int.from_bytes(payload[1:5], "little")
+        position = 5
+        end = len(payload) - 2
+        try:
+            while position < end:
+                delta, position = decode_varint(payload, position)
+                length, position = decode_varint(payload, position)
+                if position + length > end:
+                    raise IndexError
+                yield (timestamp + delta) & 0xffffffff, payload[position:position + length]
+                position += length
+        except IndexError:
+            self.bad_frames += 1  # CRC was right, so the sender built a bad frame
@@ -1,20 +1,26 @@
 import sys
 import threading
 import logging
-import serialmidi
 import os
+import collections
+import json
+import time
+from activity import ActivitySampler
+from bridgeobserver import BridgeObserver
+from portmanager import PortManager
 from PyQt6 import QtWidgets, QtCore, QtGui
 from PyQt6.QtGui import QTextCursor
 from PyQt6.QtCore import Qt, pyqtSignal
-from serial.tools import list_ports
-import rtmidi
 
 
-class SerialMIDIApp(QtWidgets.QWidget):
-    log_signal = pyqtSignal(str)
-    led_blink_signal = pyqtSignal(str)
-    midi_in_led_blink_signal = QtCore.pyqtSignal(str)
-    midi_out_led_blink_signal = QtCore.pyqtSignal(str)
+class SerialMIDIApp(QtWidgets.QWidget, BridgeObserver):
+    bridge_error_signal = pyqtSignal(object, str)
+    ports_changed_signal = pyqtSignal(list, list, bool)
+    ACTIVITY_INTERVAL_MS = 50  # LED refresh rate, independent of MIDI traffic
+    LOG_INTERVAL_MS = 100      # Debug view refresh rate
+    LOG_LINES_PER_TICK = 200   # Lines appended to the debug view per refresh
+    LOG_MAX_LINES = 2000       # Lines kept in the debug view
+    STATS_INTERVAL_MS = 1000   # Stats panel refresh rate
 
     def __init__(self):
         super().__init__()
@@ -26,14 +32,42 @@ class SerialMIDIApp(QtWidgets.QWidget):
 
         self.refresh_button = QtWidgets.QPushButton("Refresh Ports")
         self.refresh_button.setObjectName("refreshButton")
-        self.refresh_button.clicked.connect(self.refresh_serial_ports)
+        self.refresh_button.clicked.connect(self.rescan_ports)
 
-        self.initUI()
+        # Cached port lists, scanned in the background: the first scan fills the
+        # dropdowns once the window is up, later ones notice hot-plugging
+        self.port_manager = PortManager()
+        self.port_manager.listeners.append(self.ports_changed_signal.emit)
+        self.ports_changed_signal.connect(self.on_ports_changed)
+        self.ports_listed = False
+        self.ports_scan_started = False
+
+        # Last-used ports and options, restored on the next run
+        self.settings = QtCore.QSettings("EA", "Serial MIDI Bridge")
+
+        # The running bridge, read by initUI's first stats refresh
         self.serial_midi = None
-        self.log_signal.connect(self.log_message)
-        self.led_blink_signal.connect(self.blink_led)
-        self.midi_in_led_blink_signal.connect(self.blink_midi_in_led)
-        self.midi_out_led_blink_signal.connect(self.blink_midi_out_led)
+        self.activity_sampler = None
+
+        self.initUI()
+        self.restore_settings()
+        self._led_state = {"serial": "gray", "midi_in": "#444", "midi_out": "#444"}
+        self.bridge_error_signal.connect(self.on_bridge_error)
+
+        # Log lines are queued by GuiLogHandler and appended in batches
+        self.pending_log_lines = collections.deque(maxlen=self.LOG_MAX_LINES)
+        self.log_timer = QtCore.QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(self.LOG_INTERVAL_MS)
+
+        # Sample the bridge activity counters at a fixed rate to drive the LEDs
+        self.activity_timer = QtCore.QTimer(self)
+        self.activity_timer.timeout.connect(self.update_activity)
+        self.activity_timer.start(self.ACTIVITY_INTERVAL_MS)
+
+        self.stats_timer = QtCore.QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(self.STATS_INTERVAL_MS)
 
         # Set up logging handler ONCE here
         logging.getLogger().handlers.clear()
@@ -41,11 +75,20 @@ class SerialMIDIApp(QtWidgets.QWidget):
         # Set initial level based on checkbox
         self.update_logging_level()
 
+    def paintEvent(self, event):
+        """Start the port scan once the window is on screen, so its imports don't delay it."""
+        super().paintEvent(event)
+        if not self.ports_scan_started:
+            self.ports_scan_started = True
+            QtCore.QTimer.singleShot(0, self.port_manager.start)
+
     def closeEvent(self, event):
         """Handle the window close event to clean up resources."""
         if self.serial_midi:
             self.serial_midi.stop()  # Stop the Serial MIDI bridge
             self.serial_midi = None
+        self.save_settings()
+        self.port_manager.stop()
         logging.info("Application closed.")
         QtWidgets.QApplication.quit()  # Ensure the application terminates completely
         event.accept()  # Ensure the window closes
@@ -70,7 +113,6 @@ class SerialMIDIApp(QtWidgets.QWidget):
         layout.addLayout(port_layout)
 
         self.port_dropdown = QtWidgets.QComboBox()
-        self.refresh_serial_ports()
         layout.addWidget(self.port_dropdown)
 
         # MIDI Out Port Selection
@@ -105,23 +147,35 @@ class SerialMIDIApp(QtWidgets.QWidget):
         self.midi_in_dropdown.addItem("Not Connected")
         layout.addWidget(self.midi_in_dropdown)
 
-        # Refresh MIDI Ports after defining the dropdowns
-        self.refresh_midi_ports()
-
         # Baud Rate Input
         self.baud_label = QtWidgets.QLabel("Baud Rate")
         layout.addWidget(self.baud_label)
 
         self.baud_dropdown = QtWidgets.QComboBox()
-        self.baud_dropdown.addItems(["9600", "19200","31250", "38400", "57600", "115200"])
+        self.baud_dropdown.addItems(["9600", "19200","31250", "38400", "57600", "115200",
+                                     "230400", "460800", "921600", "1000000", "2000000"])
         self.baud_dropdown.setCurrentText("115200")  # Set default value
         layout.addWidget(self.baud_dropdown)
 
+        # Framed protocol: "Auto" offers it on connect, raw MIDI devices simply do not answer
+        layout.addWidget(QtWidgets.QLabel("Serial Protocol"))
+        self.framing_dropdown = QtWidgets.QComboBox()
+        self.framing_dropdown.addItem("Raw MIDI", "off")
+        self.framing_dropdown.addItem("Auto-detect framing", "auto")
+        self.framing_dropdown.addItem("Framed", "on")
+        layout.addWidget(self.framing_dropdown)
+
         # Debug Checkbox
         layout.addSpacing(12)  
         self.debug_checkbox = QtWidgets.QCheckBox("Debug")
         self.debug_checkbox.stateChanged.connect(self.update_logging_level)
         layout.addWidget(self.debug_checkbox)
+        # Run the bridge in its own process so GUI work cannot delay forwarding
+        self.isolate_checkbox = QtWidgets.QCheckBox("Run bridge in a separate process")
+        layout.addWidget(self.isolate_checkbox)
+        # Create "Serial MIDI <device>" ports instead of using the MIDI dropdowns
+        self.virtual_checkbox = QtWidgets.QCheckBox("Virtual MIDI ports")
+        layout.addWidget(self.virtual_checkbox)
         layout.addSpacing(12) 
         # Toggle Button
         self.toggle_button = QtWidgets.QPushButton("START")
@@ -133,49 +187,149 @@ class SerialMIDIApp(QtWidgets.QWidget):
         self.toggle_button.clicked.connect(self.toggle_serial_midi)
         layout.addWidget(self.toggle_button)
 
+        # Message rates, refreshed from the activity counters
+        self.rate_label = QtWidgets.QLabel()
+        self.rate_label.setObjectName("rateLabel")
+        layout.addWidget(self.rate_label)
+        self.set_rate_text(None)
+
+        # Bridge metrics: bytes, errors, queue depth and latency
+        self.stats_label = QtWidgets.QLabel()
+        self.stats_label.setObjectName("statsLabel")
+        layout.addWidget(self.stats_label)
+        self.update_stats()
+
         layout.addSpacing(8) 
         
         # Debugging Text Box
         self.debug_text_box = QtWidgets.QTextEdit()
         self.debug_text_box.setReadOnly(True)
         self.debug_text_box.setPlaceholderText("Debug output will appear here...")
+        self.debug_text_box.document().setMaximumBlockCount(self.LOG_MAX_LINES)
         layout.addWidget(self.debug_text_box)
 
         self.setLayout(layout)
 
     def log_message(self, message):
         """Log a message to the debugging text box and ensure it scrolls to the bottom."""
-        self.debug_text_box.append(message)
+        cursor = self.debug_text_box.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not self.debug_text_box.document().isEmpty():
+            message = "\n" + message
+        cursor.insertText(message)
         self.debug_text_box.moveCursor(QTextCursor.MoveOperation.End)
 
-    def blink_led(self, color):
-        self.set_led_color(color)
-        QtCore.QTimer.singleShot(100, lambda: self.set_led_color("gray"))
+    def flush_log(self):
+        """Append up to LOG_LINES_PER_TICK queued log lines in a single edit."""
+        if not self.pending_log_lines:
+            return
+        lines = []
+        while self.pending_log_lines and len(lines) < self.LOG_LINES_PER_TICK:
+            lines.append(self.pending_log_lines.popleft())
+        self.log_message("\n".join(lines))
+
+    def set_midi_led_color(self, led, color):
+        led.setStyleSheet(f"background: {color}; border-radius: 8px;")
+
+    def set_rate_text(self, rates):
+        if rates is None:
+            self.rate_label.setText("Serial in/out: -  |  MIDI in/out: -")
+            return
+        self.rate_label.setText(
+            f"Serial in/out: {rates['serial_in']:.0f}/{rates['serial_out']:.0f} msg/s  |  "
+            f"MIDI in/out: {rates['midi_in']:.0f}/{rates['midi_out']:.0f} msg/s"
+        )
 
-    def blink_midi_in_led(self, color):
-        self.midi_in_led.setStyleSheet(f"background: {color}; border-radius: 8px;")
-        QtCore.QTimer.singleShot(100, lambda: self.midi_in_led.setStyleSheet("background: #444; border-radius: 8px;"))
+    def update_stats(self):
+        """Refresh the stats panel from the bridge metrics."""
+        bridge = self.serial_midi
+        if bridge is None:
+            self.stats_label.setText("Bytes serial in/out: -  |  Corruptions: -\nQueued: -  |  Latency p50/p99: -")
+            return
+
+        def ms(value):
+            if value is None:
+                return "-"
+            return f"<{value * 1000:g}" if value != float("inf") else ">1000"
+
+        stats = bridge.summary()
+        self.stats_label.setText(
+            f"Bytes serial in/out: {stats['serial_in_bytes']}/{stats['serial_out_bytes']}  |  "
+            f"Corruptions: {stats['corruptions']} ({stats['dropped_bytes']} bytes dropped)\n"
+            f"Queued to serial/MIDI: {stats['queued_to_serial']}/{stats['queued_to_midi']}  |  "
+            f"Latency p50/p99 ms: to serial {ms(stats['latency_to_serial_p50'])}/{ms(stats['latency_to_serial_p99'])}, "
+            f"to MIDI {ms(stats['latency_to_midi_p50'])}/{ms(stats['latency_to_midi_p99'])}"
+        )
 
-    def blink_midi_out_led(self, color):
-        self.midi_out_led.setStyleSheet(f"background: {color}; border-radius: 8px;")
-        QtCore.QTimer.singleShot(100, lambda: self.midi_out_led.setStyleSheet("background: #444; border-radius: 8px;"))
+    def update_activity(self):
+        """Drive the LEDs and rate display from the bridge activity counters."""
+        if self.serial_midi is None:
+            if self.activity_sampler is not None:
+                self.activity_sampler = None
+                self.set_rate_text(None)
+            active = {}
+        else:
+            if self.activity_sampler is None or self.activity_sampler.counters is not self.serial_midi.activity:
+                self.activity_sampler = ActivitySampler(self.serial_midi.activity)
+            active = self.activity_sampler.sample()
+            self.set_rate_text(self.activity_sampler.rates)
+
+        # Serial LED: green for incoming, yellow for outgoing
+        if active.get("serial_in"):
+            serial_color = "#2ecc71"
+        elif active.get("serial_out"):
+            serial_color = "#f1c40f"
+        else:
+            serial_color = "gray"
+        midi_in_color = "#f1c40f" if active.get("midi_in") else "#444"
+        midi_out_color = "#2ecc71" if active.get("midi_out") else "#444"
+
+        # Only restyle the widgets whose state actually changed
+        for key, color, setter in (
+            ("serial", serial_color, self.set_led_color),
+            ("midi_in", midi_in_color, lambda c: self.set_midi_led_color(self.midi_in_led, c)),
+            ("midi_out", midi_out_color, lambda c: self.set_midi_led_color(self.midi_out_led, c)),
+        ):
+            if self._led_state.get(key) != color:
+                self._led_state[key] = color
+                setter(color)
+
+    def rescan_ports(self):
+        """Rescan serial and MIDI ports now instead of waiting for the next background scan."""
+        self.port_manager.rescan()
+
+    def on_ports_changed(self, added, removed, midi_changed):
+        """Update the dropdowns after a device was plugged in or out, or the first scan finished."""
+        first_scan = not self.ports_listed
+        self.ports_listed = True
+        if not first_scan:
+            for device in removed:
+                logging.info(f"Serial port removed: {device}")
+            for device in added:
+                logging.info(f"Serial port added: {device}")
+        # The first scan also drops a remembered port that is no longer there
+        if added or removed or first_scan:
+            self.refresh_serial_ports()
+        if midi_changed:
+            self.refresh_midi_ports()
 
     def refresh_serial_ports(self):
         """Refresh the list of available serial ports."""
+        current = self.port_dropdown.currentText()
         self.port_dropdown.clear()
-        ports = list_ports.comports()
-        for port in ports:
+        for port in self.port_manager.snapshot()[0]:
             self.port_dropdown.addItem(port.device)
+        if self.port_dropdown.findText(current) != -1:
+            self.port_dropdown.setCurrentText(current)
 
     def refresh_midi_ports(self):
-        midi_out = rtmidi.MidiOut()
-        midi_in = rtmidi.MidiIn()
+        _, midi_in_ports, midi_out_ports = self.port_manager.snapshot()
 
         # Populate MIDI Out dropdown
         current_out = self.midi_out_dropdown.currentText()
         self.midi_out_dropdown.clear()
         self.midi_out_dropdown.addItem("Not Connected")
-        for port in midi_out.get_ports():
+        for port in midi_out_ports:
             self.midi_out_dropdown.addItem(port)
         if current_out in [self.midi_out_dropdown.itemText(i) for i in range(self.midi_out_dropdown.count())]:
             self.midi_out_dropdown.setCurrentText(current_out)
@@ -184,7 +338,7 @@ class SerialMIDIApp(QtWidgets.QWidget):
         current_in = self.midi_in_dropdown.currentText()
         self.midi_in_dropdown.clear()
         self.midi_in_dropdown.addItem("Not Connected")
-        for port in midi_in.get_ports():
+        for port in midi_in_ports:
             self.midi_in_dropdown.addItem(port)
         if current_in in [self.midi_in_dropdown.itemText(i) for i in range(self.midi_in_dropdown.count())]:
             self.midi_in_dropdown.setCurrentText(current_in)
@@ -202,13 +356,22 @@ class SerialMIDIApp(QtWidgets.QWidget):
             # Update level based on checkbox
             self.update_logging_level()
 
-            self.serial_midi = serialmidi.SerialMIDI(
-                gui=self,
+            options = dict(
                 serial_port_name=serial_port_name,
                 serial_baud=baud_rate,
                 midi_in_name=midi_in_name,
                 midi_out_name=midi_out_name,
+                virtual_ports=self.virtual_checkbox.isChecked(),
+                framing=self.framing_dropdown.currentData(),
             )
+            self.save_settings()
+            # Imported on first start rather than at launch, to get the window up sooner
+            if self.isolate_checkbox.isChecked():
+                import bridgeprocess
+                self.serial_midi = bridgeprocess.BridgeProcess(observer=self, **options)
+            else:
+                import serialmidi
+                self.serial_midi = serialmidi.SerialMIDI(observer=self, port_manager=self.port_manager, **options)
 
             threading.Thread(target=self.serial_midi.start).start()
 
@@ -230,11 +393,53 @@ class SerialMIDIApp(QtWidgets.QWidget):
             self.toggle_button.style().polish(self.toggle_button)
             logging.info("Serial MIDI Bridge stopped.")
 
+    def bridge_error(self, bridge, message):
+        # Called from a bridge thread; hand over to the GUI thread
+        self.bridge_error_signal.emit(bridge, message)
+
+    def on_bridge_error(self, bridge, message):
+        """Return to the stopped state when the running bridge fails."""
+        if bridge is self.serial_midi:
+            self.toggle_serial_midi()
+
+    def restore_settings(self):
+        """Select the ports and options of the last run; the ports show before the first scan lists them."""
+        settings = self.settings
+        serial_port = settings.value("serial_port", "", type=str)
+        if serial_port:
+            self.port_dropdown.addItem(serial_port)
+        for dropdown, key in ((self.midi_in_dropdown, "midi_in"), (self.midi_out_dropdown, "midi_out")):
+            name = settings.value(key, "", type=str)
+            if name and dropdown.findText(name) == -1:
+                dropdown.addItem(name)
+            if name:
+                dropdown.setCurrentText(name)
+        baud = settings.value("baud", "", type=str)
+        if self.baud_dropdown.findText(baud) != -1:
+            self.baud_dropdown.setCurrentText(baud)
+        framing = self.framing_dropdown.findData(settings.value("framing", "off", type=str))
+        if framing != -1:
+            self.framing_dropdown.setCurrentIndex(framing)
+        self.isolate_checkbox.setChecked(settings.value("isolate", False, type=bool))
+        self.virtual_checkbox.setChecked(settings.value("virtual", False, type=bool))
+
+    def save_settings(self):
+        settings = self.settings
+        settings.setValue("serial_port", self.port_dropdown.currentText())
+        settings.setValue("midi_in", self.midi_in_dropdown.currentText())
+        settings.setValue("midi_out", self.midi_out_dropdown.currentText())
+        settings.setValue("baud", self.baud_dropdown.currentText())
+        settings.setValue("framing", self.framing_dropdown.currentData())
+        settings.setValue("isolate", self.isolate_checkbox.isChecked())
+        settings.setValue("virtual", self.virtual_checkbox.isChecked())
+
     def update_logging_level(self):
         if self.debug_checkbox.isChecked():
             logging.getLogger().setLevel(logging.DEBUG)
         else:
             logging.getLogger().setLevel(logging.INFO)
+        if self.serial_midi is not None:
+            self.serial_midi.trace.enabled = self.debug_checkbox.isChecked()
 
     def set_led_color(self, color):
         pixmap = QtGui.QPixmap(14, 14)
@@ -256,8 +461,37 @@ class GuiLogHandler(logging.Handler):
 
     def emit(self, record):
         log_entry = self.format(record)
-        # Use the signal to update the GUI safely
-        self.gui.log_signal.emit(log_entry)
+        # Queue the lines; the GUI appends them in batches from its own thread
+        self.gui.pending_log_lines.extend(log_entry.split("\n"))
+
+
+class StartupProbe(QtCore.QObject):
+    """Print when the window first paints and the port lists arrive, then quit (for startupbench.py)."""
+
+    # Modules a fast start leaves for later
+    DEFERRED_MODULES = ("serial", "rtmidi", "serialmidi", "bridgeprocess")
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.times = {}
+        window.installEventFilter(self)
+        window.ports_changed_signal.connect(self.ports_listed)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Type.Paint and "first_paint" not in self.times:
+            self.times["first_paint"] = time.time()
+            self.times["imported_at_paint"] = [name for name in self.DEFERRED_MODULES if name in sys.modules]
+            self.report()
+        return False
+
+    def ports_listed(self, *args):
+        self.times.setdefault("ports_listed", time.time())
+        self.report()
+
+    def report(self):
+        if "first_paint" in self.times and "ports_listed" in self.times:
+            print(json.dumps(self.times), flush=True)
+            QtWidgets.QApplication.quit()
 
 
 def main():
@@ -269,6 +503,8 @@ def main():
         app.setStyleSheet(f.read())
 
     ex = SerialMIDIApp()
+    if os.environ.get("SERIALMIDI_STARTUP_PROBE"):
+        probe = StartupProbe(ex)
     ex.show()
     sys.exit(app.exec())
 
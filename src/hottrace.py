@@ -0,0 +1,78 @@
+import logging
+import queue
+import threading
+
+from ringbuffer import RingBuffer
+
+
+class HotTrace:
+    """Message trace for the bridge hot path.
+
+    Callers check ``trace.enabled`` before calling record(), so a disabled
+    trace costs a single attribute test. When enabled, record() only copies
+    the raw bytes into a bounded ring buffer; a background thread formats
+    them in batches and hands them to logging as one record per batch.
+
+    RingBuffer takes a single producer, so each kind has its own buffer and
+    must only be recorded from one thread (serial_watcher for SERIAL_IN, the
+    rtmidi callback for MIDI_IN). Lines of different kinds may therefore come
+    out of order relative to each other within a batch.
+    """
+
+    SERIAL_IN = 0
+    SERIAL_OUT = 1
+    MIDI_IN = 2
+    MIDI_OUT = 3
+    LABELS = ("SERIAL IN", "SERIAL OUT", "MIDI IN", "MIDI OUT")
+
+    def __init__(self, formatter, capacity=1 << 16, batch_size=256, interval=0.1):
+        self.formatter = formatter  # Turns a message (list of ints) into text
+        self.batch_size = batch_size
+        self.interval = interval
+        self.enabled = False
+        self._ready = threading.Event()
+        self._records = [RingBuffer(capacity, "drop-newest", self._ready) for _ in self.LABELS]
+        self._running = False
+        self._thread = None
+
+    @property
+    def dropped(self):
+        return sum(records.dropped for records in self._records)
+
+    def record(self, kind, message):
+        """Queue a message for tracing; never blocks and never formats."""
+        self._records[kind].put_nowait(message)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._consume, name="hottrace", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        for records in self._records:
+            records.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _pending(self):
+        return any(not records.empty() for records in self._records)
+
+    def _consume(self):
+        while self._running or self._pending():
+            self._ready.clear()
+            if not self._pending() and not self._ready.wait(self.interval):
+                continue
+            lines = []
+            for kind, records in enumerate(self._records):
+                while len(lines) < self.batch_size:
+                    try:
+                        message = records.get_nowait()
+                    except queue.Empty:
+                        break
+                    lines.append(f"{self.LABELS[kind]}: {self.formatter(message)}")
+            if lines:
+                logging.debug("\n".join(lines))
@@ -0,0 +1,257 @@
+import bisect
+import http.server
+import logging
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 1.0)
+WRITE_BUCKETS = (10e-6, 25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 100e-3)
+
+
+class Histogram:
+    """Fixed-bucket histogram written by a single thread.
+
+    observe() is a bisect and two adds with no locking; readers may see a
+    count that is one observation ahead of the buckets, which is harmless
+    for monitoring.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, None if empty (inf past the last bucket)."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class LatencyProbe:
+    """Sampled latency of a RingBuffer lane, without timestamping every message.
+
+    The producer stamps the message it just queued, but only when no stamped
+    message is still in flight; the consumer observes the elapsed time once
+    it has delivered that message. Only the producer sets the probe and only
+    the consumer clears it, so no lock is needed.
+    """
+
+    def __init__(self, lane, histogram):
+        self.lane = lane
+        self.histogram = histogram
+        self._pending = None  # (put count of the stamped message, time it entered the bridge)
+
+    def stamp(self, since):
+        if self._pending is None:
+            self._pending = (self.lane.put_count, since)
+
+    def check(self):
+        pending = self._pending
+        if pending is not None and self.lane.get_count >= pending[0]:
+            self.histogram.observe(time.perf_counter() - pending[1])
+            self._pending = None
+
+
+class BridgeMetrics:
+    """Byte counters and latency histograms of one SerialMIDI bridge.
+
+    Every field has exactly one writer thread, like ActivityCounters, so the
+    hot path only does plain adds. Message counts live in bridge.activity.
+    """
+
+    def __init__(self, bridge):
+        self.serial_in_bytes = 0   # serial_watcher
+        self.serial_out_bytes = 0  # serial_writer
+        self.midi_in_bytes = 0     # rtmidi callback
+        self.midi_out_bytes = 0    # midi_watcher
+        self.serial_write_seconds = Histogram(WRITE_BUCKETS)
+        self.latency = {"midi_to_serial": Histogram(), "serial_to_midi": Histogram()}
+        self.midiin_probe = LatencyProbe(bridge.midiin_message_queue, self.latency["midi_to_serial"])
+        self.midiin_realtime_probe = LatencyProbe(bridge.midiin_realtime_queue, self.latency["midi_to_serial"])
+        self.midiout_probe = LatencyProbe(bridge.midiout_message_queue, self.latency["serial_to_midi"])
+        self.midiout_realtime_probe = LatencyProbe(bridge.midiout_realtime_queue, self.latency["serial_to_midi"])
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, histogram, **labels):
+    lines = []
+    counts = list(histogram.counts)
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=f'{bound:g}')} {cumulative}")
+    cumulative += counts[-1]
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels) if labels else ''} {histogram.sum:.9f}")
+    lines.append(f"{name}_count{_labels(**labels) if labels else ''} {cumulative}")
+    return lines
+
+
+def render_prometheus(bridge):
+    """Return the bridge metrics in the Prometheus text exposition format."""
+    metrics = bridge.metrics
+    activity = bridge.activity
+    lines = ["# TYPE serialmidi_messages_total counter"]
+    for port in activity.PORTS:
+        lines.append(f"serialmidi_messages_total{_labels(port=port)} {getattr(activity, port)}")
+    lines.append("# TYPE serialmidi_bytes_total counter")
+    for port in activity.PORTS:
+        lines.append(f"serialmidi_bytes_total{_labels(port=port)} {getattr(metrics, port + '_bytes')}")
+
+    parser = bridge.parser
+    lines += [
+        "# TYPE serialmidi_parse_errors_total counter",
+        f"serialmidi_parse_errors_total {parser.errors}",
+        "# TYPE serialmidi_dropped_bytes_total counter",
+        f"serialmidi_dropped_bytes_total {parser.dropped_bytes}",
+        "# TYPE serialmidi_corruptions_total counter",
+        f"serialmidi_corruptions_total {parser.corruptions}",
+        "# TYPE serialmidi_panics_total counter",
+        f"serialmidi_panics_total {bridge.panics}",
+        "# TYPE serialmidi_sysex_dropped_total counter",
+        f"serialmidi_sysex_dropped_total{_labels(direction='serial_to_midi')} {parser.sysex_dropped}",
+        f"serialmidi_sysex_dropped_total{_labels(direction='midi_to_serial')} {bridge.sysex_dropped}",
+        "# TYPE serialmidi_sysex_aborted_total counter",
+        f"serialmidi_sysex_aborted_total {parser.sysex_aborted}",
+    ]
+
+    queues = bridge.queue_stats()
+    lines.append("# TYPE serialmidi_queue_messages gauge")
+    for name, stats in queues.items():
+        lines.append(f"serialmidi_queue_messages{_labels(queue=name)} {stats['messages']}")
+    lines.append("# TYPE serialmidi_queue_bytes gauge")
+    for name, stats in queues.items():
+        lines.append(f"serialmidi_queue_bytes{_labels(queue=name)} {stats['occupancy']}")
+    lines.append("# TYPE serialmidi_queue_dropped_total counter")
+    for name, stats in queues.items():
+        lines.append(f"serialmidi_queue_dropped_total{_labels(queue=name)} {stats['dropped']}")
+
+    write_stats = bridge.write_stats
+    lines += [
+        "# TYPE serialmidi_serial_writes_total counter",
+        f"serialmidi_serial_writes_total {write_stats['writes']}",
+        "# TYPE serialmidi_coalesced_total counter",
+        f"serialmidi_coalesced_total {write_stats['coalesced']}",
+        "# TYPE serialmidi_filtered_total counter",
+    ]
+    for direction, message_filter in (("serial_to_midi", bridge.serial_to_midi_filter),
+                                      ("midi_to_serial", bridge.midi_to_serial_filter)):
+        dropped = message_filter.dropped if message_filter is not None else 0
+        lines.append(f"serialmidi_filtered_total{_labels(direction=direction)} {dropped}")
+
+    pacing = bridge.pacing_stats()
+    if pacing is not None:
+        lines += [
+            "# TYPE serialmidi_pacing_bytes_per_second gauge",
+            f"serialmidi_pacing_bytes_per_second{_labels(rate='line')} {pacing['line_rate']:g}",
+            f"serialmidi_pacing_bytes_per_second{_labels(rate='target')} {pacing['target_rate']:g}",
+            f"serialmidi_pacing_bytes_per_second{_labels(rate='achieved')} {pacing['achieved_rate'] or 0:g}",
+            "# TYPE serialmidi_pacing_wait_seconds_total counter",
+            f"serialmidi_pacing_wait_seconds_total {pacing['wait_time']:.6f}",
+        ]
+
+    encoder, decoder = bridge.frame_encoder, bridge.frame_decoder
+    lines += [
+        "# TYPE serialmidi_framed gauge",
+        f"serialmidi_framed {int(bridge.framed)}",
+        "# TYPE serialmidi_frames_total counter",
+        f"serialmidi_frames_total{_labels(direction='serial_to_midi')} {decoder.frames}",
+        f"serialmidi_frames_total{_labels(direction='midi_to_serial')} {encoder.frames}",
+        "# TYPE serialmidi_frame_errors_total counter",
+        f"serialmidi_frame_errors_total{_labels(kind='crc')} {decoder.crc_errors}",
+        f"serialmidi_frame_errors_total{_labels(kind='malformed')} {decoder.bad_frames}",
+    ]
+
+    lines.append("# TYPE serialmidi_serial_write_seconds histogram")
+    lines += _histogram_lines("serialmidi_serial_write_seconds", metrics.serial_write_seconds)
+    lines.append("# TYPE serialmidi_latency_seconds histogram")
+    for direction, histogram in metrics.latency.items():
+        lines += _histogram_lines("serialmidi_latency_seconds", histogram, direction=direction)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Publish render_prometheus() to a file, a localhost HTTP port, or both.
+
+    The file is rewritten every interval seconds (atomically, for node
+    exporter's textfile collector); the HTTP endpoint renders on request.
+    Both run on their own daemon threads and only read the bridge counters.
+    """
+
+    def __init__(self, bridge, path=None, port=None, interval=1.0, host="127.0.0.1"):
+        self.bridge = bridge
+        self.path = path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self._stop = threading.Event()
+        self._writer = None
+        self._server = None
+
+    def start(self):
+        if self.path:
+            self._writer = threading.Thread(target=self._write_loop, name="metrics-file", daemon=True)
+            self._writer.start()
+        if self.port is not None:
+            exporter = self
+
+            class Handler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = render_prometheus(exporter.bridge).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # Keep scrapes out of the bridge log
+
+            self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+            self.port = self._server.server_address[1]  # In case port 0 picked a free one
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write_file()
+
+    def write_file(self):
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w") as f:
+                f.write(render_prometheus(self.bridge))
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logging.error(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self.write_file()  # Leave the final values behind
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,300 @@
+"""Routing, filter and transform rules applied to messages crossing the bridge.
+
+Rules are listed per direction in a JSON file::
+
+    {
+        "serial_to_midi": [
+            {"filter": ["active_sensing", "clock"]},
+            {"channel_map": {"1": 2}},
+            {"zone": {"notes": [0, 59], "to_channel": 3, "transpose": 12}, "channels": [2]},
+            {"velocity": {"gamma": 0.8, "min": 1}},
+            {"cc_map": {"1": 11}},
+            {"cc_dedupe": true},
+            {"cc_thin_ms": 5, "channels": [1, 2]}
+        ],
+        "midi_to_serial": [
+            {"filter": ["sysex"]}
+        ]
+    }
+
+Channels are 1-16 as shown to musicians. "channels" restricts a rule to
+messages on those channels at that point of the pipeline. Rules run in
+order, but they are compiled once into lookup tables, so process() costs
+the same whatever the number of rules.
+"""
+import json
+import time
+
+from midiprotocol import (
+    MESSAGE_CLASS, MESSAGE_LENGTH, NOTE_OFF, NOTE_ON, POLY_AFTERTOUCH, CONTROL_CHANGE,
+    PROGRAM_CHANGE, CHANNEL_AFTERTOUCH, PITCHBEND,
+)
+
+RULE_TYPES = (
+    "filter", "channel_map", "transpose", "note_map", "zone",
+    "velocity", "cc_map", "cc_dedupe", "cc_thin_ms",
+)
+
+# Channel message classes keyed by (channel, first data byte)
+_KEYED_CLASSES = (NOTE_OFF, NOTE_ON, POLY_AFTERTOUCH, CONTROL_CHANGE)
+# Channel message classes keyed by channel only
+_CHANNEL_CLASSES = (PROGRAM_CHANGE, CHANNEL_AFTERTOUCH, PITCHBEND)
+_NOTE_CLASSES = (NOTE_OFF, NOTE_ON, POLY_AFTERTOUCH)
+_STATUS_BASE = {
+    NOTE_OFF: 0x80, NOTE_ON: 0x90, POLY_AFTERTOUCH: 0xa0, CONTROL_CHANGE: 0xb0,
+    PROGRAM_CHANGE: 0xc0, CHANNEL_AFTERTOUCH: 0xd0, PITCHBEND: 0xe0,
+}
+_IDENTITY_CURVE = bytes(range(128))
+
+
+def _velocity_curve(spec):
+    """Build a 128-entry velocity table; 0 (note off) always stays 0."""
+    gamma = float(spec.get("gamma", 1.0))
+    scale = float(spec.get("scale", 1.0))
+    offset = float(spec.get("offset", 0))
+    low = int(spec.get("min", 1))
+    high = int(spec.get("max", 127))
+    fixed = spec.get("fixed")
+    curve = bytearray(128)
+    for velocity in range(1, 128):
+        if fixed is not None:
+            value = int(fixed)
+        else:
+            value = round(127 * (velocity / 127) ** gamma * scale + offset)
+        curve[velocity] = min(high, max(low, value, 1), 127)
+    return bytes(curve)
+
+
+def _channel_set(rule):
+    channels = rule.get("channels")
+    if channels is None:
+        return None
+    return {int(channel) - 1 for channel in channels}
+
+
+class MidiFilter:
+    """A rule pipeline compiled into per-class lookup tables."""
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.dropped = 0
+        self._dropping_sysex = False  # Skip the rest of a streamed SysEx whose start was dropped
+        self._compile()
+
+    def _compile(self):
+        # Keyed tables: index (channel << 7) | data1 -> [channel, data1, curve, dedupe, thin] or None
+        keyed = {cls: [[key >> 7, key & 0x7f, _IDENTITY_CURVE, False, 0.0] for key in range(2048)]
+                 for cls in _KEYED_CLASSES}
+        # Channel tables: channel -> channel or None
+        by_channel = {cls: list(range(16)) for cls in _CHANNEL_CLASSES}
+        system_drop = [False] * 256
+
+        for rule in self.rules:
+            kind = next((k for k in rule if k in RULE_TYPES), None)
+            if kind is None:
+                raise ValueError(f"Unknown rule: {rule}")
+            value = rule[kind]
+            channels = _channel_set(rule)
+
+            def matches(state):
+                return state is not None and (channels is None or state[0] in channels)
+
+            if kind == "filter":
+                classes = {value} if isinstance(value, str) else set(value)
+                for status in range(0xf0, 0x100):
+                    if MESSAGE_CLASS[status] in classes:
+                        system_drop[status] = True
+                for cls in _KEYED_CLASSES:
+                    if cls in classes:
+                        table = keyed[cls]
+                        for key, state in enumerate(table):
+                            if matches(state):
+                                table[key] = None
+                for cls in _CHANNEL_CLASSES:
+                    if cls in classes:
+                        table = by_channel[cls]
+                        for key, channel in enumerate(table):
+                            if channel is not None and (channels is None or channel in channels):
+                                table[key] = None
+
+            elif kind == "channel_map":
+                mapping = {int(src) - 1: int(dst) - 1 for src, dst in value.items()}
+                for table in keyed.values():
+                    for state in table:
+                        if matches(state) and state[0] in mapping:
+                            state[0] = mapping[state[0]]
+                for table in by_channel.values():
+                    for key, channel in enumerate(table):
+                        if channel is not None and channel in mapping and (channels is None or channel in channels):
+                            table[key] = mapping[channel]
+
+            elif kind in ("transpose", "note_map", "zone"):
+                for cls in _NOTE_CLASSES:
+                    table = keyed[cls]
+                    for key, state in enumerate(table):
+                        if not matches(state):
+                            continue
+                        if kind == "transpose":
+                            note = state[1] + int(value)
+                        elif kind == "note_map":
+                            note = int(value.get(str(state[1]), state[1]))
+                        else:
+                            low, high = value.get("notes", (0, 127))
+                            if not low <= state[1] <= high:
+                                continue
+                            note = state[1] + int(value.get("transpose", 0))
+                            if "to_channel" in value:
+                                state[0] = int(value["to_channel"]) - 1
+                        if 0 <= note <= 127:
+                            state[1] = note
+                        else:
+                            table[key] = None  # Transposed off the keyboard
+
+            elif kind == "velocity":
+                curve = _velocity_curve(value)
+                for cls in (NOTE_ON, NOTE_OFF):
+                    for state in keyed[cls]:
+                        if matches(state):
+                            state[2] = bytes(curve[v] for v in state[2])
+
+            elif kind == "cc_map":
+                mapping = {int(src): int(dst) for src, dst in value.items()}
+                for state in keyed[CONTROL_CHANGE]:
+                    if matches(state) and state[1] in mapping:
+                        state[1] = mapping[state[1]]
+
+            elif kind == "cc_dedupe":
+                for state in keyed[CONTROL_CHANGE]:
+                    if matches(state):
+                        state[3] = bool(value)
+
+            elif kind == "cc_thin_ms":
+                for state in keyed[CONTROL_CHANGE]:
+                    if matches(state):
+                        state[4] = float(value) / 1000
+
+        # Freeze into flat per-status tables so process() is a couple of index operations
+        self._keyed = [None] * 256
+        self._by_channel = [None] * 256
+        for cls, table in keyed.items():
+            frozen = [None if state is None else
+                      (_STATUS_BASE[cls] | state[0], state[1],
+                       None if state[2] == _IDENTITY_CURVE else state[2], state[3], state[4])
+                      for state in table]
+            for channel in range(16):
+                self._keyed[_STATUS_BASE[cls] | channel] = frozen[channel << 7:(channel + 1) << 7]
+        for cls, table in by_channel.items():
+            for channel, target in enumerate(table):
+                self._by_channel[_STATUS_BASE[cls] | channel] = (
+                    None if target is None else _STATUS_BASE[cls] | target)
+        self._system_drop = system_drop
+        # CC dedupe/thinning state, indexed by output (channel << 7) | controller
+        self._cc_last_value = bytearray(b"\xff" * 2048)
+        self._cc_last_time = [0.0] * 2048
+
+    def process(self, message):
+        """Return the transformed message, or None if a rule drops it."""
+        status = message[0]
+        if status >= 0xf0 or status < 0x80:
+            # System messages and streamed SysEx fragments
+            if status < 0x80:
+                if self._dropping_sysex:
+                    self._dropping_sysex = message[-1] != 0xf7
+                    return None
+                return message
+            if self._system_drop[status]:
+                self.dropped += 1
+                if status == 0xf0:
+                    self._dropping_sysex = message[-1] != 0xf7
+                return None
+            return message
+
+        keyed = self._keyed[status]
+        if keyed is None:
+            target = self._by_channel[status]
+            if target is None:
+                self.dropped += 1
+                return None
+            if target == status:
+                return message
+            return [target] + list(message[1:])
+
+        if len(message) < 3:
+            return message  # Malformed, leave it alone
+        entry = keyed[message[1]]
+        if entry is None:
+            self.dropped += 1
+            return None
+        new_status, data1, curve, dedupe, thin = entry
+        data2 = message[2] if curve is None else curve[message[2]]
+
+        if dedupe or thin:
+            slot = ((new_status & 0x0f) << 7) | data1
+            if dedupe and self._cc_last_value[slot] == data2:
+                self.dropped += 1
+                return None
+            if thin:
+                now = time.perf_counter()
+                if now - self._cc_last_time[slot] < thin:
+                    self.dropped += 1
+                    return None
+                self._cc_last_time[slot] = now
+            self._cc_last_value[slot] = data2
+        return [new_status, data1, data2]
+
+
+def load_filters(path):
+    """Read a JSON rule file and return (serial_to_midi, midi_to_serial) filters; None for an empty direction."""
+    with open(path, "r") as f:
+        config = json.load(f)
+    filters = []
+    for direction in ("serial_to_midi", "midi_to_serial"):
+        rules = config.get(direction) or []
+        filters.append(MidiFilter(rules) if rules else None)
+    return tuple(filters)
+
+
+# Controllers whose every value matters, or whose order relative to other
+# messages does: bank select (before program change), data entry and
+# (N)RPN selection, switches such as sustain, and channel mode messages.
+_ORDERED_CONTROLLERS = {0, 6, 32, 38, 96, 97, 98, 99, 100, 101} | set(range(64, 70)) | set(range(120, 128))
+_COALESCE_CONTROLLER = bytes(0 if cc in _ORDERED_CONTROLLERS else 1 for cc in range(128))
+# 1: one slot per channel (pitchbend, channel aftertouch), 2: one slot per (channel, controller)
+_COALESCE_KIND = bytes(2 if 0xb0 <= status <= 0xbf else 1 if 0xd0 <= status <= 0xef else 0
+                       for status in range(256))
+
+
+class MessageCoalescer:
+    """Keep only the newest controller values when the serial side falls behind.
+
+    Once more than backlog messages are waiting to be written, coalesce()
+    drops every control change superseded by a later one for the same
+    channel and controller, and every pitchbend or channel aftertouch
+    superseded on the same channel. The surviving message keeps its later
+    position, so notes and everything else stay in their original order.
+    Below the backlog the batch is returned untouched.
+    """
+
+    def __init__(self, backlog=64):
+        self.backlog = backlog
+        self.coalesced = 0  # Messages dropped because a newer value replaced them
+
+    def _key(self, message):
+        status = message[0]
+        kind = _COALESCE_KIND[status]
+        if kind == 1 and len(message) == MESSAGE_LENGTH[status]:
+            return status
+        if kind == 2 and len(message) == 3 and _COALESCE_CONTROLLER[message[1]]:
+            return (status << 7) | message[1]
+        return None
+
+    def coalesce(self, batch):
+        """Return batch without superseded controller values (the same list if nothing was dropped)."""
+        if not self.backlog or len(batch) <= self.backlog:
+            return batch
+        keys = [self._key(message) for message in batch]
+        latest = {key: index for index, key in enumerate(keys) if key is not None}
+        kept = [message for index, (message, key) in enumerate(zip(batch, keys))
+                if key is None or latest[key] == index]
+        self.coalesced += len(batch) - len(kept)
+        return kept
@@ -0,0 +1,232 @@
+from midiprotocol import MESSAGE_CLASS, MESSAGE_LENGTH, UNDEFINED
+
+
+class MidiStreamParser:
+    """Incremental parser turning raw serial bytes into complete MIDI messages.
+
+    Feed it whatever the serial port returns, in chunks of any size, and it
+    yields every message completed by that chunk as a list of ints.
+
+    With sysex_chunk_size set, SysEx is streamed instead of accumulated: each
+    time that many bytes are pending they are yielded as a fragment (a
+    memoryview into the parser's buffer, valid until the next fragment), so
+    memory stays flat whatever the size of the dump. The first fragment
+    starts with 0xF0 and the last one ends with 0xF7. sysex_max_size caps
+    the size of a single SysEx; longer ones are dropped (closed with 0xF7
+    when fragments were already yielded).
+
+    Noisy links cannot wedge the parser: every status byte resynchronizes
+    it, data bytes with nothing to attach to are discarded, undefined
+    status bytes are ignored, and an unstreamed SysEx never grows past
+    max_buffer_size. Each such event bumps the corruptions counter.
+    """
+
+    def __init__(self, buffer_size=256, sysex_chunk_size=0, sysex_max_size=0, max_buffer_size=1 << 20):
+        self.sysex_chunk_size = sysex_chunk_size
+        self.sysex_max_size = sysex_max_size
+        self.max_buffer_size = max_buffer_size
+        # Preallocated; grows only for long SysEx when not streaming
+        self._buffer = bytearray(max(buffer_size, sysex_chunk_size))
+        self._length = 0      # Bytes of the pending message held in _buffer
+        self._expected = 0    # Expected length of the pending message, 0 for SysEx
+        self.running_status = 0
+        self.in_sysex = False
+        self.sysex_size = 0           # Bytes of the current SysEx received so far
+        self._sysex_streamed = False  # Fragments of the current SysEx already yielded
+        self._sysex_discarding = False
+        self.sysex_dropped = 0        # SysEx messages over sysex_max_size
+        self.sysex_aborted = 0        # SysEx cut short by another status byte
+        self.errors = 0               # Messages cut short by a status byte before they were complete
+        self.dropped_bytes = 0        # Bytes discarded: orphan data bytes, stray EOX, incomplete messages
+        self.corruptions = 0          # Corruption events of any kind (a run of orphan bytes counts once)
+        self._in_orphan_run = False
+
+    @staticmethod
+    def expected_length(status):
+        """Return the full length of a message starting with status, 0 for SysEx."""
+        return MESSAGE_LENGTH[status]
+
+    def reset(self):
+        """Drop any partially received message and the running status."""
+        self._in_orphan_run = False
+        self._length = 0
+        self._expected = 0
+        self.running_status = 0
+        self.in_sysex = False
+        self._sysex_streamed = False
+        self._sysex_discarding = False
+
+    def _append(self, byte):
+        if self._length == len(self._buffer):
+            self._buffer.extend(bytes(len(self._buffer)))
+        self._buffer[self._length] = byte
+        self._length += 1
+
+    def _take(self):
+        message = list(self._buffer[:self._length])
+        self._length = 0
+        return message
+
+    def _take_fragment(self):
+        fragment = memoryview(self._buffer)[:self._length]
+        self._length = 0
+        self._sysex_streamed = True
+        return fragment
+
+    def _end_sysex(self):
+        """Leave SysEx mode; return [0xF7] if a streamed SysEx has to be closed."""
+        streamed = self._sysex_streamed
+        self.in_sysex = False
+        self._sysex_streamed = False
+        self._sysex_discarding = False
+        self._length = 0
+        return [0xf7] if streamed else None
+
+    def _sysex_data(self, byte):
+        """Handle one SysEx data byte; return a fragment or terminator to yield, if any."""
+        if self._sysex_discarding:
+            return None
+        self.sysex_size += 1
+        # Without streaming the whole SysEx is buffered, so a lost EOX must not grow it forever
+        limit = self.sysex_max_size or (0 if self.sysex_chunk_size else self.max_buffer_size)
+        if limit and self.sysex_size > limit:
+            self.sysex_dropped += 1
+            self.corruptions += 1
+            terminator = self._end_sysex()
+            self.in_sysex = True
+            self._sysex_discarding = True  # Swallow the rest up to 0xF7
+            return terminator
+        self._append(byte)
+        if self.sysex_chunk_size and self._length >= self.sysex_chunk_size:
+            return self._take_fragment()
+        return None
+
+    def feed(self, data):
+        """Consume a chunk of bytes and yield each complete message (or SysEx fragment)."""
+        for byte in data:
+            if byte >= 0xf8:
+                if MESSAGE_CLASS[byte] == UNDEFINED:
+                    self.dropped_bytes += 1
+                    self.corruptions += 1
+                    continue
+                # Realtime bytes may appear anywhere, even inside another message
+                yield [byte]
+                continue
+
+            if byte & 0x80:
+                self._in_orphan_run = False
+                if byte == 0xf7:
+                    # End of SysEx; a stray EOX outside of SysEx is ignored
+                    if self.in_sysex and not self._sysex_discarding:
+                        self._append(byte)
+                        if self._sysex_streamed:
+                            yield self._take_fragment()
+                        else:
+                            yield self._take()
+                    elif not self.in_sysex:
+                        self.dropped_bytes += 1
+                        self.corruptions += 1
+                    self._end_sysex()
+                    continue
+
+                if self.in_sysex:
+                    # A status byte cuts the SysEx short
+                    if not self._sysex_discarding:
+                        self.sysex_aborted += 1
+                        self.corruptions += 1
+                    terminator = self._end_sysex()
+                    if terminator:
+                        yield terminator
+                elif self._length:
+                    # The pending message never got all of its data bytes
+                    self.errors += 1
+                    self.corruptions += 1
+                    self.dropped_bytes += self._length
+
+                if MESSAGE_CLASS[byte] == UNDEFINED:
+                    # 0xF4/0xF5: nothing valid starts here, wait for the next status byte
+                    self._length = 0
+                    self.running_status = 0
+                    self.dropped_bytes += 1
+                    self.corruptions += 1
+                    continue
+
+                # Any other status byte starts a new message
+                self._length = 0
+                if byte < 0xf0:
+                    self.running_status = byte
+                else:
+                    self.running_status = 0  # System messages cancel running status
+                self._expected = self.expected_length(byte)
+                if byte == 0xf0:
+                    self.in_sysex = True
+                    self.sysex_size = 0
+                    self._sysex_streamed = False
+                    self._sysex_discarding = False
+                    fragment = self._sysex_data(byte)
+                    if fragment is not None:
+                        yield fragment
+                    continue
+                self._append(byte)
+                if self._expected == 1:
+                    yield self._take()
+                continue
+
+            # Data byte
+            if self.in_sysex:
+                fragment = self._sysex_data(byte)
+                if fragment is not None:
+                    yield fragment
+                continue
+            if self._length == 0:
+                if not self.running_status:
+                    # Orphan data byte with nothing to attach it to
+                    self.dropped_bytes += 1
+                    if not self._in_orphan_run:
+                        self._in_orphan_run = True
+                        self.corruptions += 1
+                    continue
+                self._expected = self.expected_length(self.running_status)
+                self._append(self.running_status)
+            self._append(byte)
+            if self._length == self._expected:
+                yield self._take()
+
+
+class MidiStreamEncoder:
+    """Serialize batches of MIDI messages into a single buffer for one write.
+
+    With running_status enabled, the status byte of a channel message is
+    omitted when it repeats the previous one, as allowed by the MIDI spec.
+    """
+
+    def __init__(self, running_status=False):
+        self.use_running_status = running_status
+        self.running_status = 0
+
+    def reset(self):
+        """Forget the running status so the next message is sent in full."""
+        self.running_status = 0
+
+    def encode(self, messages):
+        """Return a bytearray holding every message of the batch, in order."""
+        out = bytearray()
+        if not self.use_running_status:
+            for message in messages:
+                out += bytes(message)
+            return out
+
+        for message in messages:
+            if not message:
+                continue
+            status = message[0]
+            if status < 0xf0:
+                if status == self.running_status:
+                    out += bytes(message[1:])
+                    continue
+                self.running_status = status
+            elif status < 0xf8:
+                self.running_status = 0  # System common and SysEx cancel running status
+            out += bytes(message)
+        return out
+
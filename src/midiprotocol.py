@@ -0,0 +1,247 @@
+"""MIDI protocol tables shared by the parser, the describer and the filters.
+
+Every classification is a single index into a 256-entry table built once
+at import time, keyed by the status byte.
+"""
+
+# Message classes
+DATA = "data"
+NOTE_OFF = "note_off"
+NOTE_ON = "note_on"
+POLY_AFTERTOUCH = "poly_aftertouch"
+CONTROL_CHANGE = "control_change"
+PROGRAM_CHANGE = "program_change"
+CHANNEL_AFTERTOUCH = "channel_aftertouch"
+PITCHBEND = "pitchbend"
+SYSEX = "sysex"
+MTC_QUARTER_FRAME = "mtc_quarter_frame"
+SONG_POSITION = "song_position"
+SONG_SELECT = "song_select"
+TUNE_REQUEST = "tune_request"
+END_OF_SYSEX = "end_of_sysex"
+CLOCK = "clock"
+START = "start"
+CONTINUE = "continue"
+STOP = "stop"
+ACTIVE_SENSING = "active_sensing"
+RESET = "reset"
+UNDEFINED = "undefined"
+
+_CHANNEL_CLASSES = {
+    0x80: (NOTE_OFF, 3),
+    0x90: (NOTE_ON, 3),
+    0xa0: (POLY_AFTERTOUCH, 3),
+    0xb0: (CONTROL_CHANGE, 3),
+    0xc0: (PROGRAM_CHANGE, 2),
+    0xd0: (CHANNEL_AFTERTOUCH, 2),
+    0xe0: (PITCHBEND, 3),
+}
+
+_SYSTEM_CLASSES = {
+    0xf0: (SYSEX, 0),
+    0xf1: (MTC_QUARTER_FRAME, 2),
+    0xf2: (SONG_POSITION, 3),
+    0xf3: (SONG_SELECT, 2),
+    0xf4: (UNDEFINED, 1),
+    0xf5: (UNDEFINED, 1),
+    0xf6: (TUNE_REQUEST, 1),
+    0xf7: (END_OF_SYSEX, 1),
+    0xf8: (CLOCK, 1),
+    0xf9: (UNDEFINED, 1),
+    0xfa: (START, 1),
+    0xfb: (CONTINUE, 1),
+    0xfc: (STOP, 1),
+    0xfd: (UNDEFINED, 1),
+    0xfe: (ACTIVE_SENSING, 1),
+    0xff: (RESET, 1),
+}
+
+
+def _build_tables():
+    length = bytearray(256)
+    classes = [DATA] * 256
+    channel = [-1] * 256
+    for status in range(0x80, 0xf0):
+        classes[status], length[status] = _CHANNEL_CLASSES[status & 0xf0]
+        channel[status] = status & 0x0f
+    for status, (message_class, message_length) in _SYSTEM_CLASSES.items():
+        classes[status] = message_class
+        length[status] = message_length
+    return bytes(length), tuple(classes), tuple(channel)
+
+
+# Full message length per status byte; 0 for data bytes and for SysEx (variable)
+MESSAGE_LENGTH, MESSAGE_CLASS, CHANNEL = _build_tables()
+# True for status bytes 0x80-0xff
+IS_STATUS = tuple(status >= 0x80 for status in range(256))
+# True for system realtime bytes (0xf8-0xff), which may appear inside other messages
+IS_REALTIME = tuple(status >= 0xf8 for status in range(256))
+# True for system common and realtime messages (0xf0-0xff)
+IS_SYSTEM = tuple(status >= 0xf0 for status in range(256))
+
+
+def _describe_note_off(message, channel):
+    if len(message) > 2:
+        return f"Note Off:  NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
+
+
+def _describe_note_on(message, channel):
+    if len(message) > 2:
+        return f"Note On:   NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
+
+
+def _describe_poly_aftertouch(message, channel):
+    if len(message) > 2:
+        return f"Polyphonic Aftertouch: NOTE {message[1]:<3} VAL {message[2]:<3} CH {channel:<2}"
+
+
+def _describe_control_change(message, channel):
+    if len(message) > 2:
+        return f"Control Change: CC# {message[1]:<3} VALUE {message[2]:<3} CH {channel:<2}"
+
+
+def _describe_program_change(message, channel):
+    if len(message) > 1:
+        return f"Program Change: PRG {message[1]:<3} CH {channel:<2}"
+
+
+def _describe_channel_aftertouch(message, channel):
+    if len(message) > 1:
+        return f"Channel Aftertouch: VAL {message[1]:<3} CH {channel:<2}"
+
+
+def _describe_pitchbend(message, channel):
+    if len(message) > 2:
+        value = (message[2] << 7) | message[1]
+        return f"Pitchbend: VAL {value-8192:<5} CH {channel:<2}"
+
+
+def _describe_sysex(message, channel):
+    if message[-1] == 0xF7:
+        return f"SysEx: {len(message)} bytes"
+    return f"SysEx (incomplete): {message}"
+
+
+_DESCRIBERS = {
+    NOTE_OFF: _describe_note_off,
+    NOTE_ON: _describe_note_on,
+    POLY_AFTERTOUCH: _describe_poly_aftertouch,
+    CONTROL_CHANGE: _describe_control_change,
+    PROGRAM_CHANGE: _describe_program_change,
+    CHANNEL_AFTERTOUCH: _describe_channel_aftertouch,
+    PITCHBEND: _describe_pitchbend,
+    SYSEX: _describe_sysex,
+}
+
+
+def describe_midi_message(message):
+    if not message or not isinstance(message, (list, tuple)):
+        return str(message)
+    status = message[0]
+    if 0 <= status < 256:
+        describer = _DESCRIBERS.get(MESSAGE_CLASS[status])
+        if describer is not None:
+            description = describer(message, CHANNEL[status] + 1)  # Channel for musicians (1-16)
+            if description is not None:
+                return description
+    return f"Unknown MIDI: {message}"
+
+
+def get_midi_length(message):
+    """Return the full length of the message, or 100 if it is incomplete or invalid."""
+    if not message:
+        return 100
+    length = MESSAGE_LENGTH[message[0]]
+    if length:
+        return length
+    if message[0] == 0xf0 and message[-1] == 0xf7:
+        return len(message)
+    return 100
+
+
+def _legacy_get_midi_length(message):
+    """The comparison-chain length lookup the table replaces (kept for benchmark())."""
+    if len(message) == 0:
+        return 100
+    opcode = message[0]
+    if opcode >= 0xf4:
+        return 1
+    if opcode in [0xf1, 0xf3]:
+        return 2
+    if opcode == 0xf2:
+        return 3
+    if opcode == 0xf0:
+        if message[-1] == 0xf7:
+            return len(message)
+
+    opcode = opcode & 0xf0
+    if opcode in [0x80, 0x90, 0xa0, 0xb0, 0xe0]:
+        return 3
+    if opcode in [0xc0, 0xd0]:
+        return 2
+
+    return 100
+
+
+def _legacy_describe_midi_message(message):
+    """The if/elif describer the table replaces (kept for benchmark())."""
+    if not message or not isinstance(message, (list, tuple)):
+        return str(message)
+    status = message[0]
+    channel = (status & 0x0F) + 1
+    msg_type = status & 0xF0
+
+    if msg_type == 0x80 and len(message) > 2:
+        return f"Note Off:  NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
+    elif msg_type == 0x90 and len(message) > 2:
+        return f"Note On:   NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
+    elif msg_type == 0xA0 and len(message) > 2:
+        return f"Polyphonic Aftertouch: NOTE {message[1]:<3} VAL {message[2]:<3} CH {channel:<2}"
+    elif msg_type == 0xB0 and len(message) > 2:
+        return f"Control Change: CC# {message[1]:<3} VALUE {message[2]:<3} CH {channel:<2}"
+    elif msg_type == 0xC0 and len(message) > 1:
+        return f"Program Change: PRG {message[1]:<3} CH {channel:<2}"
+    elif msg_type == 0xD0 and len(message) > 1:
+        return f"Channel Aftertouch: VAL {message[1]:<3} CH {channel:<2}"
+    elif msg_type == 0xE0 and len(message) > 2:
+        value = (message[2] << 7) | message[1]
+        return f"Pitchbend: VAL {value-8192:<5} CH {channel:<2}"
+    elif status == 0xF0:
+        if message[-1] == 0xF7:
+            return f"SysEx: {len(message)} bytes"
+        else:
+            return f"SysEx (incomplete): {message}"
+    else:
+        return f"Unknown MIDI: {message}"
+
+
+def benchmark(iterations=200_000):
+    """Time the lookup tables against the legacy functions and print the results."""
+    import timeit
+
+    messages = [
+        [0x90, 60, 100], [0x80, 60, 0], [0xb3, 7, 64], [0xc1, 5], [0xd2, 40],
+        [0xe0, 0, 64], [0xa4, 60, 10], [0xf8], [0xfe], [0xf2, 1, 2],
+        [0xf0, 0x7e, 0x7f, 0x06, 0x01, 0xf7],
+    ]
+    for message in messages:
+        assert get_midi_length(message) == _legacy_get_midi_length(message), message
+        assert describe_midi_message(message) == _legacy_describe_midi_message(message), message
+
+    def run(function):
+        return timeit.timeit(lambda: [function(m) for m in messages], number=iterations // len(messages))
+
+    count = (iterations // len(messages)) * len(messages)
+    for name, legacy, table in (
+        ("length", _legacy_get_midi_length, get_midi_length),
+        ("describe", _legacy_describe_midi_message, describe_midi_message),
+    ):
+        legacy_time = run(legacy)
+        table_time = run(table)
+        print(f"{name:<9} legacy {legacy_time / count * 1e9:7.1f} ns/msg   "
+              f"table {table_time / count * 1e9:7.1f} ns/msg   "
+              f"speedup x{legacy_time / table_time:.2f}")
+
+
+if __name__ == "__main__":
+    benchmark()
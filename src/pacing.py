@@ -0,0 +1,80 @@
+import time
+
+PARITY_BITS = {"N": 0, "E": 1, "O": 1, "M": 1, "S": 1}
+
+
+class LinePacer:
+    """Release serial bytes no faster than a fraction of the UART line rate.
+
+    The OS accepts writes much faster than the wire can carry them, and a
+    small microcontroller with a 64-byte RX buffer then overruns when the
+    host bursts. The pacer keeps a virtual clock of when the line will be
+    idle and, before each slice of at most burst bytes, sleeps until no
+    more than burst bytes are still in flight. Only serial_writer calls
+    it, so it needs no locking.
+    """
+
+    def __init__(self, baud, fraction=1.0, burst=16, bytesize=8, parity="N", stopbits=1):
+        if not 0 < fraction <= 1:
+            raise ValueError("fraction must be in (0, 1]")
+        self.baud = baud
+        self.fraction = fraction
+        self.burst = max(1, burst)
+        # Start bit + data bits + parity + stop bits
+        self.bits_per_byte = 1 + bytesize + PARITY_BITS[parity] + stopbits
+        self.line_rate = baud / self.bits_per_byte        # Bytes per second on the wire
+        self.byte_time = 1 / (self.line_rate * fraction)  # Seconds allotted to each byte
+        self._idle_at = 0.0       # When the line will have sent everything released so far
+        self.bytes = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        # Throughput while the pacer was the bottleneck (back-to-back paced writes)
+        self._saturated_bytes = 0
+        self._saturated_time = 0.0
+        self._last_release = None
+        self._last_size = 0
+
+    def slices(self, data):
+        """Yield data in slices of at most burst bytes, waiting before each one as needed."""
+        view = memoryview(data)
+        for offset in range(0, len(data), self.burst):
+            chunk = view[offset:offset + self.burst]
+            self.wait(len(chunk))
+            yield chunk
+
+    def wait(self, size):
+        """Sleep until size more bytes can be released, then account for them."""
+        now = time.perf_counter()
+        # Never let more than one burst pile up in the device
+        delay = self._idle_at - self.burst * self.byte_time - now
+        if delay > 0:
+            time.sleep(delay)
+            self.waits += 1
+            self.wait_time += delay
+            released = time.perf_counter()
+            if self._last_release is not None:
+                # The wait was for the previous slice to leave the line
+                self._saturated_time += released - self._last_release
+                self._saturated_bytes += self._last_size
+        else:
+            released = now
+        self._last_release = released
+        self._last_size = size
+        self._idle_at = max(self._idle_at, released) + size * self.byte_time
+        self.bytes += size
+
+    def stats(self):
+        """Return theoretical and achieved throughput, in bytes per second."""
+        achieved = self._saturated_bytes / self._saturated_time if self._saturated_time else None
+        target = self.line_rate * self.fraction
+        return {
+            "baud": self.baud,
+            "bits_per_byte": self.bits_per_byte,
+            "line_rate": self.line_rate,
+            "target_rate": target,
+            "achieved_rate": achieved,
+            "achieved_ratio": achieved / target if achieved is not None else None,
+            "bytes": self.bytes,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+        }
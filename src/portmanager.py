@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+
+
+def serial_identity(port):
+    """Stable identity of a serial port: USB VID:PID plus serial number (or bus location), else the device path."""
+    if port.vid is not None:
+        return (port.vid, port.pid, port.serial_number or port.location)
+    return port.device
+
+
+class PortManager:
+    """Cached serial and MIDI port enumeration with hot-plug detection.
+
+    Listing serial ports is a full OS scan and creating rtmidi objects opens
+    a client on the MIDI system, so results are cached for scan_interval
+    seconds and the rtmidi objects are reused. start() runs a background
+    thread that rescans at that interval and calls every listener with
+    (serial_added, serial_removed, midi_changed) when something was plugged
+    in or out. Listeners run on that thread. The thread's first scan is
+    reported as every port added, so a GUI can show its window first and
+    fill the lists once they arrive; pyserial and rtmidi are only imported
+    by that first scan.
+    """
+
+    def __init__(self, scan_interval=1.0, midi_backend=None):
+        self.scan_interval = scan_interval
+        self.midi_backend = midi_backend
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._serial_ports = []
+        self._serial_time = None
+        self._midi_in = None
+        self._midi_out = None
+        self._midi_ports = ([], [])
+        self._midi_time = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def serial_ports(self, refresh=False):
+        """Return the ListPortInfo of every serial port, rescanning if the cache is stale."""
+        with self._lock:
+            now = time.monotonic()
+            if refresh or self._serial_time is None or now - self._serial_time >= self.scan_interval:
+                from serial.tools import list_ports
+                self._serial_ports = sorted(list_ports.comports(), key=lambda port: port.device)
+                self._serial_time = now
+            return list(self._serial_ports)
+
+    def midi_ports(self, refresh=False):
+        """Return (input names, output names), rescanning if the cache is stale."""
+        with self._lock:
+            now = time.monotonic()
+            if refresh or self._midi_time is None or now - self._midi_time >= self.scan_interval:
+                if self.midi_backend is None:
+                    try:
+                        import rtmidi
+                        self.midi_backend = rtmidi
+                    except ImportError:  # MIDI enumeration is simply empty without it
+                        pass
+                if self.midi_backend is not None:
+                    if self._midi_in is None:
+                        self._midi_in = self.midi_backend.MidiIn()
+                        self._midi_out = self.midi_backend.MidiOut()
+                    self._midi_ports = (self._midi_in.get_ports(), self._midi_out.get_ports())
+                self._midi_time = now
+            return list(self._midi_ports[0]), list(self._midi_ports[1])
+
+    def snapshot(self):
+        """Return (serial ports, MIDI inputs, MIDI outputs) as last scanned, without scanning.
+
+        Skips the lock, so a GUI never waits for a scan in progress; the
+        cached lists are only ever replaced whole.
+        """
+        midi_in, midi_out = self._midi_ports
+        return list(self._serial_ports), list(midi_in), list(midi_out)
+
+    def rescan(self):
+        """Have the background thread scan now instead of at its next interval."""
+        self._wake.set()
+
+    def identity_of(self, device):
+        """Return the stable identity of the serial device path, or the path if it is not listed."""
+        for port in self.serial_ports():
+            if port.device == device:
+                return serial_identity(port)
+        return device
+
+    def find_serial(self, identity, refresh=True):
+        """Return the current device path of the port with this identity, or None."""
+        for port in self.serial_ports(refresh=refresh):
+            if serial_identity(port) == identity or port.device == identity:
+                return port.device
+        return None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="port-manager", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        known_serial = {}
+        known_midi = None  # Nothing listed yet: the first scan reports everything
+        while not self._stop.is_set():
+            try:
+                current_serial = {port.device: serial_identity(port) for port in self.serial_ports(refresh=True)}
+                current_midi = self.midi_ports(refresh=True)
+            except Exception as e:
+                logging.error(f"Port scan failed: {e}")
+            else:
+                # A device path now held by another device counts as removed and added
+                added = sorted(device for device, identity in current_serial.items()
+                               if known_serial.get(device) != identity)
+                removed = sorted(device for device, identity in known_serial.items()
+                                 if current_serial.get(device) != identity)
+                midi_changed = current_midi != known_midi
+                known_serial, known_midi = current_serial, current_midi
+                if added or removed or midi_changed:
+                    for listener in list(self.listeners):
+                        listener(added, removed, midi_changed)
+            self._wake.wait(self.scan_interval)
+            self._wake.clear()
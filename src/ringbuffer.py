@@ -0,0 +1,165 @@
+import queue
+import threading
+
+
+class RingBuffer:
+    """Single-producer/single-consumer message ring backed by a fixed bytearray.
+
+    Each message is stored as a 4-byte little-endian length followed by its
+    bytes. The API mirrors queue.Queue (put/get/get_nowait raise queue.Empty)
+    so it can replace the queues between the bridge threads. Only the
+    drop-oldest policy needs a lock, because there the producer also moves
+    the read position.
+    """
+
+    OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "block")
+    HEADER_SIZE = 4
+
+    def __init__(self, capacity=1 << 20, overflow="drop-newest", not_empty=None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.capacity = capacity
+        self.overflow = overflow
+        self._buffer = bytearray(capacity)
+        self._head = 0          # Total bytes written, only advanced by the producer
+        self._tail = 0          # Total bytes read, advanced by the consumer
+        self._puts = 0          # Records written
+        self._gets = 0          # Records consumed or evicted
+        self._lock = threading.Lock() if overflow == "drop-oldest" else None
+        # Pass the same Event to several buffers to wait on all of them at once
+        self._not_empty = not_empty if not_empty is not None else threading.Event()
+        self._not_full = threading.Event()
+        self._closed = False
+        self.dropped = 0
+        self.high_water = 0     # Highest occupancy seen, in bytes
+
+    @property
+    def occupancy(self):
+        """Bytes currently held, headers included."""
+        return self._head - self._tail
+
+    @property
+    def put_count(self):
+        """Records written since creation."""
+        return self._puts
+
+    @property
+    def get_count(self):
+        """Records consumed or evicted since creation."""
+        return self._gets
+
+    def qsize(self):
+        return self._puts - self._gets
+
+    def empty(self):
+        return self._head == self._tail
+
+    def close(self):
+        """Wake any waiting producer or consumer; further puts are dropped."""
+        self._closed = True
+        self._not_empty.set()
+        self._not_full.set()
+
+    def stats(self):
+        return {
+            "messages": self.qsize(),
+            "occupancy": self.occupancy,
+            "capacity": self.capacity,
+            "high_water": self.high_water,
+            "dropped": self.dropped,
+        }
+
+    def _write(self, position, data):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self._buffer[start:start + first] = data[:first]
+        if first < len(data):
+            self._buffer[:len(data) - first] = data[first:]
+
+    def _read(self, position, size):
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        data = self._buffer[start:start + first]
+        if first < size:
+            data += self._buffer[:size - first]
+        return data
+
+    def _evict_oldest(self):
+        size = int.from_bytes(self._read(self._tail, self.HEADER_SIZE), "little")
+        self._tail += self.HEADER_SIZE + size
+        self._gets += 1
+        self.dropped += 1
+
+    def put(self, message, block=True, timeout=None):
+        """Append a message; return False if it was dropped."""
+        payload = bytes(message)
+        size = self.HEADER_SIZE + len(payload)
+        if size > self.capacity or self._closed:
+            self.dropped += 1
+            return False
+
+        if self._lock is not None:
+            with self._lock:
+                while self.capacity - (self._head - self._tail) < size:
+                    self._evict_oldest()
+                self._commit(payload, size)
+            return True
+
+        while self.capacity - (self._head - self._tail) < size:
+            if self.overflow == "drop-newest" or not block:
+                self.dropped += 1
+                return False
+            self._not_full.clear()
+            if self.capacity - (self._head - self._tail) >= size:
+                break
+            if not self._not_full.wait(timeout) or self._closed:
+                self.dropped += 1
+                return False
+        self._commit(payload, size)
+        return True
+
+    def _commit(self, payload, size):
+        head = self._head
+        self._write(head, len(payload).to_bytes(self.HEADER_SIZE, "little"))
+        self._write(head + self.HEADER_SIZE, payload)
+        self._head = head + size  # Publish only once the record is complete
+        self._puts += 1
+        if self._head - self._tail > self.high_water:
+            self.high_water = self._head - self._tail
+        self._not_empty.set()
+
+    def put_nowait(self, message):
+        return self.put(message, block=False)
+
+    def get(self, block=True, timeout=None, raw=False):
+        """Remove and return the oldest message as a list of ints (a bytearray if raw)."""
+        while self._head == self._tail:
+            if not block or self._closed:
+                raise queue.Empty
+            self._not_empty.clear()
+            if self._head != self._tail:
+                break
+            if not self._not_empty.wait(timeout):
+                raise queue.Empty
+
+        if self._lock is not None:
+            with self._lock:
+                if self._head == self._tail:
+                    raise queue.Empty
+                return self._consume(raw)
+        return self._consume(raw)
+
+    def _consume(self, raw=False):
+        tail = self._tail
+        size = int.from_bytes(self._read(tail, self.HEADER_SIZE), "little")
+        message = self._read(tail + self.HEADER_SIZE, size)
+        if not raw:
+            message = list(message)
+        self._tail = tail + self.HEADER_SIZE + size
+        self._gets += 1
+        if self.overflow == "block":
+            self._not_full.set()
+        return message
+
+    def get_nowait(self, raw=False):
+        return self.get(block=False, raw=raw)
@@ -1,98 +1,571 @@
 import time
 import queue
-import rtmidi
+import collections
+try:
+    import rtmidi
+except ImportError:  # Only required when no other MIDI backend is passed in
+    rtmidi = None
 import serial
 import threading
 import logging
+import os
 import sys
-from PyQt6 import QtCore, QtWidgets
-import serialmidi
+from midiprotocol import IS_REALTIME, describe_midi_message, get_midi_length
+from midiparser import MidiStreamParser, MidiStreamEncoder
+from ringbuffer import RingBuffer
+from activity import ActivityCounters, ClockJitterMeter
+from hottrace import HotTrace
+from midifilter import MessageCoalescer
+from metrics import BridgeMetrics
+from portmanager import PortManager
+from capture import SERIAL_TO_MIDI, MIDI_TO_SERIAL
+from pacing import LinePacer
+from framing import FrameEncoder, FrameDecoder, HELLO, ACK
+from bridgeobserver import BridgeObserver  # Lives apart so the GUI can use it without the bridge's imports
+
+VIRTUAL_PORT_PREFIX = "Serial MIDI "
+
+
+def find_port(available_ports, given_name):
+    """Return the index of the port named given_name, or -1.
+
+    An exact name wins. Otherwise the first port whose name contains
+    given_name is used, with a warning when several do, since backends
+    decorate names (ALSA appends client and port numbers).
+    """
+    if given_name is None:
+        return -1
+    index = {}
+    for i, name in enumerate(available_ports):
+        index.setdefault(name, i)
+    if given_name in index:
+        return index[given_name]
+    matches = [i for i, name in enumerate(available_ports) if given_name in name]
+    if len(matches) > 1:
+        logging.warning(f"MIDI port name '{given_name}' is ambiguous, using '{available_ports[matches[0]]}' of "
+                        + ", ".join(f"'{available_ports[i]}'" for i in matches))
+    return matches[0] if matches else -1
+
+
+def default_virtual_port_name(serial_port_name):
+    """Name of the virtual MIDI ports of a serial device: the same device always gets the same name."""
+    return VIRTUAL_PORT_PREFIX + os.path.basename(serial_port_name.rstrip("/\\"))
+
 
 class SerialMIDI:
-    def __init__(self, gui, serial_port_name, serial_baud, midi_in_name, midi_out_name):
-        self.gui = gui  # Reference to the GUI for updating lights
+    PANIC_INTERVAL = 1.0       # Seconds between two corruption panics
+    RECONNECT_INTERVAL = 0.1   # Seconds between two attempts to reopen a lost serial device
+    HELLO_INTERVAL = 0.25      # Seconds between two framing offers while negotiating
+
+    def __init__(self, serial_port_name, serial_baud, midi_in_name, midi_out_name, observer=None,
+                 write_window_us=0, running_status=False,
+                 queue_capacity=1 << 20, overflow="drop-newest", midi_backend=None,
+                 realtime_chunk_size=64, sysex_chunk_size=0, sysex_chunk_delay=0.0, sysex_max_size=0,
+                 serial_to_midi_filter=None, midi_to_serial_filter=None, coalesce_backlog=64,
+                 panic_on_corruption=False, port_manager=None, reconnect_timeout=5.0, capture=None,
+                 bytesize=8, parity="N", stopbits=1, flow_control=None, pace_fraction=0.0, pace_burst=16,
+                 virtual_ports=False, virtual_port_name=None, framing="off", negotiate_timeout=1.0):
+        self.observer = observer if observer is not None else BridgeObserver()
         self.serial_port_name = serial_port_name
         self.serial_baud = serial_baud
         self.given_port_name_in = midi_in_name
         self.given_port_name_out = midi_out_name
         self.thread_running = True
         self.midi_ready = False
-        self.midiin_message_queue = queue.Queue()
-        self.midiout_message_queue = queue.Queue()
+        # Ring buffers between the bridge threads: MIDI -> serial and serial -> MIDI.
+        # Single-byte realtime messages (clock, start/stop, active sensing) take a
+        # separate priority lane so bulk traffic never delays them.
+        self._midiin_ready = threading.Event()
+        self._midiout_ready = threading.Event()
+        self.midiin_message_queue = RingBuffer(queue_capacity, overflow, self._midiin_ready)
+        self.midiout_message_queue = RingBuffer(queue_capacity, overflow, self._midiout_ready)
+        self.midiin_realtime_queue = RingBuffer(1 << 16, "drop-oldest", self._midiin_ready)
+        self.midiout_realtime_queue = RingBuffer(1 << 16, "drop-oldest", self._midiout_ready)
+        # While realtime bytes are waiting, outgoing serial data is written in chunks
+        # of this size so they can be slipped in between, even in the middle of a SysEx
+        self.realtime_chunk_size = realtime_chunk_size
+        # SysEx streaming: with sysex_chunk_size set, SysEx is written to the serial port
+        # in chunks of that size spaced by sysex_chunk_delay seconds, so slow firmware can
+        # keep up, and parsed from it in fragments that report progress. rtmidi only sends
+        # whole SysEx, so the fragments are put back together, at most sysex_max_size
+        # (or the parser's max_buffer_size) bytes of them.
+        self.sysex_chunk_size = sysex_chunk_size
+        self.sysex_chunk_delay = sysex_chunk_delay
+        self.sysex_max_size = sysex_max_size
+        self.parser = MidiStreamParser(sysex_chunk_size=sysex_chunk_size, sysex_max_size=sysex_max_size)
+        if sysex_chunk_size and not sysex_max_size:
+            self.parser.sysex_max_size = self.parser.max_buffer_size
+        self.sysex_dropped = 0  # SysEx from MIDI In over sysex_max_size
+        # Optional midifilter.MidiFilter rule pipelines, applied before queueing
+        self.serial_to_midi_filter = serial_to_midi_filter
+        self.midi_to_serial_filter = midi_to_serial_filter
+        # When more than coalesce_backlog messages wait for the serial port, only the
+        # newest value per controller/pitchbend/aftertouch is written (0 disables)
+        self.coalescer = MessageCoalescer(coalesce_backlog)
+        # Send All Notes Off on every channel to MIDI Out when the serial stream is
+        # corrupted, so a lost note off cannot leave a note hanging
+        self.panic_on_corruption = panic_on_corruption
+        self.panics = 0
+        self.clock_jitter = {"midi_to_serial": ClockJitterMeter(), "serial_to_midi": ClockJitterMeter()}
         self.ser = None
+        # Frame format and flow control ("rtscts" or "xonxoff") used to open the port
+        self.bytesize = bytesize
+        self.parity = parity
+        self.stopbits = stopbits
+        self.flow_control = flow_control
+        # Line-rate pacing: release at most pace_fraction of what serial_baud can
+        # carry, in slices of pace_burst bytes, so small UART buffers never overrun
+        self.pacer = LinePacer(serial_baud, pace_fraction, pace_burst, bytesize, parity, stopbits) \
+            if pace_fraction > 0 else None
+        # Framed protocol (framing.py): "on" always sends and expects frames, "auto" offers
+        # framing on connect and holds MIDI -> serial writes for up to negotiate_timeout
+        # seconds until the device accepts it or stays silent (raw MIDI), "off" never frames
+        self.framing = framing
+        self.negotiate_timeout = negotiate_timeout
+        self.framed = framing == "on"
+        self.frame_encoder = FrameEncoder()
+        self.frame_decoder = FrameDecoder()
+        self._negotiated = threading.Event()
+        self._negotiation_bytes = bytearray()  # Last raw bytes read while waiting for the ACK
+        if framing != "auto":
+            self._negotiated.set()
+        # Hot-plug: when the serial device disappears, look for the same device
+        # (by USB identity) for up to reconnect_timeout seconds; 0 disables.
+        # Messages keep queueing meanwhile and are written once it is back.
+        self.port_manager = port_manager
+        self.reconnect_timeout = reconnect_timeout
+        self.reconnects = 0
+        self._serial_identity = serial_port_name
+        self._reconnect_lock = threading.Lock()
         self.midi_in_active = False
         self.midi_out_active = False
+        # Virtual ports: instead of attaching to existing ports, create an input and an
+        # output named after the serial device that other applications connect to
+        # directly, without going through a loopback bus (not available on Windows)
+        self.virtual_ports = virtual_ports
+        self.virtual_port_name = virtual_port_name or default_virtual_port_name(serial_port_name)
+        # Anything providing rtmidi-compatible MidiIn/MidiOut classes (e.g. a fake for benchmarks)
+        self.midi_backend = midi_backend if midi_backend is not None else rtmidi
+        self.activity = ActivityCounters()  # Sampled by the GUI to drive the LEDs
+        # Message trace, only does work while enabled (Debug checkbox)
+        self.trace = HotTrace(describe_midi_message)
+        self.trace.enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+        # Write combining: wait up to write_window_us for more messages before writing
+        self.write_window_us = write_window_us
+        self.encoder = MidiStreamEncoder(running_status=running_status)
+        # writes counts write() calls, batches the message batches they carry
+        self.write_stats = {"writes": 0, "batches": 0, "messages": 0, "bytes": 0, "max_batch": 0,
+                            "realtime": 0, "coalesced": 0}
+        self.write_batch_sizes = collections.Counter()  # messages per batch -> count
+        # Byte counters and latency histograms, exported by metrics.MetricsExporter
+        self.metrics = BridgeMetrics(self)
+        # Optional capture.CaptureWriter recording what arrives on both inputs
+        self.capture = capture
+        self._inject_handler = None
+
+    def queue_stats(self):
+        """Return occupancy and drop counters for both directions."""
+        return {
+            "midi_to_serial": self.midiin_message_queue.stats(),
+            "serial_to_midi": self.midiout_message_queue.stats(),
+            "midi_to_serial_realtime": self.midiin_realtime_queue.stats(),
+            "serial_to_midi_realtime": self.midiout_realtime_queue.stats(),
+        }
+
+    def sysex_stats(self):
+        """Return SysEx counters for both directions."""
+        return {
+            "serial_to_midi_dropped": self.parser.sysex_dropped,
+            "serial_to_midi_aborted": self.parser.sysex_aborted,
+            "midi_to_serial_dropped": self.sysex_dropped,
+        }
+
+    def summary(self):
+        """Return the headline counters as one flat dict of numbers (None when unknown)."""
+        metrics = self.metrics
+        latency = metrics.latency
+        return {
+            "serial_in": self.activity.serial_in,
+            "serial_out": self.activity.serial_out,
+            "midi_in": self.activity.midi_in,
+            "midi_out": self.activity.midi_out,
+            "serial_in_bytes": metrics.serial_in_bytes,
+            "serial_out_bytes": metrics.serial_out_bytes,
+            "midi_in_bytes": metrics.midi_in_bytes,
+            "midi_out_bytes": metrics.midi_out_bytes,
+            "corruptions": self.parser.corruptions,
+            "dropped_bytes": self.parser.dropped_bytes,
+            "queued_to_serial": self.midiin_message_queue.qsize(),
+            "queued_to_midi": self.midiout_message_queue.qsize(),
+            "queue_dropped": sum(stats["dropped"] for stats in self.queue_stats().values()),
+            "coalesced": self.coalescer.coalesced,
+            "reconnects": self.reconnects,
+            "latency_to_serial_p50": latency["midi_to_serial"].quantile(0.5),
+            "latency_to_serial_p99": latency["midi_to_serial"].quantile(0.99),
+            "latency_to_midi_p50": latency["serial_to_midi"].quantile(0.5),
+            "latency_to_midi_p99": latency["serial_to_midi"].quantile(0.99),
+        }
+
+    def pacing_stats(self):
+        """Return theoretical vs achieved serial throughput, or None when pacing is off."""
+        return self.pacer.stats() if self.pacer is not None else None
+
+    def clock_stats(self):
+        """Return MIDI clock spacing and jitter as sent out in each direction."""
+        return {direction: meter.stats() for direction, meter in self.clock_jitter.items()}
+
+    get_midi_length = staticmethod(get_midi_length)
+
+    @staticmethod
+    def _wait_for_lanes(ready, lanes, timeout):
+        """Block until one of the lanes sharing the ready Event has a message."""
+        if any(not lane.empty() for lane in lanes):
+            return True
+        ready.clear()
+        if any(not lane.empty() for lane in lanes):
+            return True
+        return ready.wait(timeout)
+
+    def _drain_midiin_queue(self, batch):
+        """Move every message already queued into batch without blocking."""
+        while True:
+            try:
+                batch.append(self.midiin_message_queue.get_nowait(raw=True))
+            except queue.Empty:
+                return
 
-    def get_midi_length(self, message):
-        if len(message) == 0:
-            return 100
-        opcode = message[0]
-        if opcode >= 0xf4:
-            return 1
-        if opcode in [0xf1, 0xf3]:
-            return 2
-        if opcode == 0xf2:
-            return 3
-        if opcode == 0xf0:
-            if message[-1] == 0xf7:
-                return len(message)
-
-        opcode = opcode & 0xf0
-        if opcode in [0x80, 0x90, 0xa0, 0xb0, 0xe0]:
-            return 3
-        if opcode in [0xc0, 0xd0]:
-            return 2
-
-        return 100
+    def _serial_write(self, data, realtime=False):
+        """Write to the serial port, paced to the line rate if enabled."""
+        pacer = self.pacer
+        if pacer is None:
+            self._write_now(data)
+            return
+        for chunk in pacer.slices(data):
+            self._write_now(chunk)
+            # Paced writes are slow, let clock and transport bytes in between slices
+            # (but never inside a frame)
+            if not realtime and not self.framed and not self.midiin_realtime_queue.empty():
+                self._write_realtime()
+
+    def _write_now(self, data):
+        """Write to the serial port, timing the call and counting the bytes.
+
+        If the device is gone, wait for it to be reconnected and write again;
+        raises SerialException if it does not come back in time.
+        """
+        while True:
+            port = self.ser
+            try:
+                started = time.perf_counter()
+                port.write(data)
+                break
+            except (serial.SerialException, OSError):
+                if not self._reconnect(port):
+                    raise serial.SerialException("Serial device disconnected")
+        self.metrics.serial_write_seconds.observe(time.perf_counter() - started)
+        self.metrics.serial_out_bytes += len(data)
+        self.write_stats["writes"] += 1
+
+    def _open_serial(self, device):
+        port = serial.Serial(device, self.serial_baud, bytesize=self.bytesize, parity=self.parity,
+                             stopbits=self.stopbits, rtscts=self.flow_control == "rtscts",
+                             xonxoff=self.flow_control == "xonxoff")
+        port.timeout = 0.4
+        return port
+
+    def _reconnect(self, failed_port):
+        """Reopen the serial device after failed_port broke; return True once it is back.
+
+        Both serial threads may call this; the first one does the work and
+        the other one just waits for the outcome.
+        """
+        with self._reconnect_lock:
+            if self.ser is not failed_port:
+                return self.ser is not None and self.ser.is_open  # Already handled
+            if failed_port is not None:
+                try:
+                    failed_port.close()
+                except (serial.SerialException, OSError):
+                    pass
+            if not self.thread_running or self.reconnect_timeout <= 0:
+                return False
+
+            logging.warning(f"Serial device {self.serial_port_name} disconnected, waiting for it to come back...")
+            self.observer.serial_disconnected(self)
+            deadline = time.monotonic() + self.reconnect_timeout
+            while self.thread_running and time.monotonic() < deadline:
+                if isinstance(self._serial_identity, tuple):
+                    device = self.port_manager.find_serial(self._serial_identity)
+                else:
+                    device = self.serial_port_name  # Not a USB device, the path is all we know
+                if device is not None:
+                    try:
+                        self.ser = self._open_serial(device)
+                    except (serial.SerialException, OSError):
+                        pass
+                    else:
+                        # Whatever was half-received or half-sent is lost
+                        self.parser.reset()
+                        self.encoder.reset()
+                        self.frame_decoder.reset()
+                        if self.framing == "auto":
+                            # A replugged device starts over in raw MIDI
+                            self.framed = False
+                            self._negotiation_bytes.clear()
+                            self._negotiated.clear()
+                        self.serial_port_name = device
+                        self.reconnects += 1
+                        logging.info(f"Serial device reconnected as {device}.")
+                        self.observer.serial_reconnected(self, device)
+                        return True
+                time.sleep(self.RECONNECT_INTERVAL)
+
+            logging.error("Serial device did not come back.")
+            self.thread_running = False
+            self.observer.bridge_error(self, "Serial device disconnected.")
+            return False
+
+    def _write_realtime(self):
+        """Write every queued realtime message at once; return how many were written."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.midiin_realtime_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not messages:
+            return 0
+        data = bytes(message[0] for message in messages)
+        if self.framed:
+            data = self.frame_encoder.encode_bytes(data)
+        self._serial_write(data, realtime=True)
+        self.metrics.midiin_realtime_probe.check()
+        clock = self.clock_jitter["midi_to_serial"]
+        for message in messages:
+            if message[0] == 0xf8:
+                clock.tick()
+        self.write_stats["realtime"] += len(messages)
+        self.activity.serial_out += len(messages)
+        return len(messages)
+
+    def _write_sysex_chunked(self, data):
+        """Write a batch holding a large SysEx in paced chunks, reporting progress."""
+        view = memoryview(data)
+        for offset in range(0, len(data), self.sysex_chunk_size):
+            if not self.thread_running:
+                return
+            if offset and self.sysex_chunk_delay > 0:
+                time.sleep(self.sysex_chunk_delay)
+            chunk = view[offset:offset + self.sysex_chunk_size]
+            self._serial_write(chunk)
+            self._write_realtime()
+            written = offset + len(chunk)
+            self.observer.sysex_progress(self, "midi_to_serial", written, written == len(data))
+
+    def _write_interleaved(self, data, next_cut):
+        """Write data up to next_cut(offset) at a time, sending waiting realtime messages in between.
+
+        A write blocks until the port takes the bytes, so the slices bound
+        how long a clock byte queued meanwhile has to wait.
+        """
+        view = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            if not self.midiin_realtime_queue.empty():
+                self._write_realtime()
+            end = next_cut(offset)
+            self._serial_write(view[offset:end])
+            offset = end
+
+    def _negotiate(self):
+        """Offer framing to the device until serial_watcher sees it accept or negotiate_timeout passes."""
+        deadline = time.monotonic() + self.negotiate_timeout
+        while self.thread_running and time.monotonic() < deadline:
+            self._write_now(HELLO)
+            if self._negotiated.wait(self.HELLO_INTERVAL):
+                return
+        if not self._negotiated.is_set():
+            logging.info("No framing reply from the serial device, using raw MIDI.")
+            self._negotiated.set()
 
     def serial_writer(self):
+        lanes = (self.midiin_realtime_queue, self.midiin_message_queue)
         while not self.midi_ready:
             time.sleep(0.1)
-        while self.thread_running:
-            try:
-                message = self.midiin_message_queue.get(timeout=0.4)
-            except queue.Empty:
+        try:
+            while self.thread_running:
+                if not self._negotiated.is_set():
+                    self._negotiate()
+                if not self._wait_for_lanes(self._midiin_ready, lanes, 0.4):
+                    continue
+                port = self.ser
+                if not port or not port.is_open:
+                    if not self._reconnect(port):
+                        break  # Exit if the serial port is closed for good
+
+                # Realtime first, then everything queued in the bulk lane
+                self._write_realtime()
+                batch = []
+                self._drain_midiin_queue(batch)
+                if batch and self.write_window_us > 0:
+                    deadline = time.perf_counter() + self.write_window_us / 1_000_000
+                    while True:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0 or not self._wait_for_lanes(self._midiin_ready, lanes, remaining):
+                            break
+                        self._write_realtime()
+                        self._drain_midiin_queue(batch)
+                if not batch:
+                    continue
+                batch = self.coalescer.coalesce(batch)
+
+                #uncomment the next line to see the raw data
+                #logging.debug(batch)
+                data = self.encoder.encode(batch)
+                if self.framed:
+                    # Realtime frames can only go in between two frames
+                    data = self.frame_encoder.encode_bytes(data)
+                    self._write_interleaved(data, lambda offset: data.index(0, offset) + 1)
+                elif len(data) <= self.realtime_chunk_size:
+                    self._serial_write(data)
+                elif self.sysex_chunk_size and any(
+                        message[0] == 0xf0 and len(message) > self.sysex_chunk_size for message in batch):
+                    self._write_sysex_chunked(data)
+                else:
+                    chunk_size = self.realtime_chunk_size
+                    self._write_interleaved(data, lambda offset: offset + chunk_size)
+
+                stats = self.write_stats
+                stats["batches"] += 1
+                stats["messages"] += len(batch)
+                stats["bytes"] += len(data)
+                if len(batch) > stats["max_batch"]:
+                    stats["max_batch"] = len(batch)
+                stats["coalesced"] = self.coalescer.coalesced
+                self.metrics.midiin_probe.check()
+                self.write_batch_sizes[len(batch)] += 1
+                self.activity.serial_out += len(batch)
+        except serial.SerialException:
+            pass  # Device gone for good, already reported by _reconnect
+
+    def _framed_messages(self, data):
+        for timestamp, chunk in self.frame_decoder.feed(data):
+            yield from self.parser.feed(chunk)
+
+    def _negotiating_messages(self, data):
+        """Parse data until the device accepts framing, then decode the rest as frames.
+
+        The ACK is matched on the raw bytes, which are held back while they
+        could still be one: with a small sysex_chunk_size the parser would
+        only hand it over in fragments.
+        """
+        parser = self.parser
+        held = self._negotiation_bytes
+        for position in range(len(data)):
+            byte = data[position]
+            if IS_REALTIME[byte]:
+                yield [byte]  # May come in the middle of the ACK too
+                continue
+            held.append(byte)
+            if held == ACK:
+                held.clear()
+                parser.reset()  # Drop whatever raw MIDI was cut short by the ACK
+                self.framed = True
+                self.frame_decoder.reset()
+                self._negotiated.set()
+                logging.info("Serial device accepted framing, using the framed protocol.")
+                yield from self._framed_messages(data[position + 1:])
+                return
+            if ACK.startswith(held):
                 continue
-            if not self.ser or not self.ser.is_open:
-                break  # Exit if the serial port is closed
-            #uncomment the next line to see the raw data
-            #logging.debug(message)
-            #logging.debug(describe_midi_message(message))
-            self.ser.write(bytearray(message))
-            self.gui.led_blink_signal.emit("#f1c40f")  # Serial Port LED (yellow for incoming)
+            # Not the ACK after all; 0xF0 may start the next one
+            if byte == 0xf0:
+                del held[-1]
+                yield from parser.feed(bytes(held))
+                held[:] = b"\xf0"
+            else:
+                yield from parser.feed(bytes(held))
+                held.clear()
 
     def serial_watcher(self):
-        receiving_message = []
-        running_status = 0
+        parser = self.parser
+        frame_decoder = self.frame_decoder
+        metrics = self.metrics
+        corruptions = parser.corruptions
+        last_panic = 0.0
+        sysex_pending = None  # Streamed SysEx being reassembled for MIDI Out
 
         while not self.midi_ready:
             time.sleep(0.1)
 
         while self.thread_running:
-            if not self.ser or not self.ser.is_open:
-                break  # Exit if the serial port is closed
+            port = self.ser
             try:
-                data = self.ser.read()
-            except serial.SerialException:
-                break  # Exit gracefully if the serial port is closed
-            if data:
-                for elem in data:
-                    receiving_message.append(elem)
-                if len(receiving_message) == 1:
-                    if (receiving_message[0] & 0xf0) != 0:
-                        running_status = receiving_message[0]
-                    else:
-                        receiving_message = [running_status, receiving_message[0]]
-
-                message_length = self.get_midi_length(receiving_message)
-                if message_length <= len(receiving_message):
-                    #uncomment the next line to see the raw data
-                    #logging.debug(receiving_message)
-                    logging.debug(describe_midi_message(receiving_message))
-                    self.midiout_message_queue.put(receiving_message)
-                    receiving_message = []
-                    # After receiving data (incoming)
-                    self.gui.led_blink_signal.emit("#2ecc71")  # Or your serial port LED color
+                if not port or not port.is_open:
+                    raise serial.SerialException("Serial port closed")
+                # Read everything already buffered, or block for at least one byte
+                data = port.read(port.in_waiting or 1)
+            except (serial.SerialException, OSError):
+                if self._reconnect(port):
+                    continue
+                break  # Exit gracefully if the serial port is closed for good
+            received_at = time.perf_counter()
+            metrics.serial_in_bytes += len(data)
+            message_filter = self.serial_to_midi_filter
+            capture = self.capture
+            if self.framed:
+                messages = self._framed_messages(data)
+            elif not self._negotiated.is_set():
+                messages = self._negotiating_messages(data)
+            else:
+                messages = parser.feed(data)
+            for receiving_message in messages:
+                if self.trace.enabled:
+                    self.trace.record(HotTrace.SERIAL_IN, receiving_message)
+                if isinstance(receiving_message, memoryview):
+                    # SysEx fragment: collect it until the last one arrives
+                    if receiving_message[0] == 0xf0:
+                        sysex_pending = bytearray()
+                    if sysex_pending is None:
+                        continue  # Start lost to a reconnect
+                    sysex_pending += receiving_message
+                    done = receiving_message[-1] == 0xf7
+                    self.observer.sysex_progress(self, "serial_to_midi", len(sysex_pending), done)
+                    if not done:
+                        continue
+                    receiving_message = sysex_pending  # Queued as is, the queue copies the bytes
+                    sysex_pending = None
+                elif sysex_pending is not None and receiving_message == [0xf7]:
+                    # The parser closed a streamed SysEx that was cut short or too long
+                    sysex_pending = None
+                    continue
+                # Captured once reassembled, so a replay sends what MIDI Out got
+                if capture is not None:
+                    capture.record(SERIAL_TO_MIDI, received_at, receiving_message)
+                self.activity.serial_in += 1
+                if message_filter is not None:
+                    receiving_message = message_filter.process(receiving_message)
+                    if receiving_message is None:
+                        continue
+                if len(receiving_message) == 1 and IS_REALTIME[receiving_message[0]]:
+                    if self.midiout_realtime_queue.put(receiving_message):
+                        metrics.midiout_realtime_probe.stamp(received_at)
+                else:
+                    if self.midiout_message_queue.put(receiving_message):
+                        metrics.midiout_probe.stamp(received_at)
+            if parser.corruptions + frame_decoder.errors != corruptions:
+                corruptions = parser.corruptions + frame_decoder.errors
+                # At most one panic per PANIC_INTERVAL, however noisy the line is
+                if self.panic_on_corruption and received_at - last_panic >= self.PANIC_INTERVAL:
+                    last_panic = received_at
+                    self._send_panic()
+
+    def _send_panic(self):
+        """Queue All Notes Off (CC 123) on all 16 channels for MIDI Out."""
+        for channel in range(16):
+            self.midiout_message_queue.put([0xb0 | channel, 123, 0])
+        self.panics += 1
+        logging.warning("Corrupted serial data, sent All Notes Off.")
 
     def reset_activity_flags(self):
         """Reset the activity flags for MIDI In and Out."""
@@ -105,66 +578,138 @@ class SerialMIDI:
             self._wallclock = time.time()
 
         def __call__(self, event, data=None):
+            received_at = time.perf_counter()
             message, deltatime = event
             self._wallclock += deltatime
-            self.parent.midiin_message_queue.put(message)
-            # Optionally, blink LED and log
-            self.parent.gui.midi_in_led_blink_signal.emit("#f1c40f")  # Yellow
-            logging.debug(f"MIDI IN: {describe_midi_message(message)}")
-
-    def midi_watcher(self):
-        midiin = rtmidi.MidiIn()
-        midiout = rtmidi.MidiOut()
-
-        # Retrieve available MIDI input ports
-        available_ports_in = midiin.get_ports()
-        available_ports_out = midiout.get_ports()
-
-        logging.info("IN : '" + "','".join(available_ports_in) + "'")
-        logging.info("OUT : '" + "','".join(available_ports_out) + "'")
-        logging.info("Hit ctrl-c to exit")
-
-        port_index_in = -1
-        port_index_out = -1
-
-        if self.given_port_name_in is not None:
-            # search and open MIDI IN port
-            for i, s in enumerate(available_ports_in):
-                if self.given_port_name_in in s:
-                    port_index_in = i
+            metrics = self.parent.metrics
+            metrics.midi_in_bytes += len(message)
+            if self.parent.capture is not None:
+                self.parent.capture.record(MIDI_TO_SERIAL, received_at, message)
+            if self.parent.midi_to_serial_filter is not None:
+                message = self.parent.midi_to_serial_filter.process(message)
+                if message is None:
+                    return
+            if len(message) == 1 and IS_REALTIME[message[0]]:
+                if self.parent.midiin_realtime_queue.put(message):
+                    metrics.midiin_realtime_probe.stamp(received_at)
+            elif self.parent.sysex_max_size and message[0] == 0xf0 and len(message) > self.parent.sysex_max_size:
+                self.parent.sysex_dropped += 1
+                return
+            elif self.parent.midiin_message_queue.put(message):
+                metrics.midiin_probe.stamp(received_at)
+            self.parent.activity.midi_in += 1
+            if self.parent.trace.enabled:
+                self.parent.trace.record(HotTrace.MIDI_IN, message)
+
+    def inject(self, direction, message):
+        """Push a message in as if it had arrived on the input of direction.
+
+        Used by capture replay and load tests. It stands in for the serial
+        reader ("serial_to_midi") or the MIDI In callback ("midi_to_serial"),
+        so that input should not be live at the same time.
+        """
+        if direction == "midi_to_serial":
+            if self._inject_handler is None:
+                self._inject_handler = self.midi_input_handler(self)
+            self._inject_handler((message, 0.0))
+            return
+        self.activity.serial_in += 1
+        if self.serial_to_midi_filter is not None:
+            message = self.serial_to_midi_filter.process(message)
+            if message is None:
+                return
+        if len(message) == 1 and IS_REALTIME[message[0]]:
+            self.midiout_realtime_queue.put(message)
+        else:
+            self.midiout_message_queue.put(message)
 
-        if self.given_port_name_out is not None:
-            # search and open MIDI OUT port
-            for i, s in enumerate(available_ports_out):
-                if self.given_port_name_out in s:
-                    port_index_out = i
+    def _send_midi(self, midiout, message):
+        # Send the MIDI message to the output port
+        try:
+            midiout.send_message(message)
+            self.activity.midi_out += 1
+            self.metrics.midi_out_bytes += len(message)
+        except Exception as e:
+            logging.error(f"Failed to send MIDI message: {message}. Error: {e}")
 
-        if port_index_in == -1 and port_index_out == -1:
+    def midi_watcher(self):
+        if self.midi_backend is None:
             self.thread_running = False
             self.midi_ready = True
-            sys.exit()
+            logging.error("python-rtmidi is not installed.")
+            self.observer.bridge_error(self, "python-rtmidi is not installed.")
+            return
+        midiin = self.midi_backend.MidiIn()
+        midiout = self.midi_backend.MidiOut()
 
-        if port_index_out != -1:
-            midiout.open_port(port_index_out)
-        if port_index_in != -1:
-            midiin.open_port(port_index_in)
+        if self.virtual_ports:
+            try:
+                midiout.open_virtual_port(self.virtual_port_name)
+                midiin.open_virtual_port(self.virtual_port_name)
+            except Exception as e:  # e.g. the Windows MIDI API has no virtual ports
+                self.thread_running = False
+                self.midi_ready = True
+                logging.error(f"Could not create virtual MIDI ports: {e}")
+                self.observer.bridge_error(self, "Could not create virtual MIDI ports.")
+                return
+            logging.info(f"Virtual MIDI ports: '{self.virtual_port_name}'")
+            logging.info("Hit ctrl-c to exit")
+            has_input = True
+        else:
+            # Retrieve available MIDI input ports
+            available_ports_in = midiin.get_ports()
+            available_ports_out = midiout.get_ports()
+
+            logging.info("IN : '" + "','".join(available_ports_in) + "'")
+            logging.info("OUT : '" + "','".join(available_ports_out) + "'")
+            logging.info("Hit ctrl-c to exit")
+
+            # search MIDI IN and OUT ports
+            port_index_in = find_port(available_ports_in, self.given_port_name_in)
+            port_index_out = find_port(available_ports_out, self.given_port_name_out)
+
+            if port_index_in == -1 and port_index_out == -1:
+                self.thread_running = False
+                self.midi_ready = True
+                logging.error("No matching MIDI port found.")
+                self.observer.bridge_error(self, "No matching MIDI port found.")
+                sys.exit()
+
+            if port_index_out != -1:
+                midiout.open_port(port_index_out)
+            if port_index_in != -1:
+                midiin.open_port(port_index_in)
+            has_input = port_index_in != -1
+
+        if has_input:
             self.midi_ready = True
             midiin.ignore_types(sysex=False, timing=False, active_sense=False)
             midiin.set_callback(self.midi_input_handler(self))
 
+        lanes = (self.midiout_realtime_queue, self.midiout_message_queue)
+        clock = self.clock_jitter["serial_to_midi"]
+        metrics = self.metrics
         try:
             while self.thread_running:
-                try:
-                    message = self.midiout_message_queue.get(timeout=0.4)
-                except queue.Empty:
+                if not self._wait_for_lanes(self._midiout_ready, lanes, 0.4):
                     continue
 
-                # Send the MIDI message to the output port
+                # Realtime lane first, then one bulk message per pass
+                while True:
+                    try:
+                        message = self.midiout_realtime_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._send_midi(midiout, message)
+                    if message[0] == 0xf8:
+                        clock.tick()
+                    metrics.midiout_realtime_probe.check()
                 try:
-                    midiout.send_message(message)
-                    self.gui.midi_out_led_blink_signal.emit("#2ecc71")  # Green for MIDI OUT
-                except Exception as e:
-                    logging.error(f"Failed to send MIDI message: {message}. Error: {e}")
+                    message = self.midiout_message_queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._send_midi(midiout, message)
+                metrics.midiout_probe.check()
         finally:
             # Remove callback and close ports safely
             midiin.cancel_callback()
@@ -177,13 +722,19 @@ class SerialMIDI:
 
     def start(self):
         try:
-            self.ser = serial.Serial(self.serial_port_name, self.serial_baud)
+            self.ser = self._open_serial(self.serial_port_name)
         except serial.serialutil.SerialException:
             print("Serial port opening error.")
             logging.error("Serial port opening error.")
-            return
+            self.observer.bridge_error(self, "Serial port opening error.")
+            return False
 
-        self.ser.timeout = 0.4
+        if self.reconnect_timeout > 0:
+            if self.port_manager is None:
+                self.port_manager = PortManager()
+            # Remember which USB device this is, in case it comes back under another name
+            self._serial_identity = self.port_manager.identity_of(self.serial_port_name)
+        self.trace.start()
 
         self.s_watcher = threading.Thread(target=self.serial_watcher)
         self.s_writer = threading.Thread(target=self.serial_writer)
@@ -194,12 +745,19 @@ class SerialMIDI:
         self.m_watcher.start()
 
         self.midi_ready = True
+        self.observer.bridge_started(self)
+        return True
 
     def stop(self):
         """Stop the Serial MIDI bridge and clean up resources."""
         self.thread_running = False
         self.midi_ready = False
         logging.info("Stopping threads...")
+        # Wake the consumers blocked on the queues so they exit right away
+        self.midiin_message_queue.close()
+        self.midiout_message_queue.close()
+        self.midiin_realtime_queue.close()
+        self.midiout_realtime_queue.close()
 
         # Wait for threads to finish using the instance variables
         if hasattr(self, 's_watcher') and self.s_watcher.is_alive():
@@ -214,75 +772,11 @@ class SerialMIDI:
             logging.debug("Joining midi watcher thread...")
             self.m_watcher.join()
             logging.debug("Midi watcher thread joined.")
+        self.trace.stop()
 
         # Close the serial port
         if hasattr(self, 'ser') and self.ser and self.ser.is_open:
             self.ser.close()
             logging.info("Serial port closed.")
         logging.info("Threads stopped.")
-
-        # Update GUI LED color to indicate stopped state
-        #self.gui.set_led_color("red")
-
-def describe_midi_message(message):
-    if not message or not isinstance(message, (list, tuple)):
-        return str(message)
-    if len(message) == 0:
-        return "Empty MIDI message"
-    status = message[0]
-    channel = (status & 0x0F) + 1  # Channel for musicians (1-16)
-    msg_type = status & 0xF0
-
-    if msg_type == 0x80 and len(message) > 2:
-        return f"Note Off:  NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
-    elif msg_type == 0x90 and len(message) > 2:
-        return f"Note On:   NOTE {message[1]:<3} VEL {message[2]:<3} CH {channel:<2}"
-    elif msg_type == 0xA0 and len(message) > 2:
-        return f"Polyphonic Aftertouch: NOTE {message[1]:<3} VAL {message[2]:<3} CH {channel:<2}"
-    elif msg_type == 0xB0 and len(message) > 2:
-        return f"Control Change: CC# {message[1]:<3} VALUE {message[2]:<3} CH {channel:<2}"
-    elif msg_type == 0xC0 and len(message) > 1:
-        return f"Program Change: PRG {message[1]:<3} CH {channel:<2}"
-    elif msg_type == 0xD0 and len(message) > 1:
-        return f"Channel Aftertouch: VAL {message[1]:<3} CH {channel:<2}"
-    elif msg_type == 0xE0 and len(message) > 2:
-        value = (message[2] << 7) | message[1]
-        return f"Pitchbend: VAL {value-8192:<5} CH {channel:<2}"
-    elif status == 0xF0:
-        # SysEx message
-        if message[-1] == 0xF7:
-            return f"SysEx: {len(message)} bytes"
-        else:
-            return f"SysEx (incomplete): {message}"
-    else:
-        return f"Unknown MIDI: {message}"
-
-class SerialMIDIApp(QtWidgets.QWidget):
-    def toggle_serial_midi(self):
-        if self.serial_midi is None:
-            # Start the Serial MIDI bridge
-            serial_port_name = self.port_dropdown.currentText()
-            baud_rate = int(self.baud_dropdown.currentText())
-            midi_in_name = self.midi_in_dropdown.currentText()
-            midi_out_name = self.midi_out_dropdown.currentText()
-
-            if midi_in_name == "Not Connected":
-                midi_in_name = None
-            if midi_out_name == "Not Connected":
-                midi_out_name = None
-
-            self.serial_midi = serialmidi.SerialMIDI(
-                gui=self,
-                serial_port_name=serial_port_name,
-                serial_baud=baud_rate,
-                midi_in_name=midi_in_name,
-                midi_out_name=midi_out_name,
-            )
-
-            threading.Thread(target=self.serial_midi.start).start()
-            self.toggle_button.setText("STOP")
-        else:
-            # Stop the Serial MIDI bridge
-            self.serial_midi.stop()
-            self.serial_midi = None
-            self.toggle_button.setText("START")
+        self.observer.bridge_stopped(self)
@@ -0,0 +1,88 @@
+"""Cold-launch benchmark for the GUI: time from starting the process to the first paint.
+
+Each run starts gui.py in a fresh interpreter, by default on Qt's offscreen
+platform so no display is needed. The window reports when it first paints
+and when the background port scan has filled the dropdowns, then quits:
+
+    python src/startupbench.py
+    python src/startupbench.py --runs 20 --json startup.json
+
+It also lists the bridge modules (pyserial, rtmidi, the bridge itself)
+that were already imported at first paint, which a fast start defers.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark import git_revision
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui.py")
+
+
+def launch(qt_platform, timeout):
+    """Start the GUI once and return its timings in milliseconds."""
+    env = dict(os.environ, SERIALMIDI_STARTUP_PROBE="1")
+    if qt_platform:
+        env["QT_QPA_PLATFORM"] = qt_platform
+    started = time.time()
+    completed = subprocess.run([sys.executable, GUI_PATH], env=env, capture_output=True, text=True,
+                               timeout=timeout)
+    exited = time.time()
+    reports = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if not reports:
+        raise RuntimeError(f"gui.py exited with {completed.returncode} without a startup report:\n"
+                           f"{completed.stderr}")
+    report = json.loads(reports[-1])
+    return {
+        "first_paint_ms": (report["first_paint"] - started) * 1000,
+        "ports_listed_ms": (report["ports_listed"] - started) * 1000,
+        "exit_ms": (exited - started) * 1000,
+        "imported_at_paint": report["imported_at_paint"],
+    }
+
+
+def summarize(runs, key):
+    values = [run[key] for run in runs]
+    return {"min": min(values), "median": statistics.median(values), "max": max(values)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GUI cold-launch time to first paint")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="launches to time (default: 5)")
+    parser.add_argument("--platform", default="offscreen",
+                        help="Qt platform plugin, empty for the desktop's own (default: offscreen)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for one launch")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    args = parser.parse_args(argv)
+
+    runs = [launch(args.platform, args.timeout) for _ in range(args.runs)]
+    summary = {key: summarize(runs, key) for key in ("first_paint_ms", "ports_listed_ms", "exit_ms")}
+    for key, label in (("first_paint_ms", "first paint"), ("ports_listed_ms", "ports listed"),
+                       ("exit_ms", "process exit")):
+        stats = summary[key]
+        print(f"{label:<13} min {stats['min']:7.1f} ms  median {stats['median']:7.1f} ms  max {stats['max']:7.1f} ms")
+    imported = sorted({name for run in runs for name in run["imported_at_paint"]})
+    if imported:
+        print(f"imported before first paint: {', '.join(imported)}")
+
+    if args.json:
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "options": vars(args),
+            "summary": summary,
+            "runs": runs,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from framing import FRAME_MAX_DATA, FrameDecoder, FrameEncoder, cobs_decode, cobs_encode, crc16
+
+SEEDS = range(20)
+PROBE = [0x90, 60, 100]
+
+
+def decode(data, chunk_size=None, **options):
+    """Feed data in chunks of chunk_size (all at once if None); return the decoder and the MIDI bytes per entry."""
+    decoder = FrameDecoder(**options)
+    size = chunk_size or max(len(data), 1)
+    entries = []
+    for position in range(0, len(data), size):
+        entries += [bytes(midi) for _, midi in decoder.feed(data[position:position + size])]
+    return decoder, entries
+
+
+def frame(messages, timestamp=1000):
+    return bytes(FrameEncoder().encode(messages, timestamp))
+
+
+def test_crc16_check_value():
+    assert crc16(b"123456789") == 0x29b1  # CRC-16/CCITT-FALSE
+
+
+@pytest.mark.parametrize("length", (0, 1, 253, 254, 255, 508, 509))
+@pytest.mark.parametrize("pattern", ("no_zeros", "zero_before", "zero_after", "zeros_only"))
+def test_cobs_round_trip(length, pattern):
+    block = bytes(i % 255 + 1 for i in range(length))
+    data = {
+        "no_zeros": block,
+        "zero_before": b"\0" + block,
+        "zero_after": block + b"\0",
+        "zeros_only": bytes(length),
+    }[pattern]
+    encoded = cobs_encode(data)
+    assert 0 not in encoded
+    assert cobs_decode(encoded) == data
+
+
+def test_cobs_decode_rejects_truncated_frame():
+    with pytest.raises(ValueError):
+        cobs_decode(cobs_encode(bytes(range(1, 100)))[:-10])
+
+
+@pytest.mark.parametrize("chunk_size", (None, 1, 7))
+def test_frames_round_trip(chunk_size):
+    messages = [[0x90, 60, 100], [0xf8], [0xf0] + [i & 0x7f for i in range(600)] + [0xf7], [0x80, 60, 0]]
+    decoder, entries = decode(frame(messages), chunk_size)
+    assert b"".join(entries) == b"".join(bytes(message) for message in messages)
+    assert all(len(entry) <= FRAME_MAX_DATA for entry in entries)
+    assert decoder.frames == len(entries) and decoder.errors == 0
+
+
+def test_timestamp_is_carried():
+    decoder = FrameDecoder()
+    assert [timestamp for timestamp, _ in decoder.feed(frame([PROBE], timestamp=123456))] == [123456]
+
+
+def test_flipped_bit_is_a_crc_error():
+    data = bytearray(frame([PROBE]))
+    data[data.index(60)] ^= 0x01  # A MIDI data byte, so the COBS structure is intact
+    decoder, entries = decode(bytes(data) + frame([PROBE]))
+    assert entries == [bytes(PROBE)]
+    assert decoder.crc_errors == 1 and decoder.bad_frames == 0
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_any_flipped_bit_drops_the_frame(seed):
+    rng = random.Random(seed)
+    good = frame([PROBE, [0xb0, 7, 64]])
+    for _ in range(50):
+        data = bytearray(good)
+        position = rng.randrange(len(data) - 1)  # Not the delimiter
+        data[position] ^= 1 << rng.randrange(8)
+        decoder, entries = decode(bytes(data) + good)
+        # The damaged frame is dropped and counted, the next one still gets through
+        assert entries[-1] == bytes(PROBE + [0xb0, 7, 64])
+        assert decoder.errors >= 1
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_resync_after_garbage(seed):
+    rng = random.Random(seed)
+    garbage = bytes(rng.randrange(1, 256) for _ in range(rng.randrange(1, 200)))
+    # The garbage runs into the first frame, which is lost; the next delimiter resynchronizes
+    decoder, entries = decode(garbage + frame([[0x80, 1, 2]]) + frame([PROBE]), rng.randrange(1, 32))
+    assert entries == [bytes(PROBE)]
+    assert decoder.errors == 1
+
+
+def test_garbage_before_a_delimiter_is_one_bad_frame():
+    decoder, entries = decode(b"\x07\x01\x02\0" + frame([PROBE]))
+    assert entries == [bytes(PROBE)]
+    assert decoder.errors == 1
+
+
+def test_idle_delimiters_are_ignored():
+    decoder, entries = decode(b"\0\0" + frame([PROBE]) + b"\0")
+    assert entries == [bytes(PROBE)] and decoder.errors == 0
+
+
+def test_max_frame_overflow():
+    decoder = FrameDecoder(max_frame=64)
+    for _ in range(10):
+        assert list(decoder.feed(bytes(range(1, 33)))) == []
+        assert len(decoder._buffer) <= 64
+    assert decoder.bad_frames >= 1
+    assert decoder.dropped_bytes >= 64
+    # Once a delimiter comes by, the frames that follow decode again
+    entries = [bytes(midi) for _, midi in decoder.feed(b"\0" + frame([PROBE]))]
+    assert entries == [bytes(PROBE)]
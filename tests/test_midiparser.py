@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from midiparser import MidiStreamParser, MidiStreamEncoder
+from midiprotocol import MESSAGE_CLASS, MESSAGE_LENGTH, UNDEFINED
+
+SEEDS = range(20)
+STREAMS_PER_SEED = 100
+PROBE = bytes([0x90, 60, 100])
+CHANNEL_STATUSES = (0x80, 0x90, 0xa0, 0xb0, 0xc0, 0xd0, 0xe0)
+
+
+def random_stream(rng, max_length=512):
+    """Valid traffic mixed with random bytes, so every parser state gets visited."""
+    stream = bytearray()
+    length = rng.randrange(1, max_length)
+    while len(stream) < length:
+        kind = rng.random()
+        if kind < 0.4:
+            stream += bytes(rng.randrange(256) for _ in range(rng.randrange(1, 8)))
+        elif kind < 0.8:
+            status = rng.choice(CHANNEL_STATUSES) | rng.randrange(16)
+            stream += bytes([status] + [rng.randrange(128) for _ in range(MESSAGE_LENGTH[status] - 1)])
+        elif kind < 0.9:
+            stream += bytes([0xf0] + [rng.randrange(128) for _ in range(rng.randrange(64))] + [0xf7])
+        else:
+            stream.append(rng.choice((0xf8, 0xfa, 0xfc, 0xfe)))
+    return bytes(stream)
+
+
+def parse(data, chunk_sizes=None, **options):
+    """Feed data in chunks of the sizes drawn from chunk_sizes (all at once if None); return the parser and messages."""
+    parser = MidiStreamParser(**options)
+    messages = []
+    position = 0
+    while position < len(data):
+        size = next(chunk_sizes) if chunk_sizes is not None else len(data)
+        messages += [bytes(message) for message in parser.feed(data[position:position + size])]
+        position += size
+    return parser, messages
+
+
+def random_sizes(rng):
+    while True:
+        yield rng.randrange(1, 64)
+
+
+def is_realtime(message):
+    return len(message) == 1 and message[0] >= 0xf8
+
+
+def streams(seed):
+    rng = random.Random(seed)
+    for _ in range(STREAMS_PER_SEED):
+        yield rng, random_stream(rng)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_messages_are_well_formed(seed):
+    for rng, stream in streams(seed):
+        _, messages = parse(stream + PROBE, random_sizes(rng), max_buffer_size=128)
+        for message in messages:
+            status = message[0]
+            assert status & 0x80 and MESSAGE_CLASS[status] != UNDEFINED, message.hex()
+            assert all(byte < 0x80 for byte in message[1:-1]), message.hex()
+            if status == 0xf0:
+                assert message[-1] == 0xf7, message.hex()
+            else:
+                assert len(message) == MESSAGE_LENGTH[status], message.hex()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_buffer_stays_bounded(seed):
+    for rng, stream in streams(seed):
+        parser = MidiStreamParser(max_buffer_size=128)
+        # Without its end byte, a SysEx must not pile up past max_buffer_size
+        for _ in parser.feed(bytes([0xf0]) + stream.replace(b"\xf7", b"") * 4):
+            pass
+        assert len(parser._buffer) <= 2 * max(parser.max_buffer_size, 256)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("sysex_chunk_size", (0, 16))
+def test_chunking_does_not_change_result(seed, sysex_chunk_size):
+    for rng, stream in streams(seed):
+        options = dict(sysex_chunk_size=sysex_chunk_size, max_buffer_size=128)
+        _, whole = parse(stream, **options)
+        _, chunked = parse(stream, random_sizes(rng), **options)
+        assert whole == chunked, stream.hex()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_resync_after_garbage(seed):
+    for rng, stream in streams(seed):
+        _, messages = parse(stream + PROBE, random_sizes(rng), max_buffer_size=128)
+        non_realtime = [message for message in messages if not is_realtime(message)]
+        assert non_realtime and non_realtime[-1] == PROBE, stream.hex()
+
+
+def test_running_status_and_realtime_inside_a_message():
+    _, messages = parse(bytes([0x90, 60, 0xf8, 100, 61, 101]))
+    assert messages == [bytes([0xf8]), bytes([0x90, 60, 100]), bytes([0x90, 61, 101])]
+
+
+def test_sysex_streamed_in_fragments():
+    dump = bytes([0xf0] + [i & 0x7f for i in range(40)] + [0xf7])
+    _, messages = parse(dump, sysex_chunk_size=16)
+    assert [len(message) for message in messages] == [16, 16, 10]
+    assert b"".join(messages) == dump
+
+
+def test_sysex_over_max_size_is_dropped():
+    parser, messages = parse(bytes([0xf0] + [1] * 20 + [0xf7]) + PROBE, sysex_max_size=10)
+    assert messages == [PROBE]
+    assert parser.sysex_dropped == 1
+
+
+def test_encoder_running_status_round_trip():
+    batch = [[0x90, 60, 100], [0x90, 62, 100], [0xf8], [0x80, 60, 0], [0x80, 62, 0]]
+    data = MidiStreamEncoder(running_status=True).encode(batch)
+    assert len(data) < sum(len(message) for message in batch)
+    _, messages = parse(bytes(data))
+    assert messages == [bytes(message) for message in batch]